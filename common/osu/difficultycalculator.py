@@ -1,42 +1,57 @@
+import functools
+import hashlib
+import itertools
+import json
+import logging
+import threading
+import time
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from contextlib import AbstractContextManager
 from typing import Iterable, NamedTuple, Type
 
 import httpx
 from django.conf import settings
+from django.core.cache import cache
 from django.utils.module_loading import import_string
-
-from common.osu.enums import Gamemode
-
-# TODO: lazy load this instead of doing at import
-difficalcy_osu_info = httpx.get(
-    f"{settings.DIFFICALCY_URL}/api/calculators/osu/info"
-).json()
-difficalcy_taiko_info = httpx.get(
-    f"{settings.DIFFICALCY_URL}/api/calculators/taiko/info"
-).json()
-difficalcy_catch_info = httpx.get(
-    f"{settings.DIFFICALCY_URL}/api/calculators/catch/info"
-).json()
-difficalcy_mania_info = httpx.get(
-    f"{settings.DIFFICALCY_URL}/api/calculators/mania/info"
-).json()
-difficalcy_performanceplus_info = httpx.get(
-    f"{settings.DIFFICALCY_PERFORMANCEPLUS_URL}/api/calculators/osu/info"
-).json()
-
-DIFFICALCY_OSU_ENGINE = difficalcy_osu_info["calculatorPackage"]
-DIFFICALCY_OSU_VERSION = difficalcy_osu_info["calculatorVersion"]
-DIFFICALCY_TAIKO_ENGINE = difficalcy_taiko_info["calculatorPackage"]
-DIFFICALCY_TAIKO_VERSION = difficalcy_taiko_info["calculatorVersion"]
-DIFFICALCY_CATCH_ENGINE = difficalcy_catch_info["calculatorPackage"]
-DIFFICALCY_CATCH_VERSION = difficalcy_catch_info["calculatorVersion"]
-DIFFICALCY_MANIA_ENGINE = difficalcy_mania_info["calculatorPackage"]
-DIFFICALCY_MANIA_VERSION = difficalcy_mania_info["calculatorVersion"]
-DIFFICALCY_PERFORMANCEPLUS_ENGINE = difficalcy_performanceplus_info["calculatorPackage"]
-DIFFICALCY_PERFORMANCEPLUS_VERSION = difficalcy_performanceplus_info[
-    "calculatorVersion"
-]
+from prometheus_client import Counter
+
+from common.osu.beatmap_provider import BeatmapNotFoundException, StubBeatmapProvider
+from common.osu.enums import Gamemode, Mods
+
+logger = logging.getLogger(__name__)
+
+# difficalcy calculator info (engine and version) is fetched on first use and shared between processes through the cache
+#   the refresh_difficulty_calculators_info task keeps it warm so workers don't wait on difficalcy
+DIFFICALCY_INFO_CACHE_KEY_PREFIX = "difficalcy_info"
+DIFFICALCY_INFO_CACHE_TIMEOUT = 60 * 60
+# how long a process reuses its own copy of the info before checking the cache again
+DIFFICALCY_INFO_LOCAL_TIMEOUT = 60
+
+# calculation results are keyed by their inputs (including calculator version) so they never go stale by version,
+#   and by a generation per beatmap which is bumped when the beatmap is updated in place
+CALCULATION_CACHE_KEY_PREFIX = "difficalcy_calculation"
+CALCULATION_CACHE_TIMEOUT = 60 * 60 * 24
+CALCULATION_CACHE_BEATMAP_GENERATION_KEY_PREFIX = "difficalcy_calculation_generation"
+CALCULATION_CACHE_LOCAL_MAX_SIZE = 10000
+
+# calculation batches are split into chunks sized to take around the target time per request
+CALCULATION_CHUNK_SIZE_INITIAL = 100
+CALCULATION_CHUNK_SIZE_MIN = 10
+CALCULATION_CHUNK_SIZE_MAX = 2000
+CALCULATION_CHUNK_TARGET_SECONDS = 5
+
+calculation_cache_hits_counter = Counter(
+    "difficalcy_calculation_cache_hits_total",
+    "Total number of difficalcy calculations served from the calculation cache",
+    ["engine", "layer"],
+)
+calculation_cache_misses_counter = Counter(
+    "difficalcy_calculation_cache_misses_total",
+    "Total number of difficalcy calculations missing from the calculation cache",
+    ["engine"],
+)
 
 
 class Score(NamedTuple):
@@ -51,6 +66,122 @@ class Calculation(NamedTuple):
     performance_values: dict[str, float]
 
 
+def get_calculation_key(engine: str, version: str, score: Score) -> str:
+    """
+    Returns a hash identifying a calculation by its calculator and inputs
+    """
+    data = json.dumps(
+        [
+            engine,
+            version,
+            score.beatmap_id,
+            score.mods,
+            score.statistics,
+            score.combo,
+        ],
+        sort_keys=True,
+    )
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class CalculationCache:
+    """
+    Cache of calculation results with an in-process LRU in front of the shared cache
+    """
+
+    def __init__(self, local_max_size: int = CALCULATION_CACHE_LOCAL_MAX_SIZE):
+        self.local_max_size = local_max_size
+        self.local: OrderedDict[str, Calculation] = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_key(
+        engine: str, version: str, score: Score, beatmap_generation: int = 0
+    ) -> str:
+        return f"{CALCULATION_CACHE_KEY_PREFIX}:{get_calculation_key(engine, version, score)}:{beatmap_generation}"
+
+    @staticmethod
+    def get_beatmap_generation_key(beatmap_id: str) -> str:
+        return f"{CALCULATION_CACHE_BEATMAP_GENERATION_KEY_PREFIX}:{beatmap_id}"
+
+    def get_keys(self, engine: str, version: str, scores: list[Score]) -> list[str]:
+        """
+        Returns the keys of the passed scores, looking up the current generations of their beatmaps in one go
+        """
+        generation_keys = {
+            score.beatmap_id: self.get_beatmap_generation_key(score.beatmap_id)
+            for score in scores
+        }
+        generations = cache.get_many(generation_keys.values())
+        return [
+            self.get_key(
+                engine,
+                version,
+                score,
+                generations.get(generation_keys[score.beatmap_id], 0),
+            )
+            for score in scores
+        ]
+
+    def invalidate_beatmaps(self, beatmap_ids: Iterable[str]):
+        """
+        Invalidates cached calculations of the passed beatmaps, eg. after they have been updated in place
+        """
+        for beatmap_id in beatmap_ids:
+            generation_key = self.get_beatmap_generation_key(beatmap_id)
+            # generations never expire, so old generations can't come back into use
+            cache.add(generation_key, 0, timeout=None)
+            cache.incr(generation_key)
+
+    def _set_local(self, key: str, calculation: Calculation):
+        self.local[key] = calculation
+        self.local.move_to_end(key)
+        if len(self.local) > self.local_max_size:
+            self.local.popitem(last=False)
+
+    def get_many(self, engine: str, keys: list[str]) -> dict[str, Calculation]:
+        calculations = {}
+        with self.lock:
+            for key in keys:
+                calculation = self.local.get(key)
+                if calculation is not None:
+                    self.local.move_to_end(key)
+                    calculations[key] = calculation
+
+        local_hits = len(calculations)
+        missing_keys = [key for key in set(keys) if key not in calculations]
+        if len(missing_keys) > 0:
+            cached_calculations = cache.get_many(missing_keys)
+            with self.lock:
+                for key, calculation in cached_calculations.items():
+                    self._set_local(key, calculation)
+            calculations.update(cached_calculations)
+
+        calculation_cache_hits_counter.labels(engine=engine, layer="local").inc(
+            local_hits
+        )
+        calculation_cache_hits_counter.labels(engine=engine, layer="shared").inc(
+            len(calculations) - local_hits
+        )
+        calculation_cache_misses_counter.labels(engine=engine).inc(
+            len(set(keys)) - len(calculations)
+        )
+
+        return calculations
+
+    def set_many(self, calculations: dict[str, Calculation]):
+        if len(calculations) == 0:
+            return
+
+        with self.lock:
+            for key, calculation in calculations.items():
+                self._set_local(key, calculation)
+        cache.set_many(calculations, timeout=CALCULATION_CACHE_TIMEOUT)
+
+
+calculation_cache = CalculationCache()
+
+
 class BeatmapDetails(NamedTuple):
     hitobject_counts: dict[str, int]
     difficulty_settings: dict[str, float]
@@ -77,6 +208,19 @@ class CalculationException(DifficultyCalculatorException):
     pass
 
 
+class InvalidCalculationException(CalculationException):
+    """
+    A calculation failed due to its inputs (eg. an unknown beatmap), so will fail again if retried
+    """
+
+    pass
+
+
+class CalculatorInfo(NamedTuple):
+    engine: str
+    version: str
+
+
 class AbstractDifficultyCalculator(AbstractContextManager, ABC):
     def __init__(self):
         self.closed = False
@@ -103,6 +247,34 @@ class AbstractDifficultyCalculator(AbstractContextManager, ABC):
     def get_beatmap_details(self, beatmap_id: str) -> BeatmapDetails:
         raise NotImplementedError()
 
+    def _get_beatmap_details_or_none(self, beatmap_id: str) -> BeatmapDetails | None:
+        try:
+            return self.get_beatmap_details(beatmap_id)
+        except CalculationException as e:
+            logger.warning(str(e))
+            return None
+
+    def get_beatmaps_details(
+        self, beatmap_ids: Iterable[str]
+    ) -> dict[str, BeatmapDetails]:
+        """
+        Returns the details of the passed beatmaps by id, leaving out any that couldn't be fetched
+        """
+        beatmap_ids = list(beatmap_ids)
+        return self._collect_beatmaps_details(
+            beatmap_ids, map(self._get_beatmap_details_or_none, beatmap_ids)
+        )
+
+    @staticmethod
+    def _collect_beatmaps_details(
+        beatmap_ids: list[str], beatmaps_details: Iterable[BeatmapDetails | None]
+    ) -> dict[str, BeatmapDetails]:
+        return {
+            beatmap_id: beatmap_details
+            for beatmap_id, beatmap_details in zip(beatmap_ids, beatmaps_details)
+            if beatmap_details is not None
+        }
+
     @staticmethod
     @abstractmethod
     def engine() -> str:
@@ -118,8 +290,23 @@ class AbstractDifficultyCalculator(AbstractContextManager, ABC):
     def gamemode() -> Gamemode:
         raise NotImplementedError()
 
+    @classmethod
+    def refresh_info(cls) -> CalculatorInfo:
+        """
+        Refreshes any cached calculator info and returns the current info
+        """
+        return CalculatorInfo(engine=cls.engine(), version=cls.version())
+
 
 class AbstractDifficalcyDifficultyCalculator(AbstractDifficultyCalculator):
+    # number of beatmap details requests to have in flight at once
+    BEATMAP_DETAILS_CONCURRENCY = 8
+
+    # per process copies of calculator info, keyed by calculator url
+    _local_info: dict[str, tuple[CalculatorInfo, float]] = {}
+    # per process tuned calculation chunk sizes, keyed by calculator url
+    _chunk_sizes: dict[str, int] = {}
+
     def __init__(self):
         super().__init__()
 
@@ -128,10 +315,68 @@ class AbstractDifficalcyDifficultyCalculator(AbstractDifficultyCalculator):
     def _close(self):
         self.client.close()
 
+    @classmethod
     @abstractmethod
-    def _get_url(self) -> str:
+    def _get_url(cls) -> str:
         raise NotImplementedError()
 
+    @classmethod
+    def _fetch_info(cls) -> CalculatorInfo:
+        try:
+            response = httpx.get(f"{cls._get_url()}/info")
+            response.raise_for_status()
+            data = response.json()
+        except httpx.HTTPError as e:
+            raise DifficultyCalculatorException(
+                f"An error occured in getting the calculator info from {cls._get_url()}: {e}"
+            ) from e
+
+        return CalculatorInfo(
+            engine=data["calculatorPackage"], version=data["calculatorVersion"]
+        )
+
+    @classmethod
+    def _get_info_cache_key(cls) -> str:
+        return f"{DIFFICALCY_INFO_CACHE_KEY_PREFIX}:{cls._get_url()}"
+
+    @classmethod
+    def _set_local_info(cls, info: CalculatorInfo):
+        cls._local_info[cls._get_url()] = (
+            info,
+            time.monotonic() + DIFFICALCY_INFO_LOCAL_TIMEOUT,
+        )
+
+    @classmethod
+    def _get_info(cls) -> CalculatorInfo:
+        local_info = cls._local_info.get(cls._get_url())
+        if local_info is not None and local_info[1] > time.monotonic():
+            return local_info[0]
+
+        info = cache.get(cls._get_info_cache_key())
+        if info is None:
+            info = cls.refresh_info()
+        else:
+            cls._set_local_info(info)
+
+        return info
+
+    @classmethod
+    def refresh_info(cls) -> CalculatorInfo:
+        info = cls._fetch_info()
+        cache.set(
+            cls._get_info_cache_key(), info, timeout=DIFFICALCY_INFO_CACHE_TIMEOUT
+        )
+        cls._set_local_info(info)
+        return info
+
+    @classmethod
+    def engine(cls) -> str:
+        return cls._get_info().engine
+
+    @classmethod
+    def version(cls) -> str:
+        return cls._get_info().version
+
     @abstractmethod
     def _difficalcy_score_from_score(self, score: Score) -> dict:
         raise NotImplementedError()
@@ -147,6 +392,113 @@ class AbstractDifficalcyDifficultyCalculator(AbstractDifficultyCalculator):
         ]
 
     def calculate_scores(self, scores: Iterable[Score]) -> list[Calculation]:
+        scores = list(scores)
+        engine = self.engine()
+        version = self.version()
+
+        cache_keys = calculation_cache.get_keys(engine, version, scores)
+        calculations = calculation_cache.get_many(engine, cache_keys)
+
+        # only send each distinct missing input once
+        missing_scores = {
+            cache_key: score
+            for cache_key, score in zip(cache_keys, scores)
+            if cache_key not in calculations
+        }
+        if len(missing_scores) > 0:
+            calculations.update(
+                zip(
+                    missing_scores.keys(),
+                    self._calculate_scores(
+                        list(missing_scores.values()), list(missing_scores.keys())
+                    ),
+                )
+            )
+
+        return [calculations[cache_key] for cache_key in cache_keys]
+
+    def _calculate_scores(
+        self, scores: list[Score], cache_keys: list[str]
+    ) -> list[Calculation]:
+        """
+        Calculates scores in chunks, keeping multiple requests in flight and tuning the chunk size from observed latency.
+        Each chunk is cached under the passed keys as it completes, so completed chunks aren't lost if another fails.
+        """
+        results_by_offset: dict[int, list[Calculation]] = {}
+
+        with ThreadPoolExecutor(
+            max_workers=settings.DIFFICALCY_MAX_CONCURRENT_REQUESTS
+        ) as executor:
+            pending_chunks = {}
+            offset = 0
+            try:
+                while offset < len(scores) or len(pending_chunks) > 0:
+                    while (
+                        offset < len(scores)
+                        and len(pending_chunks)
+                        < settings.DIFFICALCY_MAX_CONCURRENT_REQUESTS
+                    ):
+                        chunk = scores[offset : offset + self._get_chunk_size()]
+                        future = executor.submit(self._calculate_chunk, chunk)
+                        pending_chunks[future] = offset
+                        offset += len(chunk)
+
+                    done, _ = wait(pending_chunks, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        chunk_offset = pending_chunks.pop(future)
+                        chunk_results, elapsed_seconds = future.result()
+                        results_by_offset[chunk_offset] = chunk_results
+                        self._cache_chunk(cache_keys, chunk_offset, chunk_results)
+                        self._tune_chunk_size(len(chunk_results), elapsed_seconds)
+            except DifficultyCalculatorException:
+                # don't start any more chunks, but keep the results of those already in flight
+                for future in pending_chunks:
+                    future.cancel()
+                for future, chunk_offset in pending_chunks.items():
+                    if not future.cancelled() and future.exception() is None:
+                        self._cache_chunk(cache_keys, chunk_offset, future.result()[0])
+                raise
+
+        return list(
+            itertools.chain.from_iterable(
+                results_by_offset[offset] for offset in sorted(results_by_offset)
+            )
+        )
+
+    @staticmethod
+    def _cache_chunk(
+        cache_keys: list[str], chunk_offset: int, chunk_results: list[Calculation]
+    ):
+        calculation_cache.set_many(
+            dict(
+                zip(
+                    cache_keys[chunk_offset : chunk_offset + len(chunk_results)],
+                    chunk_results,
+                )
+            )
+        )
+
+    @classmethod
+    def _get_chunk_size(cls) -> int:
+        return cls._chunk_sizes.get(cls._get_url(), CALCULATION_CHUNK_SIZE_INITIAL)
+
+    @classmethod
+    def _tune_chunk_size(cls, calculated_count: int, elapsed_seconds: float):
+        chunk_size = cls._get_chunk_size()
+
+        # only grow from full chunks, since partial chunks say nothing about larger ones
+        if (
+            elapsed_seconds < CALCULATION_CHUNK_TARGET_SECONDS / 2
+            and calculated_count >= chunk_size
+        ):
+            chunk_size = min(chunk_size * 2, CALCULATION_CHUNK_SIZE_MAX)
+        elif elapsed_seconds > CALCULATION_CHUNK_TARGET_SECONDS:
+            chunk_size = max(chunk_size // 2, CALCULATION_CHUNK_SIZE_MIN)
+
+        cls._chunk_sizes[cls._get_url()] = chunk_size
+
+    def _calculate_chunk(self, scores: list[Score]) -> tuple[list[Calculation], float]:
+        start_time = time.monotonic()
         try:
             response = self.client.post(
                 f"{self._get_url()}/batch/calculation",
@@ -155,7 +507,13 @@ class AbstractDifficalcyDifficultyCalculator(AbstractDifficultyCalculator):
             response.raise_for_status()
             data = response.json()
         except httpx.HTTPStatusError as e:
-            raise CalculationException(
+            # Client errors are caused by the scores, server errors may be transient
+            exception_class = (
+                InvalidCalculationException
+                if e.response.is_client_error
+                else CalculationException
+            )
+            raise exception_class(
                 f"An error occured in calculating the beatmaps {set(score.beatmap_id for score in scores)}: [{e.response.status_code}] {e.response.text}"
             ) from e
         except httpx.HTTPError as e:
@@ -163,7 +521,7 @@ class AbstractDifficalcyDifficultyCalculator(AbstractDifficultyCalculator):
                 f"An error occured in calculating the beatmaps {set(score.beatmap_id for score in scores)}: {e}"
             ) from e
 
-        return [
+        calculations = [
             Calculation(
                 difficulty_values=calculation_data["difficulty"],
                 performance_values=calculation_data["performance"],
@@ -171,6 +529,8 @@ class AbstractDifficalcyDifficultyCalculator(AbstractDifficultyCalculator):
             for calculation_data in data
         ]
 
+        return calculations, time.monotonic() - start_time
+
     def get_beatmap_details(self, beatmap_id: str) -> BeatmapDetails:
         try:
             response = self.client.get(
@@ -190,9 +550,24 @@ class AbstractDifficalcyDifficultyCalculator(AbstractDifficultyCalculator):
 
         return self._beatmapdetails_from_data(data)
 
+    def get_beatmaps_details(
+        self, beatmap_ids: Iterable[str]
+    ) -> dict[str, BeatmapDetails]:
+        # difficalcy has no batch beatmap details endpoint, so make the requests concurrently
+        #   (httpx clients are thread safe, so these share the client's connection pool)
+        beatmap_ids = list(beatmap_ids)
+        with ThreadPoolExecutor(
+            max_workers=self.BEATMAP_DETAILS_CONCURRENCY
+        ) as executor:
+            return self._collect_beatmaps_details(
+                beatmap_ids,
+                executor.map(self._get_beatmap_details_or_none, beatmap_ids),
+            )
+
 
 class DifficalcyOsuDifficultyCalculator(AbstractDifficalcyDifficultyCalculator):
-    def _get_url(self) -> str:
+    @classmethod
+    def _get_url(cls) -> str:
         return f"{settings.DIFFICALCY_URL}/api/calculators/osu"
 
     def _difficalcy_score_from_score(self, score: Score) -> dict:
@@ -238,21 +613,14 @@ class DifficalcyOsuDifficultyCalculator(AbstractDifficalcyDifficultyCalculator):
             tick_rate=data["tickRate"],
         )
 
-    @staticmethod
-    def engine() -> str:
-        return DIFFICALCY_OSU_ENGINE
-
-    @staticmethod
-    def version() -> str:
-        return DIFFICALCY_OSU_VERSION
-
     @staticmethod
     def gamemode():
         return Gamemode.STANDARD
 
 
 class DifficalcyTaikoDifficultyCalculator(AbstractDifficalcyDifficultyCalculator):
-    def _get_url(self) -> str:
+    @classmethod
+    def _get_url(cls) -> str:
         return f"{settings.DIFFICALCY_URL}/api/calculators/taiko"
 
     def _difficalcy_score_from_score(self, score: Score) -> dict:
@@ -292,21 +660,14 @@ class DifficalcyTaikoDifficultyCalculator(AbstractDifficalcyDifficultyCalculator
             tick_rate=data["tickRate"],
         )
 
-    @staticmethod
-    def engine() -> str:
-        return DIFFICALCY_TAIKO_ENGINE
-
-    @staticmethod
-    def version() -> str:
-        return DIFFICALCY_TAIKO_VERSION
-
     @staticmethod
     def gamemode():
         return Gamemode.TAIKO
 
 
 class DifficalcyCatchDifficultyCalculator(AbstractDifficalcyDifficultyCalculator):
-    def _get_url(self) -> str:
+    @classmethod
+    def _get_url(cls) -> str:
         return f"{settings.DIFFICALCY_URL}/api/calculators/catch"
 
     def _difficalcy_score_from_score(self, score: Score) -> dict:
@@ -348,21 +709,14 @@ class DifficalcyCatchDifficultyCalculator(AbstractDifficalcyDifficultyCalculator
             tick_rate=data["tickRate"],
         )
 
-    @staticmethod
-    def engine() -> str:
-        return DIFFICALCY_CATCH_ENGINE
-
-    @staticmethod
-    def version() -> str:
-        return DIFFICALCY_CATCH_VERSION
-
     @staticmethod
     def gamemode():
         return Gamemode.CATCH
 
 
 class DifficalcyManiaDifficultyCalculator(AbstractDifficalcyDifficultyCalculator):
-    def _get_url(self) -> str:
+    @classmethod
+    def _get_url(cls) -> str:
         return f"{settings.DIFFICALCY_URL}/api/calculators/mania"
 
     def _difficalcy_score_from_score(self, score: Score) -> dict:
@@ -405,14 +759,6 @@ class DifficalcyManiaDifficultyCalculator(AbstractDifficalcyDifficultyCalculator
             tick_rate=data["tickRate"],
         )
 
-    @staticmethod
-    def engine() -> str:
-        return DIFFICALCY_MANIA_ENGINE
-
-    @staticmethod
-    def version() -> str:
-        return DIFFICALCY_MANIA_VERSION
-
     @staticmethod
     def gamemode():
         return Gamemode.MANIA
@@ -421,7 +767,8 @@ class DifficalcyManiaDifficultyCalculator(AbstractDifficalcyDifficultyCalculator
 class DifficalcyPerformancePlusDifficultyCalculator(
     AbstractDifficalcyDifficultyCalculator
 ):
-    def _get_url(self) -> str:
+    @classmethod
+    def _get_url(cls) -> str:
         return f"{settings.DIFFICALCY_PERFORMANCEPLUS_URL}/api/calculators/osu"
 
     def _difficalcy_score_from_score(self, score: Score) -> dict:
@@ -466,18 +813,234 @@ class DifficalcyPerformancePlusDifficultyCalculator(
         )
 
     @staticmethod
-    def engine() -> str:
-        return DIFFICALCY_PERFORMANCEPLUS_ENGINE
+    def gamemode():
+        return Gamemode.STANDARD
+
+
+class StubBeatmap(NamedTuple):
+    sections: dict[str, dict[str, str]]
+    timing_points: list[tuple[float, float]]  # (time, beat length)
+    hitobjects: list[tuple[float, int]]  # (time, type flags)
+
+
+@functools.lru_cache(maxsize=None)
+def read_stub_beatmap(beatmap_id: str) -> StubBeatmap:
+    """
+    Parses the key-value sections, timing points and hitobjects of a stub .osu file
+    """
+    try:
+        beatmap_path = StubBeatmapProvider().get_beatmap_file(beatmap_id)
+    except BeatmapNotFoundException as e:
+        raise InvalidCalculationException(
+            f"An error occured in reading the stub beatmap {beatmap_id}: {e}"
+        ) from e
+
+    sections: dict[str, dict[str, str]] = {}
+    timing_points = []
+    hitobjects = []
+    section = None
+    with open(beatmap_path, encoding="utf-8-sig") as beatmap_file:
+        for line in beatmap_file:
+            line = line.strip()
+            if line == "" or line.startswith("//"):
+                continue
+            if line.startswith("[") and line.endswith("]"):
+                section = line[1:-1]
+                sections.setdefault(section, {})
+            elif section == "TimingPoints":
+                parts = line.split(",")
+                timing_points.append((float(parts[0]), float(parts[1])))
+            elif section == "HitObjects":
+                parts = line.split(",")
+                hitobjects.append((float(parts[2]), int(parts[3])))
+            elif section is not None and ":" in line:
+                key, value = line.split(":", 1)
+                sections[section][key.strip()] = value.strip()
+
+    return StubBeatmap(
+        sections=sections, timing_points=timing_points, hitobjects=hitobjects
+    )
+
+
+class AbstractStubDifficultyCalculator(AbstractDifficultyCalculator):
+    """
+    In-process calculator producing deterministic (but not meaningful) values from the stub beatmap files.
+    Useful for benchmarking and testing without difficalcy.
+    """
+
+    def _close(self):
+        pass
+
+    @staticmethod
+    @abstractmethod
+    def _hitobject_counts(beatmap: StubBeatmap) -> dict[str, int]:
+        raise NotImplementedError()
+
+    @staticmethod
+    def _get_length(beatmap: StubBeatmap) -> float:
+        if len(beatmap.hitobjects) == 0:
+            return 0
+        return (beatmap.hitobjects[-1][0] - beatmap.hitobjects[0][0]) / 1000
+
+    @staticmethod
+    def _get_clock_rate(mods: dict[str, dict]) -> float:
+        if Mods.DOUBLETIME in mods or Mods.NIGHTCORE in mods:
+            return 1.5
+        if Mods.HALFTIME in mods or Mods.DAYCORE in mods:
+            return 0.75
+        return 1
+
+    def _calculate_difficulty(self, beatmap: StubBeatmap, mods: dict[str, dict]):
+        difficulty_section = beatmap.sections.get("Difficulty", {})
+        overall_difficulty = float(difficulty_section.get("OverallDifficulty", 5))
+        approach_rate = float(
+            difficulty_section.get("ApproachRate", overall_difficulty)
+        )
+
+        density = len(beatmap.hitobjects) / max(self._get_length(beatmap), 1)
+        total = (
+            (density * self._get_clock_rate(mods)) ** 0.5
+            * (1 + (overall_difficulty + approach_rate) / 20)
+            * (1.1 if Mods.HARDROCK in mods else 1)
+            * (0.5 if Mods.EASY in mods else 1)
+        )
+
+        return total
+
+    def calculate_scores(self, scores: Iterable[Score]) -> list[Calculation]:
+        if settings.STUB_DIFFICULTY_CALCULATOR_LATENCY > 0:
+            time.sleep(settings.STUB_DIFFICULTY_CALCULATOR_LATENCY)
+
+        calculations = []
+        for score in scores:
+            beatmap = read_stub_beatmap(score.beatmap_id)
+            difficulty_total = self._calculate_difficulty(beatmap, score.mods)
+
+            object_count = max(len(beatmap.hitobjects), 1)
+            hit_fraction = 1 - score.statistics.get("miss", 0) / object_count
+            if score.combo is not None:
+                combo_fraction = min(score.combo / object_count, 1)
+            else:
+                combo_fraction = 1
+
+            calculations.append(
+                Calculation(
+                    difficulty_values={"total": difficulty_total},
+                    performance_values={
+                        "total": difficulty_total**3
+                        * 5
+                        * max(hit_fraction, 0) ** 2
+                        * (0.5 + combo_fraction / 2)
+                    },
+                )
+            )
+
+        return calculations
+
+    def get_beatmap_details(self, beatmap_id: str) -> BeatmapDetails:
+        if settings.STUB_DIFFICULTY_CALCULATOR_LATENCY > 0:
+            time.sleep(settings.STUB_DIFFICULTY_CALCULATOR_LATENCY)
+
+        beatmap = read_stub_beatmap(beatmap_id)
+        metadata_section = beatmap.sections.get("Metadata", {})
+        difficulty_section = beatmap.sections.get("Difficulty", {})
+
+        bpms = [
+            round(60000 / beat_length)
+            for _, beat_length in beatmap.timing_points
+            if beat_length > 0
+        ] or [0]
+
+        return BeatmapDetails(
+            hitobject_counts=self._hitobject_counts(beatmap),
+            difficulty_settings={
+                name: float(difficulty_section[key])
+                for name, key in {
+                    "circle_size": "CircleSize",
+                    "approach_rate": "ApproachRate",
+                    "accuracy": "OverallDifficulty",
+                    "drain_rate": "HPDrainRate",
+                }.items()
+                if key in difficulty_section
+            },
+            artist=metadata_section.get("Artist", ""),
+            title=metadata_section.get("Title", ""),
+            difficulty_name=metadata_section.get("Version", ""),
+            author=metadata_section.get("Creator", ""),
+            max_combo=len(beatmap.hitobjects),
+            length=self._get_length(beatmap),
+            mininum_bpm=min(bpms),
+            maximum_bpm=max(bpms),
+            common_bpm=max(set(bpms), key=bpms.count),
+            base_velocity=float(difficulty_section.get("SliderMultiplier", 1)),
+            tick_rate=float(difficulty_section.get("SliderTickRate", 1)),
+        )
+
+    @classmethod
+    def engine(cls) -> str:
+        return f"osuchan.Stub.{Gamemode(cls.gamemode()).name.capitalize()}"
 
     @staticmethod
     def version() -> str:
-        return DIFFICALCY_PERFORMANCEPLUS_VERSION
+        return settings.STUB_DIFFICULTY_CALCULATOR_VERSION
+
+
+class StubOsuDifficultyCalculator(AbstractStubDifficultyCalculator):
+    @staticmethod
+    def _hitobject_counts(beatmap: StubBeatmap) -> dict[str, int]:
+        return {
+            "circles": sum(1 for _, flags in beatmap.hitobjects if flags & 1),
+            "sliders": sum(1 for _, flags in beatmap.hitobjects if flags & 2),
+            "spinners": sum(1 for _, flags in beatmap.hitobjects if flags & 8),
+            "slider_ticks": 0,
+        }
 
     @staticmethod
     def gamemode():
         return Gamemode.STANDARD
 
 
+class StubTaikoDifficultyCalculator(AbstractStubDifficultyCalculator):
+    @staticmethod
+    def _hitobject_counts(beatmap: StubBeatmap) -> dict[str, int]:
+        return {
+            "hits": sum(1 for _, flags in beatmap.hitobjects if flags & 1),
+            "drum_rolls": sum(1 for _, flags in beatmap.hitobjects if flags & 2),
+            "swells": sum(1 for _, flags in beatmap.hitobjects if flags & 8),
+        }
+
+    @staticmethod
+    def gamemode():
+        return Gamemode.TAIKO
+
+
+class StubCatchDifficultyCalculator(AbstractStubDifficultyCalculator):
+    @staticmethod
+    def _hitobject_counts(beatmap: StubBeatmap) -> dict[str, int]:
+        return {
+            "fruits": sum(1 for _, flags in beatmap.hitobjects if flags & 1),
+            "juice_streams": sum(1 for _, flags in beatmap.hitobjects if flags & 2),
+            "banana_showers": sum(1 for _, flags in beatmap.hitobjects if flags & 8),
+        }
+
+    @staticmethod
+    def gamemode():
+        return Gamemode.CATCH
+
+
+class StubManiaDifficultyCalculator(AbstractStubDifficultyCalculator):
+    @staticmethod
+    def _hitobject_counts(beatmap: StubBeatmap) -> dict[str, int]:
+        return {
+            "notes": sum(1 for _, flags in beatmap.hitobjects if not flags & 128),
+            "hold_notes": sum(1 for _, flags in beatmap.hitobjects if flags & 128),
+        }
+
+    @staticmethod
+    def gamemode():
+        return Gamemode.MANIA
+
+
 difficulty_calculators_classes: dict[str, type[AbstractDifficultyCalculator]] = {
     name: import_string(calculator_class)
     for name, calculator_class in settings.DIFFICULTY_CALCULATOR_CLASSES.items()
@@ -517,3 +1080,8 @@ def get_difficulty_calculators_for_gamemode(
         for calculator_class in difficulty_calculators_classes.values()
         if calculator_class.gamemode() == gamemode
     ]
+
+
+def refresh_difficulty_calculator_info():
+    for calculator_class in difficulty_calculators_classes.values():
+        calculator_class.refresh_info()
@@ -2,12 +2,13 @@ import json
 import os
 from abc import ABC, abstractmethod
 from datetime import datetime, timezone
-from typing import NamedTuple, Type
+from typing import Callable, NamedTuple, Type
 
 import requests
 from django.conf import settings
 from django.utils.module_loading import import_string
 from ossapi import Beatmap, GameMode, Ossapi, Score, ScoreType, User, UserLookupKey
+from ossapi.utils import BaseModel
 from prometheus_client import Counter
 
 from common.osu.enums import BeatmapStatus, Gamemode
@@ -27,6 +28,41 @@ class MalformedResponseError(Exception):
 class ScoresPage(NamedTuple):
     scores: list[ScoreData]
     cursor_string: str | None
+    # number of scores in the page before any filtering by user
+    page_size: int
+
+
+# Called with the (gamemode value, user id) pairs of a page of scores, returning those to keep
+UserFilter = Callable[[set[tuple[int, int]]], set[tuple[int, int]]]
+
+
+class RawJsonResponse(BaseModel):
+    """
+    ossapi base model that keeps a response as raw json, rather than deserialising it into models.
+    """
+
+    def __init__(self, data: dict):
+        self.data = data
+
+
+# ossapi only exposes deserialised responses, so raw requests rely on its internals (Ossapi._get and
+#   Ossapi._instantiate_type). These helpers keep that reliance in one place, and test_osuapi.py checks
+#   them against a sample /scores payload so an incompatible ossapi upgrade fails the tests.
+
+
+def get_raw_json(client: Ossapi, url: str, params: dict) -> dict:
+    """
+    Makes a GET request to the osu! api through an ossapi client, returning the response json without deserialising it.
+    Raises ValueError for api errors, as ossapi does.
+    """
+    return client._get(RawJsonResponse, url, params).data
+
+
+def instantiate_ossapi_model(client: Ossapi, model_type: type, data: dict):
+    """
+    Deserialises raw response json into an ossapi model, as ossapi does for its own requests.
+    """
+    return client._instantiate_type(model_type, data)
 
 
 class BeatmapData(NamedTuple):
@@ -431,6 +467,10 @@ class AbstractOsuApi(ABC):
     def get_beatmap(self, beatmap_id: int) -> BeatmapData | None:
         raise NotImplementedError()
 
+    @abstractmethod
+    def get_beatmaps(self, beatmap_ids: list[int]) -> list[BeatmapData]:
+        raise NotImplementedError()
+
     @abstractmethod
     def get_user_by_id(self, user_id: int, gamemode: Gamemode) -> UserData | None:
         raise NotImplementedError()
@@ -456,7 +496,16 @@ class AbstractOsuApi(ABC):
         raise NotImplementedError()
 
     @abstractmethod
-    def get_recent_scores(self, cursor_string: str | None = None) -> ScoresPage:
+    def get_recent_scores(
+        self,
+        cursor_string: str | None = None,
+        user_filter: UserFilter | None = None,
+    ) -> ScoresPage:
+        """
+        Returns a page of the /scores stream.
+        If user_filter is passed, it is called once with the (gamemode value, user id) pairs in the page
+        and only scores of the pairs it returns are included.
+        """
         raise NotImplementedError()
 
 
@@ -486,6 +535,15 @@ class LiveOsuApiV1(AbstractOsuApi):
         except IndexError:
             return None
 
+    def get_beatmaps(self, beatmap_ids: list[int]) -> list[BeatmapData]:
+        # v1 api only supports looking up a single beatmap by id per request
+        beatmaps = []
+        for beatmap_id in beatmap_ids:
+            beatmap_data = self.get_beatmap(beatmap_id)
+            if beatmap_data is not None:
+                beatmaps.append(beatmap_data)
+        return beatmaps
+
     def get_user_by_id(self, user_id: int, gamemode: Gamemode) -> UserData | None:
         try:
             return UserData.from_apiv1(
@@ -534,11 +592,18 @@ class LiveOsuApiV1(AbstractOsuApi):
             )
         ]
 
-    def get_recent_scores(self, cursor_string: str | None = None) -> ScoresPage:
+    def get_recent_scores(
+        self,
+        cursor_string: str | None = None,
+        user_filter: UserFilter | None = None,
+    ) -> ScoresPage:
         raise NotImplementedError("v1 api does not support the /scores endpoint")
 
 
 class LiveOsuApiV2(AbstractOsuApi):
+    # maximum number of ids accepted by the /beatmaps endpoint
+    BEATMAPS_BATCH_SIZE = 50
+
     def __init__(self):
         self.client = Ossapi(
             settings.OSU_CLIENT_ID,
@@ -557,6 +622,7 @@ class LiveOsuApiV2(AbstractOsuApi):
 
     @staticmethod
     def __beatmap_data_from_ossapi(beatmap: Beatmap) -> BeatmapData:
+        # beatmapset is included in beatmap responses, so this won't make another request
         beatmap_set = beatmap.beatmapset()
         return BeatmapData(
             beatmap_id=beatmap.id,
@@ -769,6 +835,16 @@ class LiveOsuApiV2(AbstractOsuApi):
 
         return self.__beatmap_data_from_ossapi(beatmap)
 
+    def get_beatmaps(self, beatmap_ids: list[int]) -> list[BeatmapData]:
+        beatmaps = []
+        for i in range(0, len(beatmap_ids), self.BEATMAPS_BATCH_SIZE):
+            beatmaps.extend(
+                self.client.beatmaps(beatmap_ids[i : i + self.BEATMAPS_BATCH_SIZE])
+            )
+            osuapi_requests_counter.labels(endpoint="beatmaps", api_version="v2").inc()
+
+        return [self.__beatmap_data_from_ossapi(beatmap) for beatmap in beatmaps]
+
     def get_user_by_id(self, user_id: int, gamemode: Gamemode) -> UserData | None:
         try:
             user = self.client.user(
@@ -844,18 +920,42 @@ class LiveOsuApiV2(AbstractOsuApi):
 
         return [self.__score_data_from_ossapi(score) for score in scores]
 
-    def get_recent_scores(self, cursor_string: str | None = None) -> ScoresPage:
+    def get_recent_scores(
+        self,
+        cursor_string: str | None = None,
+        user_filter: UserFilter | None = None,
+    ) -> ScoresPage:
         try:
-            scores = self.client.scores(cursor_string=cursor_string)
+            # Fetch the page as raw json so only scores we want are deserialised into ossapi models
+            response = get_raw_json(
+                self.client, "/scores", {"cursor_string": cursor_string}
+            )
             osuapi_requests_counter.labels(
                 endpoint="recent_scores", api_version="v2"
             ).inc()
         except ValueError:
-            return ScoresPage(scores=[], cursor_string=None)
+            return ScoresPage(scores=[], cursor_string=None, page_size=0)
+
+        raw_scores = response["scores"]
+        page_size = len(raw_scores)
+
+        if user_filter is not None:
+            users = user_filter(
+                {
+                    (raw_score["ruleset_id"], raw_score["user_id"])
+                    for raw_score in raw_scores
+                }
+            )
+            raw_scores = [
+                raw_score
+                for raw_score in raw_scores
+                if (raw_score["ruleset_id"], raw_score["user_id"]) in users
+            ]
 
         score_data_list = []
-        for score in scores.scores:
+        for raw_score in raw_scores:
             try:
+                score = instantiate_ossapi_model(self.client, Score, raw_score)
                 score_data_list.append(
                     self.__score_data_from_ossapi(
                         score, beatmap_id_override=score.beatmap_id
@@ -864,7 +964,11 @@ class LiveOsuApiV2(AbstractOsuApi):
             except ValueError:
                 continue
 
-        return ScoresPage(scores=score_data_list, cursor_string=scores.cursor_string)
+        return ScoresPage(
+            scores=score_data_list,
+            cursor_string=response["cursor_string"],
+            page_size=page_size,
+        )
 
 
 class StubOsuApi(AbstractOsuApi):
@@ -903,6 +1007,14 @@ class StubOsuApi(AbstractOsuApi):
         except KeyError:
             return None
 
+    def get_beatmaps(self, beatmap_ids: list[int]) -> list[BeatmapData]:
+        beatmaps = self.__load_stub_data("beatmaps.json")
+        return [
+            BeatmapData.from_json(beatmaps[str(beatmap_id)])
+            for beatmap_id in beatmap_ids
+            if str(beatmap_id) in beatmaps
+        ]
+
     def get_user_by_id(self, user_id: int, gamemode: Gamemode) -> UserData | None:
         try:
             return UserData.from_json(
@@ -962,9 +1074,13 @@ class StubOsuApi(AbstractOsuApi):
         except KeyError:
             return []
 
-    def get_recent_scores(self, cursor_string: str | None = None) -> ScoresPage:
+    def get_recent_scores(
+        self,
+        cursor_string: str | None = None,
+        user_filter: UserFilter | None = None,
+    ) -> ScoresPage:
         if cursor_string is not None:
-            return ScoresPage(scores=[], cursor_string=cursor_string)
+            return ScoresPage(scores=[], cursor_string=cursor_string, page_size=0)
 
         raw_scores = self.__load_json_data(
             os.path.join(
@@ -974,12 +1090,21 @@ class StubOsuApi(AbstractOsuApi):
                 "recent_scores.json",
             )
         )
+        if user_filter is not None:
+            users = user_filter(
+                {(data["gamemode"], data["user_id"]) for data in raw_scores}
+            )
+        else:
+            users = None
+
         return ScoresPage(
             scores=[
                 ScoreData.from_json(data, data["user_id"], Gamemode(data["gamemode"]))
                 for data in raw_scores
+                if users is None or (data["gamemode"], data["user_id"]) in users
             ],
             cursor_string="complete",
+            page_size=len(raw_scores),
         )
 
 
@@ -1,17 +1,44 @@
+from unittest.mock import patch
+
 import pytest
+from django.core.cache import cache
 
 from common.osu.difficultycalculator import (
+    CALCULATION_CHUNK_SIZE_MAX,
+    CALCULATION_CHUNK_SIZE_MIN,
+    CALCULATION_CHUNK_TARGET_SECONDS,
+    Calculation,
+    CalculationCache,
     CalculationException,
+    CalculatorInfo,
     DifficalcyCatchDifficultyCalculator,
     DifficalcyManiaDifficultyCalculator,
     DifficalcyOsuDifficultyCalculator,
     DifficalcyPerformancePlusDifficultyCalculator,
     DifficalcyTaikoDifficultyCalculator,
     Score,
+    StubManiaDifficultyCalculator,
+    StubOsuDifficultyCalculator,
+    calculation_cache,
 )
 from common.osu.enums import Mods
 
 
+class TestCalculationCache:
+    def test_local_eviction(self):
+        test_cache = CalculationCache(local_max_size=1)
+        calculation = Calculation(
+            difficulty_values={"total": 1.0}, performance_values={"total": 2.0}
+        )
+        test_cache.set_many(
+            {"test_calculation:a": calculation, "test_calculation:b": calculation}
+        )
+        assert list(test_cache.local.keys()) == ["test_calculation:b"]
+        assert test_cache.get_many(
+            "test", ["test_calculation:a", "test_calculation:b", "test_calculation:c"]
+        ) == {"test_calculation:a": calculation, "test_calculation:b": calculation}
+
+
 class TestDifficalcyDifficultyCalculator:
     def test_context_manager(self, snapshot):
         with DifficalcyOsuDifficultyCalculator() as calc:
@@ -20,6 +47,120 @@ class TestDifficalcyDifficultyCalculator:
                 == snapshot
             )
 
+    def test_calculate_scores_cached(self):
+        calc = DifficalcyOsuDifficultyCalculator()
+        score = Score("307618", mods={Mods.CLASSIC: {}}, combo=100)
+        calculations = calc.calculate_scores([score])
+        assert calc.calculate_scores([score, score]) == calculations * 2
+        assert (
+            cache.get(calculation_cache.get_key(calc.engine(), calc.version(), score))
+            == calculations[0]
+        )
+
+    def test_calculate_scores_chunked(self, settings):
+        settings.DIFFICALCY_MAX_CONCURRENT_REQUESTS = 2
+        calc = DifficalcyOsuDifficultyCalculator()
+        scores = [Score(str(beatmap_id)) for beatmap_id in range(25)]
+
+        def calculate_chunk(chunk):
+            return [
+                Calculation(
+                    difficulty_values={"beatmap_id": float(score.beatmap_id)},
+                    performance_values={},
+                )
+                for score in chunk
+            ], 0.0
+
+        with (
+            patch.dict(
+                DifficalcyOsuDifficultyCalculator._chunk_sizes,
+                {calc._get_url(): CALCULATION_CHUNK_SIZE_MIN},
+            ),
+            patch.object(
+                calc, "_calculate_chunk", side_effect=calculate_chunk
+            ) as calculate_chunk_mock,
+        ):
+            calculations = calc._calculate_scores(
+                scores, [f"test_calculation:{beatmap_id}" for beatmap_id in range(25)]
+            )
+
+        assert [
+            calculation.difficulty_values["beatmap_id"] for calculation in calculations
+        ] == [float(beatmap_id) for beatmap_id in range(25)]
+        assert calculate_chunk_mock.call_count < 25
+
+    def test_calculate_scores_chunk_failure_caches_completed_chunks(self, settings):
+        settings.DIFFICALCY_MAX_CONCURRENT_REQUESTS = 1
+        calc = DifficalcyOsuDifficultyCalculator()
+        scores = [Score(str(beatmap_id)) for beatmap_id in range(25)]
+        cache_keys = [f"test_calculation:{beatmap_id}" for beatmap_id in range(25)]
+        cache.delete_many(cache_keys)
+
+        def calculate_chunk(chunk):
+            if chunk[0].beatmap_id != "0":
+                raise CalculationException("difficalcy unavailable")
+            return [
+                Calculation(difficulty_values={}, performance_values={}) for _ in chunk
+            ], 0.0
+
+        with (
+            patch.dict(
+                DifficalcyOsuDifficultyCalculator._chunk_sizes,
+                {calc._get_url(): CALCULATION_CHUNK_SIZE_MIN},
+            ),
+            patch.object(calc, "_calculate_chunk", side_effect=calculate_chunk),
+            pytest.raises(CalculationException),
+        ):
+            calc._calculate_scores(scores, cache_keys)
+
+        assert set(cache.get_many(cache_keys).keys()) == set(
+            cache_keys[:CALCULATION_CHUNK_SIZE_MIN]
+        )
+
+    def test_calculate_scores_invalidated_beatmap(self):
+        calc = DifficalcyOsuDifficultyCalculator()
+        score = Score("307618", mods={Mods.CLASSIC: {}}, combo=100)
+        calc.calculate_scores([score])
+        [key] = calculation_cache.get_keys(calc.engine(), calc.version(), [score])
+        assert cache.get(key) is not None
+
+        calculation_cache.invalidate_beatmaps(["307618"])
+        [invalidated_key] = calculation_cache.get_keys(
+            calc.engine(), calc.version(), [score]
+        )
+        assert invalidated_key != key
+        assert cache.get(invalidated_key) is None
+
+    def test_tune_chunk_size(self):
+        with patch.dict(DifficalcyOsuDifficultyCalculator._chunk_sizes, clear=True):
+            chunk_size = DifficalcyOsuDifficultyCalculator._get_chunk_size()
+
+            DifficalcyOsuDifficultyCalculator._tune_chunk_size(chunk_size, 0.1)
+            assert DifficalcyOsuDifficultyCalculator._get_chunk_size() == chunk_size * 2
+
+            DifficalcyOsuDifficultyCalculator._tune_chunk_size(
+                1, CALCULATION_CHUNK_TARGET_SECONDS * 2
+            )
+            assert DifficalcyOsuDifficultyCalculator._get_chunk_size() == chunk_size
+
+            for _ in range(20):
+                DifficalcyOsuDifficultyCalculator._tune_chunk_size(
+                    CALCULATION_CHUNK_SIZE_MAX, 0.1
+                )
+            assert (
+                DifficalcyOsuDifficultyCalculator._get_chunk_size()
+                == CALCULATION_CHUNK_SIZE_MAX
+            )
+
+    def test_refresh_info(self):
+        info = DifficalcyOsuDifficultyCalculator.refresh_info()
+        assert info == CalculatorInfo(
+            engine="osu.Game.Rulesets.Osu", version="2026.702.1.0"
+        )
+        assert (
+            cache.get(DifficalcyOsuDifficultyCalculator._get_info_cache_key()) == info
+        )
+
     def test_invalid_beatmap(self):
         with pytest.raises(CalculationException):
             with DifficalcyOsuDifficultyCalculator() as calc:
@@ -106,6 +247,13 @@ class TestDifficalcyOsuDifficultyCalculator:
         calc = DifficalcyOsuDifficultyCalculator()
         assert calc.get_beatmap_details("307618") == snapshot
 
+    def test_get_beatmaps_details(self):
+        calc = DifficalcyOsuDifficultyCalculator()
+        assert calc.get_beatmaps_details(["307618", "0", "362949"]) == {
+            "307618": calc.get_beatmap_details("307618"),
+            "362949": calc.get_beatmap_details("362949"),
+        }
+
 
 class TestDifficalcyTaikoDifficultyCalculator:
     def test_enigne(self):
@@ -215,3 +363,40 @@ class TestDifficalcyPerformancePlusDifficultyCalculator:
     def test_get_beatmap_details(self, snapshot):
         calc = DifficalcyPerformancePlusDifficultyCalculator()
         assert calc.get_beatmap_details("307618") == snapshot
+
+
+class TestStubDifficultyCalculator:
+    def test_engine(self):
+        assert StubOsuDifficultyCalculator.engine() == "osuchan.Stub.Standard"
+
+    def test_version(self, settings):
+        settings.STUB_DIFFICULTY_CALCULATOR_VERSION = "2.0.0"
+        assert StubOsuDifficultyCalculator.version() == "2.0.0"
+
+    def test_calculate_scores(self):
+        calc = StubOsuDifficultyCalculator()
+        nomod, doubletime, misses = calc.calculate_scores(
+            [
+                Score("307618"),
+                Score("307618", mods={Mods.DOUBLETIME: {}}),
+                Score("307618", statistics={"miss": 10}),
+            ]
+        )
+        assert calc.calculate_scores([Score("307618")]) == [nomod]
+        assert doubletime.difficulty_values["total"] > nomod.difficulty_values["total"]
+        assert misses.performance_values["total"] < nomod.performance_values["total"]
+
+    def test_invalid_beatmap(self):
+        with pytest.raises(CalculationException):
+            StubOsuDifficultyCalculator().calculate_scores([Score("notarealbeatmap")])
+
+    def test_get_beatmap_details(self):
+        beatmap_details = StubManiaDifficultyCalculator().get_beatmap_details("4")
+        assert beatmap_details.hitobject_counts == {"notes": 123, "hold_notes": 14}
+        assert beatmap_details.max_combo == 137
+
+    def test_get_beatmaps_details(self):
+        calc = StubOsuDifficultyCalculator()
+        assert calc.get_beatmaps_details(["307618", "notarealbeatmap"]) == {
+            "307618": calc.get_beatmap_details("307618")
+        }
@@ -0,0 +1,70 @@
+import json
+import os
+from datetime import datetime, timezone
+from unittest.mock import Mock, patch
+
+import pytest
+from ossapi import Ossapi
+
+from common.osu.enums import BitMods, Gamemode
+from common.osu.osuapi import LiveOsuApiV2
+
+
+class TestLiveOsuApiV2:
+    @pytest.fixture
+    def scores_response(self):
+        with open(
+            os.path.join(
+                os.path.dirname(__file__),
+                "stubdata",
+                "osuapi_responses",
+                "scores.json",
+            )
+        ) as fp:
+            return json.load(fp)
+
+    @pytest.fixture
+    def osu_api(self, scores_response):
+        # Authenticating with an access token avoids any requests until the api is called
+        client = Ossapi(1, "secret", access_token="token")
+        response = Mock()
+        response.json.return_value = scores_response
+        client.session.request = Mock(return_value=response)
+
+        with patch("common.osu.osuapi.Ossapi", return_value=client):
+            yield LiveOsuApiV2()
+
+    def test_get_recent_scores(self, osu_api):
+        page = osu_api.get_recent_scores(cursor_string="eyJpZCI6NDgxMTIwMDQxMH0")
+
+        assert page.cursor_string == "eyJpZCI6NDgxMTIwMDQxOH0"
+        assert page.page_size == 3
+        assert [score.user_id for score in page.scores] == [5701575, 2, 5701575]
+
+        stable_score = page.scores[0]
+        assert stable_score.beatmap_id == 362949
+        assert stable_score.gamemode == Gamemode.STANDARD
+        assert stable_score.is_stable
+        assert stable_score.mods == BitMods.HIDDEN | BitMods.DOUBLETIME
+        assert stable_score.count_300 == 387
+        assert stable_score.count_miss == 2
+        assert stable_score.best_combo == 412
+        assert stable_score.date == datetime(
+            2026, 10, 16, 23, 58, 12, tzinfo=timezone.utc
+        )
+
+        lazer_score = page.scores[2]
+        assert lazer_score.gamemode == Gamemode.TAIKO
+        assert not lazer_score.is_stable
+        assert lazer_score.mods_json == {"DT": {"speed_change": 1.3}}
+        assert lazer_score.count_geki == 18
+
+    def test_get_recent_scores_filters_users(self, osu_api):
+        page = osu_api.get_recent_scores(
+            user_filter=lambda users: {
+                (gamemode, user_id) for gamemode, user_id in users if user_id != 2
+            }
+        )
+
+        assert page.page_size == 3
+        assert [score.beatmap_id for score in page.scores] == [362949, 1003112]
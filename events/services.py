@@ -29,7 +29,12 @@ from leaderboards.models import Leaderboard, Membership
 from leaderboards.services import create_membership, delete_membership
 from profiles.enums import ScoreMutation, ScoreSet
 from profiles.models import Beatmap, OsuUser, Score, ScoreFilter
-from profiles.services import refresh_user_from_api, store_beatmap
+from profiles.services import (
+    invalidate_score_impact_contexts,
+    refresh_tracked_users,
+    refresh_user_from_api,
+    store_beatmap,
+)
 
 
 @transaction.atomic
@@ -137,6 +142,12 @@ def update_event(
 
         transaction.on_commit(lambda: refresh_event_leaderboards.delay(event.id))
 
+        attendee_user_ids = list(
+            event.event_attendees.values_list("user_id", flat=True)
+        )
+        transaction.on_commit(lambda: refresh_tracked_users(attendee_user_ids))
+        transaction.on_commit(invalidate_score_impact_contexts)
+
     return event
 
 
@@ -207,6 +218,8 @@ def add_event_attendee(event: Event, user_id: int) -> tuple[EventAttendee, bool]
     if created:
         for event_leaderboard in event.event_leaderboards.select_related("leaderboard"):
             create_membership(event_leaderboard.leaderboard_id, user_id)
+        transaction.on_commit(lambda: refresh_tracked_users([user_id]))
+        transaction.on_commit(invalidate_score_impact_contexts)
     return attendee, created
 
 
@@ -222,6 +235,7 @@ def remove_event_attendee(event: Event, user_id: int) -> None:
         except Membership.DoesNotExist:
             pass
     EventAttendee.objects.filter(event=event, user_id=user_id).delete()
+    transaction.on_commit(lambda: refresh_tracked_users([user_id]))
 
 
 @transaction.atomic
@@ -282,6 +296,7 @@ def create_beatmap_challenge(
                 f"Beatmap with id {beatmap_id} not found on osu!"
             )
 
+    transaction.on_commit(invalidate_score_impact_contexts)
     return BeatmapChallenge.objects.create(
         event=event,
         beatmap_id=beatmap_id,
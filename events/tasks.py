@@ -70,7 +70,7 @@ def update_user_event_challenge_scores(user_id: int) -> None:
 @shared_task(priority=7)
 def dispatch_update_all_current_event_attendees():
     # TODO: fix circular dependency
-    from profiles.tasks import update_user_recent
+    from profiles.tasks import enqueue_update_user_recent
 
     now = datetime.now(tz=timezone.utc)
     current_events = Event.objects.filter(
@@ -81,19 +81,15 @@ def dispatch_update_all_current_event_attendees():
     for event in current_events:
         for attendee in event.attendees.all():
             for gamemode in Gamemode:
-                update_user_recent.apply_async(
-                    kwargs={
-                        "user_id": attendee.id,
-                        "gamemode": gamemode,
-                    },
-                    priority=6,
+                enqueue_update_user_recent(
+                    user_id=attendee.id, gamemode=gamemode, priority=6
                 )
 
 
 @shared_task(priority=7)
 def dispatch_update_all_current_event_active_attendees():
     # TODO: fix circular dependency
-    from profiles.tasks import update_user_recent
+    from profiles.tasks import enqueue_update_user_recent
 
     now = datetime.now(tz=timezone.utc)
     current_events = Event.objects.filter(
@@ -107,10 +103,6 @@ def dispatch_update_all_current_event_active_attendees():
             scores__date__gte=datetime.now(tz=timezone.utc) - timedelta(minutes=30),
         ).distinct()
         for user_stats in active_attendees_stats:
-            update_user_recent.apply_async(
-                kwargs={
-                    "user_id": user_stats.user_id,
-                    "gamemode": user_stats.gamemode,
-                },
-                priority=6,
+            enqueue_update_user_recent(
+                user_id=user_stats.user_id, gamemode=user_stats.gamemode, priority=6
             )
@@ -1,11 +1,22 @@
-from django.db import transaction
+from collections import defaultdict
+
+from django.db import connection, transaction
 from django.db.models import Max
+from django_redis import get_redis_connection
 from rest_framework.exceptions import PermissionDenied
 
+from common.osu.difficultycalculator import get_default_difficulty_calculator_class
+from common.osu.enums import Gamemode
 from common.osu.utils import calculate_pp_total
 from leaderboards.enums import LeaderboardAccessType
 from leaderboards.models import Leaderboard, Membership, MembershipScore
-from profiles.models import OsuUser, Score
+from profiles.models import OsuUser, PerformanceValue, Score, get_score_set_mutations
+from profiles.services import invalidate_score_impact_contexts
+
+LEADERBOARD_RANKING_KEY_PREFIX = "leaderboard_ranking"
+# Ids of leaderboards whose rankings have changed since their ranks were last synced to the database
+LEADERBOARD_RANKINGS_DIRTY_KEY = "leaderboard_rankings_dirty"
+LEADERBOARD_RANKING_SYNC_BATCH_SIZE = 1000
 
 
 @transaction.atomic
@@ -19,6 +30,8 @@ def create_leaderboard(owner_id, leaderboard):
     leaderboard.score_filter.save()
     leaderboard.save()
     update_membership(leaderboard, owner_id)
+    # Replace any stale ranking left under this id (eg. from a reset database) once committed
+    transaction.on_commit(lambda: reset_leaderboard_ranking(leaderboard.id))
     return leaderboard
 
 
@@ -43,19 +56,30 @@ def delete_membership(membership):
     """
     membership.delete()
     membership.leaderboard.update_member_count()
+    transaction.on_commit(
+        lambda: remove_leaderboard_ranking_member(
+            membership.leaderboard_id, membership.user_id
+        )
+    )
     return True
 
 
 @transaction.atomic
 def update_membership(
-    leaderboard: Leaderboard, user_id: int, skip_notifications: bool = False
+    leaderboard: Leaderboard,
+    user_id: int,
+    skip_notifications: bool = False,
+    score_ids: list[int] | None = None,
 ):
     """
-    Creates or updates a membership for a given user on a given leaderboard
+    Creates or updates a membership for a given user on a given leaderboard.
+    If score_ids are passed, only those new scores are merged into an existing membership instead of rebuilding it.
     """
+    created = False
     try:
         membership = leaderboard.memberships.select_for_update().get(user_id=user_id)
     except Membership.DoesNotExist:
+        created = True
         if (
             leaderboard.access_type
             in (
@@ -81,6 +105,7 @@ def update_membership(
             score_count=0,
             rank=leaderboard.member_count + 1,
         )
+        transaction.on_commit(invalidate_score_impact_contexts)
 
     if not skip_notifications and leaderboard.notification_discord_webhook_url != "":
         # Get leaderboard records before updating, so we can compare for notifications
@@ -90,70 +115,33 @@ def update_membership(
         old_score_count = membership.score_count
         old_top_10_scores = set(leaderboard.get_top_scores(limit=10))
 
-    scores = Score.objects.filter(
-        user_stats__user_id=user_id, user_stats__gamemode=leaderboard.gamemode
-    )
-
-    if not leaderboard.allow_past_scores:
-        scores = scores.filter(date__gte=membership.join_date)
+    if score_ids is not None and not created:
+        add_membership_scores(leaderboard, membership, score_ids)
+    else:
+        rebuild_membership_scores(leaderboard, membership)
 
-    if leaderboard.score_filter:
-        scores = scores.apply_score_filter(leaderboard.score_filter)
-
-    scores = scores.get_score_set(
-        leaderboard.gamemode,
-        score_set=leaderboard.score_set,
-        calculator_engine=leaderboard.calculator_engine,
-        primary_performance_value=leaderboard.primary_performance_value,
+    membership.rank = set_leaderboard_ranking_member(
+        leaderboard.id, membership.user_id, membership.pp
     )
 
-    membership_scores = [
-        MembershipScore(
-            membership=membership,
-            leaderboard=leaderboard,
-            score=score,
-            performance_total=score.performance_total,
-        )
-        for score in scores
-        # Skip scores missing performance calculation
-        if score.performance_total is not None
-    ]
-
-    MembershipScore.objects.bulk_create(
-        membership_scores,
-        update_conflicts=True,
-        update_fields=["performance_total"],
-        unique_fields=["membership_id", "score_id"],
-    )
-
-    outdated_membershipscores = MembershipScore.objects.filter(
-        membership=membership
-    ).exclude(score_id__in=[score.id for score in scores])
-    outdated_membershipscores.delete()
-
-    membership.score_count = len(membership_scores)
-
-    membership.pp = calculate_pp_total(
-        score.performance_total for score in membership_scores
-    )
-
-    membership.rank = leaderboard.memberships.filter(pp__gt=membership.pp).count() + 1
-
     membership.save()
 
     if not skip_notifications and leaderboard.notification_discord_webhook_url != "":
         notification_settings = leaderboard.notification_settings
+        top_membership_score = membership.membership_scores.order_by(
+            "-performance_total"
+        ).first()
 
         # Check for new top score
         if (
             notification_settings.get("top_score")
-            and len(membership_scores) > 0
-            and membership_scores[0].performance_total > pp_record
+            and top_membership_score is not None
+            and top_membership_score.performance_total > pp_record
         ):
             # NOTE: need to use a function with default params here so the closure has the correct variables
             def send_notification(
                 leaderboard_id=leaderboard.id,
-                score_id=membership_scores[0].score_id,
+                score_id=top_membership_score.score_id,
             ):
                 from leaderboards.tasks import send_leaderboard_top_score_notification
 
@@ -201,9 +189,7 @@ def update_membership(
 
             transaction.on_commit(send_notification)
 
-        personal_pp_record_score = (
-            membership_scores[0] if len(membership_scores) > 0 else None
-        )
+        personal_pp_record_score = top_membership_score
         personal_pp_record = (
             personal_pp_record_score.performance_total
             if personal_pp_record_score is not None
@@ -231,7 +217,7 @@ def update_membership(
             transaction.on_commit(send_notification)
 
         # Check for top 10 scores (excluding #1 since it has it's own notification)
-        if notification_settings.get("top_10_score") and len(membership_scores) > 0:
+        if notification_settings.get("top_10_score") and membership.score_count > 0:
             leaderboard_top_10_scores = leaderboard.get_top_scores(limit=10)[
                 1:
             ]  # Exclude top score since it has it's own notification
@@ -255,3 +241,601 @@ def update_membership(
                     transaction.on_commit(send_notification)
 
     return membership
+
+
+def update_user_memberships(
+    user_id: int, gamemode: Gamemode, memberships: list[Membership]
+):
+    """
+    Updates the passed memberships of a user in one pass, without notifications.
+    The user's scores and performance values are loaded once, each leaderboard's filters are applied in memory, and changes are written in bulk.
+    Memberships should be locked with their leaderboard and score filter selected.
+    """
+    if len(memberships) == 0:
+        return
+
+    scores = list(
+        Score.objects.filter(
+            user_stats__user_id=user_id, user_stats__gamemode=gamemode
+        ).select_related("beatmap")
+    )
+
+    # Performance totals by (calculator_engine, performance value name) and score id
+    default_calculator_engine = get_default_difficulty_calculator_class(
+        gamemode
+    ).engine()
+    performance_totals = defaultdict(dict)
+    performance_totals[(default_calculator_engine, "total")] = {
+        score.id: score.default_performance_total for score in scores
+    }
+
+    performance_value_keys = (
+        set(
+            (
+                membership.leaderboard.calculator_engine,
+                membership.leaderboard.primary_performance_value,
+            )
+            for membership in memberships
+        )
+        - performance_totals.keys()
+    )
+    if len(performance_value_keys) > 0:
+        performance_values = PerformanceValue.objects.filter(
+            calculation__score__user_stats__user_id=user_id,
+            calculation__score__user_stats__gamemode=gamemode,
+            calculation__calculator_engine__in=[
+                calculator_engine for calculator_engine, _ in performance_value_keys
+            ],
+            name__in=[name for _, name in performance_value_keys],
+        ).values_list(
+            "calculation__calculator_engine", "name", "calculation__score_id", "value"
+        )
+        for calculator_engine, name, score_id, value in performance_values:
+            if (calculator_engine, name) in performance_value_keys:
+                performance_totals[(calculator_engine, name)][score_id] = value
+
+    existing_membership_scores = defaultdict(dict)
+    for membership_score in MembershipScore.objects.filter(membership__in=memberships):
+        existing_membership_scores[membership_score.membership_id][
+            membership_score.score_id
+        ] = membership_score
+
+    created_membership_scores = []
+    updated_membership_scores = []
+    deleted_membership_score_ids = []
+    for membership in memberships:
+        leaderboard = membership.leaderboard
+        score_performance_totals = performance_totals[
+            (leaderboard.calculator_engine, leaderboard.primary_performance_value)
+        ]
+        mutations = get_score_set_mutations(leaderboard.score_set)
+
+        # Best score per beatmap, same as get_score_set
+        best_scores = {}
+        for score in scores:
+            performance_total = score_performance_totals.get(score.id)
+            # Skip scores missing performance calculation
+            if performance_total is None:
+                continue
+            if score.mutation not in mutations:
+                continue
+            if not leaderboard.allow_past_scores and score.date < membership.join_date:
+                continue
+            if leaderboard.score_filter and not leaderboard.score_filter.allows_score(
+                score
+            ):
+                continue
+
+            best_score = best_scores.get(score.beatmap_id)
+            if best_score is None or performance_total > best_score[1]:
+                best_scores[score.beatmap_id] = (score, performance_total)
+
+        current_membership_scores = existing_membership_scores[membership.id]
+        for score, performance_total in best_scores.values():
+            membership_score = current_membership_scores.pop(score.id, None)
+            if membership_score is None:
+                created_membership_scores.append(
+                    MembershipScore(
+                        membership=membership,
+                        leaderboard=leaderboard,
+                        score=score,
+                        performance_total=performance_total,
+                    )
+                )
+            elif membership_score.performance_total != performance_total:
+                membership_score.performance_total = performance_total
+                updated_membership_scores.append(membership_score)
+
+        # Remaining scores are no longer bests
+        deleted_membership_score_ids.extend(
+            membership_score.id
+            for membership_score in current_membership_scores.values()
+        )
+
+        membership.score_count = len(best_scores)
+        membership.pp = calculate_pp_total(
+            sorted(
+                (performance_total for _, performance_total in best_scores.values()),
+                reverse=True,
+            )
+        )
+        membership.rank = set_leaderboard_ranking_member(
+            leaderboard.id, membership.user_id, membership.pp
+        )
+
+    MembershipScore.objects.filter(id__in=deleted_membership_score_ids).delete()
+    MembershipScore.objects.bulk_update(
+        updated_membership_scores, ["performance_total"], batch_size=1000
+    )
+    MembershipScore.objects.bulk_create(created_membership_scores, batch_size=1000)
+    Membership.objects.bulk_update(memberships, ["pp", "score_count", "rank"])
+
+
+def rebuild_membership_scores(leaderboard: Leaderboard, membership: Membership):
+    """
+    Rebuilds all MembershipScores of a membership and recalculates its pp and score count
+    """
+    scores = Score.objects.filter(
+        user_stats__user_id=membership.user_id,
+        user_stats__gamemode=leaderboard.gamemode,
+    )
+
+    if not leaderboard.allow_past_scores:
+        scores = scores.filter(date__gte=membership.join_date)
+
+    if leaderboard.score_filter:
+        scores = scores.apply_score_filter(leaderboard.score_filter)
+
+    if (
+        leaderboard.allow_past_scores
+        and (
+            not leaderboard.score_filter
+            or leaderboard.score_filter.filters_only_beatmaps()
+        )
+        and leaderboard.primary_performance_value == "total"
+    ):
+        # bests are maintained on write, so no need to deduplicate here
+        scores = scores.get_beatmap_bests(
+            leaderboard.gamemode,
+            score_set=leaderboard.score_set,
+            calculator_engine=leaderboard.calculator_engine,
+        )
+    else:
+        scores = scores.get_score_set(
+            leaderboard.gamemode,
+            score_set=leaderboard.score_set,
+            calculator_engine=leaderboard.calculator_engine,
+            primary_performance_value=leaderboard.primary_performance_value,
+        )
+
+    membership_scores = [
+        MembershipScore(
+            membership=membership,
+            leaderboard=leaderboard,
+            score=score,
+            performance_total=score.performance_total,
+        )
+        for score in scores
+        # Skip scores missing performance calculation
+        if score.performance_total is not None
+    ]
+
+    MembershipScore.objects.bulk_create(
+        membership_scores,
+        update_conflicts=True,
+        update_fields=["performance_total"],
+        unique_fields=["membership_id", "score_id"],
+    )
+
+    outdated_membershipscores = MembershipScore.objects.filter(
+        membership=membership
+    ).exclude(score_id__in=[score.id for score in scores])
+    outdated_membershipscores.delete()
+
+    membership.score_count = len(membership_scores)
+
+    membership.pp = calculate_pp_total(
+        score.performance_total for score in membership_scores
+    )
+
+
+def add_membership_scores(
+    leaderboard: Leaderboard, membership: Membership, score_ids: list[int]
+):
+    """
+    Merges the passed new scores into the MembershipScores of a membership, updating its pp and score count.
+    Only scores passing the leaderboard's filters and beating the member's best on their beatmap are added,
+    and pp is recalculated from the member's stored performance totals rather than rebuilding the membership.
+    """
+    scores = Score.objects.filter(
+        id__in=score_ids,
+        user_stats__user_id=membership.user_id,
+        user_stats__gamemode=leaderboard.gamemode,
+    ).filter_mutations(get_score_set_mutations(leaderboard.score_set))
+
+    if not leaderboard.allow_past_scores:
+        scores = scores.filter(date__gte=membership.join_date)
+
+    if leaderboard.score_filter:
+        scores = scores.apply_score_filter(leaderboard.score_filter)
+
+    scores = scores.annotate_primary_performance_total(
+        leaderboard.gamemode,
+        calculator_engine=leaderboard.calculator_engine,
+        primary_performance_value=leaderboard.primary_performance_value,
+    ).filter(performance_total__isnull=False)
+
+    # Best new score per beatmap, keeping the earliest of equal pp scores like get_score_set
+    best_new_scores = {}
+    for score in scores.order_by("date", "id"):
+        best_new_score = best_new_scores.get(score.beatmap_id)
+        if (
+            best_new_score is None
+            or score.performance_total > best_new_score.performance_total
+        ):
+            best_new_scores[score.beatmap_id] = score
+
+    if len(best_new_scores) == 0:
+        return
+
+    current_membership_scores = {
+        membership_score.score.beatmap_id: membership_score
+        for membership_score in membership.membership_scores.select_related(
+            "score"
+        ).filter(score__beatmap_id__in=best_new_scores.keys())
+    }
+
+    added_membership_scores = []
+    removed_membership_scores = []
+    for beatmap_id, score in best_new_scores.items():
+        current_membership_score = current_membership_scores.get(beatmap_id)
+        if current_membership_score is not None:
+            if score.performance_total <= current_membership_score.performance_total:
+                continue
+            removed_membership_scores.append(current_membership_score)
+
+        added_membership_scores.append(
+            MembershipScore(
+                membership=membership,
+                leaderboard=leaderboard,
+                score=score,
+                performance_total=score.performance_total,
+            )
+        )
+
+    if len(added_membership_scores) == 0:
+        return
+
+    MembershipScore.objects.filter(
+        id__in=[membership_score.id for membership_score in removed_membership_scores]
+    ).delete()
+    MembershipScore.objects.bulk_create(added_membership_scores)
+
+    # Recalculate pp from the stored totals rather than adjusting it, so errors can't accumulate
+    performance_totals = list(
+        membership.membership_scores.order_by("-performance_total").values_list(
+            "performance_total", flat=True
+        )
+    )
+    membership.score_count = len(performance_totals)
+    membership.pp = calculate_pp_total(performance_totals)
+
+
+@transaction.atomic
+def recalculate_leaderboard(leaderboard: Leaderboard):
+    """
+    Recalculates the scores, pp and rank of every membership of a leaderboard.
+    Equivalent to update_membership for each member without notifications, but done set-based in the database.
+    """
+    scores = Score.objects.filter(gamemode=leaderboard.gamemode).filter_mutations(
+        get_score_set_mutations(leaderboard.score_set)
+    )
+
+    if leaderboard.score_filter:
+        scores = scores.apply_score_filter(leaderboard.score_filter)
+
+    # Skip scores missing performance calculation
+    scores = (
+        scores.annotate_primary_performance_total(
+            leaderboard.gamemode,
+            calculator_engine=leaderboard.calculator_engine,
+            primary_performance_value=leaderboard.primary_performance_value,
+        )
+        .filter(performance_total__isnull=False)
+        .values_list(
+            "id", "user_stats__user_id", "beatmap_id", "date", "performance_total"
+        )
+    )
+    scores_sql, scores_params = scores.query.sql_with_params()
+
+    membership_table = Membership._meta.db_table
+    membership_score_table = MembershipScore._meta.db_table
+
+    MembershipScore.objects.filter(leaderboard=leaderboard).delete()
+
+    with connection.cursor() as cursor:
+        # Insert each member's best score per beatmap
+        cursor.execute(
+            f"""
+            INSERT INTO {membership_score_table}
+                (membership_id, leaderboard_id, score_id, performance_total)
+            SELECT DISTINCT ON (membership.id, score.beatmap_id)
+                membership.id, membership.leaderboard_id, score.id, score.performance_total
+            FROM ({scores_sql}) AS score (id, user_id, beatmap_id, date, performance_total)
+            INNER JOIN {membership_table} AS membership
+                ON membership.user_id = score.user_id
+            WHERE membership.leaderboard_id = %s
+                AND (%s OR score.date >= membership.join_date)
+            ORDER BY membership.id, score.beatmap_id, score.performance_total DESC, score.date, score.id
+            """,
+            [*scores_params, leaderboard.id, leaderboard.allow_past_scores],
+        )
+
+        # Weight each member's scores by 0.95^(n-1) in pp order, same as calculate_pp_total
+        cursor.execute(
+            f"""
+            WITH weighted_scores AS (
+                SELECT
+                    membership_id,
+                    performance_total * power(
+                        0.95::double precision,
+                        ROW_NUMBER() OVER (
+                            PARTITION BY membership_id ORDER BY performance_total DESC
+                        ) - 1
+                    ) AS weighted_performance_total
+                FROM {membership_score_table}
+                WHERE leaderboard_id = %s
+            ),
+            membership_totals AS (
+                SELECT
+                    membership_id,
+                    SUM(weighted_performance_total) AS pp,
+                    COUNT(*) AS score_count
+                FROM weighted_scores
+                GROUP BY membership_id
+            )
+            UPDATE {membership_table} AS membership
+            SET
+                pp = COALESCE(membership_totals.pp, 0),
+                score_count = COALESCE(membership_totals.score_count, 0)
+            FROM {membership_table} AS leaderboard_membership
+            LEFT JOIN membership_totals
+                ON membership_totals.membership_id = leaderboard_membership.id
+            WHERE membership.id = leaderboard_membership.id
+                AND leaderboard_membership.leaderboard_id = %s
+            """,
+            [leaderboard.id, leaderboard.id],
+        )
+
+        # Rank members with ties sharing a rank, same as update_membership
+        cursor.execute(
+            f"""
+            UPDATE {membership_table} AS membership
+            SET rank = ranked_memberships.rank
+            FROM (
+                SELECT id, RANK() OVER (ORDER BY pp DESC) AS rank
+                FROM {membership_table}
+                WHERE leaderboard_id = %s
+            ) AS ranked_memberships
+            WHERE membership.id = ranked_memberships.id
+            """,
+            [leaderboard.id],
+        )
+
+    # Ranking may have members that moved, so rebuild it from the new pp
+    transaction.on_commit(lambda: reset_leaderboard_ranking(leaderboard.id))
+
+
+def get_leaderboard_ranking_key(leaderboard_id: int) -> str:
+    return f"{LEADERBOARD_RANKING_KEY_PREFIX}:{leaderboard_id}"
+
+
+def ensure_leaderboard_ranking(leaderboard_id: int) -> str:
+    """
+    Populates the redis sorted set ranking of a leaderboard's members by pp from the database if it doesnt exist, returning its key.
+    """
+    redis = get_redis_connection()
+    key = get_leaderboard_ranking_key(leaderboard_id)
+    if not redis.exists(key):
+        member_pps = {
+            str(user_id): pp
+            for user_id, pp in Membership.objects.filter(
+                leaderboard_id=leaderboard_id
+            ).values_list("user_id", "pp")
+        }
+        if len(member_pps) > 0:
+            # nx so we dont overwrite members set concurrently since reading the database
+            redis.zadd(key, member_pps, nx=True)
+    return key
+
+
+def reset_leaderboard_ranking(leaderboard_id: int):
+    """
+    Deletes the ranking of a leaderboard and repopulates it from the database
+    """
+    get_redis_connection().delete(get_leaderboard_ranking_key(leaderboard_id))
+    ensure_leaderboard_ranking(leaderboard_id)
+    mark_leaderboard_ranking_dirty(leaderboard_id)
+
+
+def set_leaderboard_ranking_member(leaderboard_id: int, user_id: int, pp: float) -> int:
+    """
+    Sets the pp of a member in a leaderboard's ranking once the current transaction commits, returning their new rank
+    """
+    redis = get_redis_connection()
+    key = ensure_leaderboard_ranking(leaderboard_id)
+
+    pipeline = redis.pipeline(transaction=False)
+    pipeline.zscore(key, user_id)
+    pipeline.zcount(key, f"({pp}", "+inf")
+    current_pp, higher_count = pipeline.execute()
+    # dont count the member's own current pp against them
+    if current_pp is not None and current_pp > pp:
+        higher_count -= 1
+
+    # Only write to the ranking once committed, so readers never see uncommitted pp
+    def write_ranking_member():
+        redis.zadd(key, {str(user_id): pp})
+        mark_leaderboard_ranking_dirty(leaderboard_id)
+
+    transaction.on_commit(write_ranking_member)
+
+    return higher_count + 1
+
+
+def remove_leaderboard_ranking_member(leaderboard_id: int, user_id: int):
+    get_redis_connection().zrem(get_leaderboard_ranking_key(leaderboard_id), user_id)
+    mark_leaderboard_ranking_dirty(leaderboard_id)
+
+
+def mark_leaderboard_ranking_dirty(leaderboard_id: int):
+    """
+    Marks the ranking of a leaderboard as changed, so its ranks are written back to the database on the next sync
+    """
+    get_redis_connection().sadd(LEADERBOARD_RANKINGS_DIRTY_KEY, leaderboard_id)
+
+
+def pop_dirty_leaderboard_ranking_ids() -> list[int]:
+    """
+    Returns and unmarks the ids of leaderboards whose rankings have changed since they were last synced
+    """
+    redis = get_redis_connection()
+    count = redis.scard(LEADERBOARD_RANKINGS_DIRTY_KEY)
+    if count == 0:
+        return []
+    return [
+        int(leaderboard_id)
+        for leaderboard_id in redis.spop(LEADERBOARD_RANKINGS_DIRTY_KEY, count)
+    ]
+
+
+def get_leaderboard_ranking_member_rank(
+    leaderboard_id: int, user_id: int
+) -> int | None:
+    """
+    Returns the rank of a member in a leaderboard's ranking, or None if they arent ranked
+    """
+    redis = get_redis_connection()
+    key = ensure_leaderboard_ranking(leaderboard_id)
+    pp = redis.zscore(key, user_id)
+    if pp is None:
+        return None
+    # members with equal pp share a rank
+    return redis.zcount(key, f"({pp}", "+inf") + 1
+
+
+def iterate_leaderboard_ranking(leaderboard_id: int, batch_size: int = 1000):
+    """
+    Yields batches of (user_id, pp, rank) of a leaderboard's ranking, from highest pp.
+    """
+    redis = get_redis_connection()
+    key = ensure_leaderboard_ranking(leaderboard_id)
+
+    start = 0
+    position = 0
+    rank = 0
+    previous_pp = None
+    while True:
+        entries = redis.zrevrange(key, start, start + batch_size - 1, withscores=True)
+        if len(entries) == 0:
+            return
+        start += len(entries)
+
+        batch = []
+        for member, pp in entries:
+            position += 1
+            # members with equal pp share a rank
+            if pp != previous_pp:
+                rank = position
+                previous_pp = pp
+            batch.append((int(member), pp, rank))
+        yield batch
+
+
+def get_top_memberships(leaderboard: Leaderboard, limit: int = 100) -> list[Membership]:
+    """
+    Returns the top non-restricted memberships of a leaderboard in ranking order, with ranks from the ranking.
+    """
+    memberships = []
+    for batch in iterate_leaderboard_ranking(leaderboard.id, batch_size=limit):
+        batch_memberships = (
+            Membership.objects.non_restricted()
+            .filter(
+                leaderboard_id=leaderboard.id,
+                user_id__in=[user_id for user_id, _, _ in batch],
+            )
+            .select_related("user")
+            .in_bulk(field_name="user_id")
+        )
+        for user_id, _, rank in batch:
+            membership = batch_memberships.get(user_id)
+            if membership is not None:
+                membership.rank = rank
+                memberships.append(membership)
+
+        if len(memberships) >= limit:
+            break
+
+    return memberships[:limit]
+
+
+def sync_leaderboard_ranks(
+    leaderboard_id: int, batch_size: int = LEADERBOARD_RANKING_SYNC_BATCH_SIZE
+):
+    """
+    Writes the ranks of a leaderboard's ranking back to its memberships in the database.
+    Members missing from either side are added or removed from the ranking first, and members with stale pp rewritten.
+    Memberships are read in batches, so global leaderboards aren't loaded all at once.
+    """
+    redis = get_redis_connection()
+    key = ensure_leaderboard_ranking(leaderboard_id)
+    memberships = Membership.objects.filter(leaderboard_id=leaderboard_id)
+
+    # Members missing from the ranking, or whose pp in the ranking differs from the database
+    last_membership_id = 0
+    while True:
+        membership_pps = list(
+            memberships.filter(id__gt=last_membership_id)
+            .order_by("id")
+            .values_list("id", "user_id", "pp")[:batch_size]
+        )
+        if len(membership_pps) == 0:
+            break
+        last_membership_id = membership_pps[-1][0]
+
+        ranked_pps = redis.zmscore(key, [user_id for _, user_id, _ in membership_pps])
+        outdated_pps = {
+            str(user_id): pp
+            for (_, user_id, pp), ranked_pp in zip(membership_pps, ranked_pps)
+            if ranked_pp != pp
+        }
+        if len(outdated_pps) > 0:
+            redis.zadd(key, outdated_pps)
+
+    # Members no longer in the database, removed once iterating is done so no entries are skipped
+    removed_user_ids = []
+    for batch in iterate_leaderboard_ranking(leaderboard_id, batch_size):
+        user_ids = [user_id for user_id, _, _ in batch]
+        member_user_ids = set(
+            memberships.filter(user_id__in=user_ids).values_list("user_id", flat=True)
+        )
+        removed_user_ids.extend(
+            user_id for user_id in user_ids if user_id not in member_user_ids
+        )
+    if len(removed_user_ids) > 0:
+        redis.zrem(key, *removed_user_ids)
+
+    for batch in iterate_leaderboard_ranking(leaderboard_id, batch_size):
+        batch_memberships = (
+            memberships.filter(user_id__in=[user_id for user_id, _, _ in batch])
+            .only("id", "user_id", "rank")
+            .in_bulk(field_name="user_id")
+        )
+        updated_memberships = []
+        for user_id, _, rank in batch:
+            membership = batch_memberships.get(user_id)
+            if membership is not None and membership.rank != rank:
+                membership.rank = rank
+                updated_memberships.append(membership)
+
+        Membership.objects.bulk_update(updated_memberships, ["rank"])
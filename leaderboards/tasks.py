@@ -1,3 +1,4 @@
+import logging
 from datetime import datetime
 
 from celery import shared_task
@@ -12,30 +13,69 @@ from common.osu.utils import (
 )
 from leaderboards.enums import LeaderboardAccessType
 from leaderboards.models import Leaderboard, Membership
-from leaderboards.services import update_membership
+from leaderboards.services import (
+    mark_leaderboard_ranking_dirty,
+    pop_dirty_leaderboard_ranking_ids,
+    sync_leaderboard_ranks,
+    update_membership,
+    update_user_memberships,
+)
 from leaderboards.utils import get_leaderboard_type_string_from_leaderboard_access_type
 from profiles.enums import ScoreResult
 from profiles.models import Score
 
+logger = logging.getLogger(__name__)
+
 
 @shared_task(priority=3)
 @transaction.atomic
-def update_memberships(user_id, gamemode=Gamemode.STANDARD):
+def update_memberships(
+    user_id, gamemode=Gamemode.STANDARD, score_ids: list[int] | None = None
+):
     """
-    Updates all non-archived memberships for a given user and gamemode
+    Updates all non-archived memberships for a given user and gamemode.
+    If score_ids are passed, only those new scores are merged into existing memberships.
     """
-    memberships = Membership.objects.select_related(
-        "leaderboard", "leaderboard__score_filter"
-    ).filter(
-        user_id=user_id, leaderboard__gamemode=gamemode, leaderboard__archived=False
+    memberships = (
+        Membership.objects.select_for_update(of=("self",))
+        .select_related("leaderboard", "leaderboard__score_filter")
+        .filter(
+            user_id=user_id, leaderboard__gamemode=gamemode, leaderboard__archived=False
+        )
     )
 
+    # Notifications compare against the membership before and after each update, and
+    # new scores alone are cheaper to merge in, so those are updated one at a time
+    bulk_memberships = []
     for membership in memberships:
-        update_membership(membership.leaderboard, user_id)
+        if (
+            score_ids is not None
+            or membership.leaderboard.notification_discord_webhook_url != ""
+        ):
+            update_membership(membership.leaderboard, user_id, score_ids=score_ids)
+        else:
+            bulk_memberships.append(membership)
+
+    update_user_memberships(user_id, Gamemode(gamemode), bulk_memberships)
 
     return memberships
 
 
+@shared_task(priority=9)
+def sync_all_leaderboard_ranks():
+    """
+    Writes ranks from the redis rankings of leaderboards changed since the last sync back to their memberships
+    """
+    for leaderboard_id in pop_dirty_leaderboard_ranking_ids():
+        try:
+            with transaction.atomic():
+                sync_leaderboard_ranks(leaderboard_id)
+        except Exception:
+            logger.exception(f"Failed to sync ranks of leaderboard {leaderboard_id}")
+            # Retry on the next sync
+            mark_leaderboard_ranking_dirty(leaderboard_id)
+
+
 @shared_task(priority=0)
 def send_leaderboard_top_score_notification(leaderboard_id: int, score_id: int):
     # passing score_id instead of querying for top score in case it changes before the job is picked up
@@ -1,16 +1,24 @@
 import pytest
+from django_redis import get_redis_connection
 
 from common.osu.enums import Gamemode
 from leaderboards.enums import LeaderboardAccessType
-from leaderboards.models import Leaderboard
+from leaderboards.models import Leaderboard, Membership
 from leaderboards.services import (
     create_leaderboard,
     create_membership,
+    ensure_leaderboard_ranking,
+    get_leaderboard_ranking_key,
+    mark_leaderboard_ranking_dirty,
+    pop_dirty_leaderboard_ranking_ids,
+    recalculate_leaderboard,
+    sync_leaderboard_ranks,
     update_membership,
+    update_user_memberships,
 )
-from profiles.enums import ScoreSet
-from profiles.models import ScoreFilter
-from profiles.services import fetch_scores
+from profiles.enums import ScoreMutation, ScoreSet
+from profiles.models import PerformanceValue, Score, ScoreFilter
+from profiles.services import fetch_scores, update_user_beatmap_bests
 
 
 @pytest.mark.django_db
@@ -64,3 +72,112 @@ class TestMembershipServices:
         membership = update_membership(membership.leaderboard, membership.user_id)
         assert membership.score_count == 5
         assert membership.pp == 1422.8070706380865
+
+    def test_update_membership_score_ids(self, membership):
+        scores = fetch_scores(membership.user_id, [362949], Gamemode.STANDARD)
+        membership = update_membership(
+            membership.leaderboard,
+            membership.user_id,
+            score_ids=[score.id for score in scores],
+        )
+        assert membership.score_count == 5
+        assert membership.pp == pytest.approx(1422.8070706380865)
+        assert membership.membership_scores.count() == 5
+
+    def test_update_user_memberships(self, membership):
+        fetch_scores(membership.user_id, [362949], Gamemode.STANDARD)
+        memberships = list(
+            Membership.objects.select_related(
+                "leaderboard", "leaderboard__score_filter"
+            ).filter(user_id=membership.user_id)
+        )
+        update_user_memberships(membership.user_id, Gamemode.STANDARD, memberships)
+        membership.refresh_from_db()
+        assert membership.score_count == 5
+        assert membership.pp == pytest.approx(1422.8070706380865)
+        assert membership.membership_scores.count() == 5
+
+    def test_recalculate_leaderboard(self, membership):
+        fetch_scores(membership.user_id, [362949], Gamemode.STANDARD)
+        recalculate_leaderboard(membership.leaderboard)
+        membership.refresh_from_db()
+        assert membership.score_count == 5
+        assert membership.pp == pytest.approx(1422.8070706380865)
+        assert membership.membership_scores.count() == 5
+        assert (
+            membership.rank
+            == 1
+            + membership.leaderboard.memberships.filter(pp__gt=membership.pp).count()
+        )
+
+    def test_recalculate_leaderboard_equal_pp(self, membership):
+        fetch_scores(membership.user_id, [362949], Gamemode.STANDARD)
+        scores = Score.objects.filter(
+            user_stats__user_id=membership.user_id, beatmap_id=362949
+        )
+        scores.update(default_performance_total=100)
+        PerformanceValue.objects.filter(
+            calculation__score__in=scores, name="total"
+        ).update(value=100)
+        update_user_beatmap_bests(
+            set((score.user_stats_id, score.beatmap_id) for score in scores)
+        )
+        expected_score = (
+            scores.filter(mutation=ScoreMutation.NONE).order_by("date", "id").first()
+        )
+
+        # Both paths pick the earliest of the equal pp scores
+        update_membership(
+            membership.leaderboard, membership.user_id, skip_notifications=True
+        )
+        assert (
+            membership.membership_scores.get(score__beatmap_id=362949).score_id
+            == expected_score.id
+        )
+
+        recalculate_leaderboard(membership.leaderboard)
+        assert (
+            membership.membership_scores.get(score__beatmap_id=362949).score_id
+            == expected_score.id
+        )
+
+    def test_sync_leaderboard_ranks(self, leaderboard, membership):
+        assert membership.rank == 1
+
+        # Owner was passed by the new member, but their stored rank isnt updated until synced
+        owner_membership = leaderboard.memberships.get(user_id=leaderboard.owner_id)
+        assert owner_membership.rank == 1
+
+        sync_leaderboard_ranks(leaderboard.id)
+
+        owner_membership.refresh_from_db()
+        assert owner_membership.rank == 2
+
+    def test_sync_leaderboard_ranks_rewrites_stale_pp(self, leaderboard, membership):
+        sync_leaderboard_ranks(leaderboard.id)
+
+        # eg. left behind by an update which was rolled back
+        key = get_leaderboard_ranking_key(leaderboard.id)
+        get_redis_connection().zadd(key, {str(membership.user_id): 9001})
+
+        sync_leaderboard_ranks(leaderboard.id)
+
+        assert get_redis_connection().zscore(key, membership.user_id) == membership.pp
+
+    def test_sync_leaderboard_ranks_batched(self, leaderboard, membership):
+        # eg. a member whose removal wasn't written to the ranking
+        key = ensure_leaderboard_ranking(leaderboard.id)
+        get_redis_connection().zadd(key, {"123456": 9001})
+
+        sync_leaderboard_ranks(leaderboard.id, batch_size=1)
+
+        assert get_redis_connection().zscore(key, "123456") is None
+        owner_membership = leaderboard.memberships.get(user_id=leaderboard.owner_id)
+        assert owner_membership.rank == 2
+
+    def test_pop_dirty_leaderboard_ranking_ids(self, leaderboard):
+        pop_dirty_leaderboard_ranking_ids()
+
+        mark_leaderboard_ranking_dirty(leaderboard.id)
+        assert pop_dirty_leaderboard_ranking_ids() == [leaderboard.id]
+        assert pop_dirty_leaderboard_ranking_ids() == []
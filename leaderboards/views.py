@@ -23,11 +23,13 @@ from leaderboards.services import (
     create_leaderboard,
     create_membership,
     delete_membership,
+    get_leaderboard_ranking_member_rank,
+    get_top_memberships,
 )
 from profiles.enums import AllowedBeatmapStatus, ScoreSet
 from profiles.models import Score, ScoreFilter
 from profiles.serialisers import BeatmapScoreSerialiser, UserScoreSerialiser
-from profiles.tasks import update_user
+from profiles.tasks import run_update_user
 
 
 class LeaderboardList(APIView):
@@ -357,13 +359,8 @@ class LeaderboardMemberList(APIView):
         except Leaderboard.DoesNotExist:
             raise NotFound("Leaderboard not found.")
 
-        memberships = (
-            Membership.objects.non_restricted()
-            .filter(leaderboard_id=leaderboard.id)
-            .select_related("user")
-            .order_by("-pp")
-        )
-        serialiser = LeaderboardMembershipSerialiser(memberships[:100], many=True)
+        memberships = get_top_memberships(leaderboard, limit=100)
+        serialiser = LeaderboardMembershipSerialiser(memberships, many=True)
         return Response(serialiser.data)
 
     def post(self, request, leaderboard_type, gamemode, leaderboard_id):
@@ -420,6 +417,10 @@ class LeaderboardMemberDetail(APIView):
         except Membership.DoesNotExist:
             raise NotFound("Membership not found.")
 
+        rank = get_leaderboard_ranking_member_rank(leaderboard.id, membership.user_id)
+        if rank is not None:
+            membership.rank = rank
+
         serialiser = LeaderboardMembershipSerialiser(membership)
         return Response(serialiser.data)
 
@@ -508,7 +509,9 @@ class LeaderboardInviteList(APIView):
                 invite = leaderboard.invites.get(user_id=invitee_id)
             except Invite.DoesNotExist:
                 # update profile to ensure they are in the database
-                update_user(user_id=invitee_id, gamemode=gamemode)
+                run_update_user(
+                    user_id=invitee_id, gamemode=gamemode, wait_for_in_flight=True
+                )
 
                 invite = Invite(
                     user_id=invitee_id, leaderboard_id=leaderboard_id, message=message
@@ -16,6 +16,7 @@ from minigames.models import (
 )
 from profiles.enums import ScoreMutation
 from profiles.models import OsuUser, Score
+from profiles.services import invalidate_score_impact_contexts, refresh_tracked_users
 
 
 @transaction.atomic
@@ -97,13 +98,18 @@ def join_minigame(minigame: Minigame, user: OsuUser) -> MinigamePlayer:
             .first()
         )
 
-    return MinigamePlayer.objects.create(
+    player = MinigamePlayer.objects.create(
         team=team,
         user=user,
         points=0,
         score_count=0,
     )
 
+    transaction.on_commit(lambda: refresh_tracked_users([user.id]))
+    transaction.on_commit(invalidate_score_impact_contexts)
+
+    return player
+
 
 @transaction.atomic
 def leave_minigame(minigame: Minigame, user: OsuUser) -> None:
@@ -120,6 +126,8 @@ def leave_minigame(minigame: Minigame, user: OsuUser) -> None:
     else:
         MinigamePlayer.objects.filter(team__minigame=minigame, user=user).delete()
 
+    transaction.on_commit(lambda: refresh_tracked_users([user.id]))
+
     if minigame.status == MinigameStatus.WAITING_TO_START:
         populated_teams = (
             minigame.teams.annotate(player_count=Count("players"))
@@ -196,8 +204,15 @@ def delete_minigame(minigame: Minigame) -> None:
     Delete a minigame lobby.
     """
     assert minigame.status == MinigameStatus.LOBBY, "Game must be in lobby status"
+    player_user_ids = list(
+        MinigamePlayer.objects.filter(team__minigame=minigame).values_list(
+            "user_id", flat=True
+        )
+    )
     minigame.delete()
 
+    transaction.on_commit(lambda: refresh_tracked_users(player_user_ids))
+
 
 @transaction.atomic
 def start_minigame(minigame: Minigame, countdown: int) -> Minigame:
@@ -226,6 +241,7 @@ def start_minigame(minigame: Minigame, countdown: int) -> Minigame:
     minigame.state = initial_state
     minigame.status = MinigameStatus.WAITING_TO_START
     minigame.save()
+    transaction.on_commit(invalidate_score_impact_contexts)
     return minigame
 
 
@@ -446,6 +462,14 @@ def finish_minigame(minigame: Minigame) -> Minigame:
     """
     Finalise a minigame and declare the winner.
     """
+    # Players of a finished minigame may no longer need their streamed scores ingested
+    player_user_ids = list(
+        MinigamePlayer.objects.filter(team__minigame=minigame).values_list(
+            "user_id", flat=True
+        )
+    )
+    transaction.on_commit(lambda: refresh_tracked_users(player_user_ids))
+
     if minigame.winning_team is not None:
         minigame.status = MinigameStatus.FINISHED
         minigame.save(update_fields=["status"])
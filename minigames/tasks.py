@@ -58,17 +58,15 @@ def update_minigame(minigame_id: int):
 
         if len(unfinalised_player_ids) > 0:
             # TODO: fix circular import
-            from profiles.tasks import update_user_recent
+            from profiles.tasks import enqueue_update_user_recent
 
             for user_id in unfinalised_player_ids:
                 assert minigame.end_time is not None, "Minigame must have an end time"
                 time_since_race_end = datetime.now(tz=timezone.utc) - minigame.end_time
-                update_user_recent.apply_async(
-                    kwargs={
-                        "user_id": user_id,
-                        "gamemode": minigame.gamemode,
-                        "cooldown_seconds": time_since_race_end.total_seconds(),
-                    },
+                enqueue_update_user_recent(
+                    user_id=user_id,
+                    gamemode=minigame.gamemode,
+                    cooldown_seconds=time_since_race_end.total_seconds(),
                     priority=1,
                 )
         else:
@@ -79,18 +77,16 @@ def update_minigame(minigame_id: int):
 def trigger_minigame_player_updates(minigame_id: int) -> None:
     """Dispatch score fetch tasks for players in a running minigame."""
     # TODO: fix circular import
-    from profiles.tasks import update_user_recent
+    from profiles.tasks import enqueue_update_user_recent
 
     minigame = Minigame.objects.get(id=minigame_id)
     for team in minigame.teams.all():
         if team.is_small_team():
             for player in team.players.all():
-                update_user_recent.apply_async(
-                    kwargs={
-                        "user_id": player.user_id,
-                        "gamemode": minigame.gamemode,
-                        "cooldown_seconds": 30,
-                    },
+                enqueue_update_user_recent(
+                    user_id=player.user_id,
+                    gamemode=minigame.gamemode,
+                    cooldown_seconds=30,
                     priority=1,
                 )
             continue
@@ -105,12 +101,10 @@ def trigger_minigame_player_updates(minigame_id: int) -> None:
             if user_stats.scores.filter(
                 date__gte=datetime.now(tz=timezone.utc) - timedelta(minutes=10)
             ).exists():
-                update_user_recent.apply_async(
-                    kwargs={
-                        "user_id": player.user_id,
-                        "gamemode": minigame.gamemode,
-                        "cooldown_seconds": 30,
-                    },
+                enqueue_update_user_recent(
+                    user_id=player.user_id,
+                    gamemode=minigame.gamemode,
+                    cooldown_seconds=30,
                     priority=1,
                 )
                 continue
@@ -118,12 +112,10 @@ def trigger_minigame_player_updates(minigame_id: int) -> None:
             if user_stats.last_updated < datetime.now(tz=timezone.utc) - timedelta(
                 minutes=5
             ):
-                update_user_recent.apply_async(
-                    kwargs={
-                        "user_id": player.user_id,
-                        "gamemode": minigame.gamemode,
-                        "cooldown_seconds": 30,
-                    },
+                enqueue_update_user_recent(
+                    user_id=player.user_id,
+                    gamemode=minigame.gamemode,
+                    cooldown_seconds=30,
                     priority=1,
                 )
                 continue
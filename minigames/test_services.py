@@ -1,6 +1,7 @@
 from datetime import datetime, timezone
 
 import pytest
+from django_redis import get_redis_connection
 
 from common.osu.enums import BeatmapStatus, Gamemode
 from minigames.enums import MinigameStatus
@@ -15,6 +16,8 @@ from minigames.models import (
 from minigames.services import (
     create_minigame,
     finish_minigame,
+    join_minigame,
+    leave_minigame,
     recompute_minigame,
     start_minigame,
     update_minigame_player_scores,
@@ -22,6 +25,7 @@ from minigames.services import (
 )
 from profiles.enums import ScoreMutation, ScoreResult
 from profiles.models import Beatmap, OsuUser, Score, UserStats
+from profiles.services import get_tracked_user_ids_key
 
 
 @pytest.fixture
@@ -220,6 +224,32 @@ class TestFinishMinigame:
         assert minigame.winning_team is None
 
 
+@pytest.mark.django_db
+class TestMinigamePlayerTracking:
+    def test_join_and_leave_minigame_updates_tracked_users(
+        self, lobby_minigame, django_capture_on_commit_callbacks
+    ):
+        new_user = OsuUser.objects.create(
+            id=3,
+            username="ThirdOsuUser",
+            country="au",
+            join_date=datetime(2023, 1, 1, tzinfo=timezone.utc),
+            disabled=False,
+        )
+        redis = get_redis_connection()
+        tracked_user_ids_key = get_tracked_user_ids_key(Gamemode.STANDARD)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            join_minigame(lobby_minigame, new_user)
+        assert redis.sismember(tracked_user_ids_key, new_user.id)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            leave_minigame(lobby_minigame, new_user)
+        assert not redis.sismember(tracked_user_ids_key, new_user.id)
+
+        redis.delete(tracked_user_ids_key)
+
+
 @pytest.mark.django_db
 class TestCreateMinigame:
     def test_battle_royale_no_beatmaps_no_available_maps_raises(self, osu_user):
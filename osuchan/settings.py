@@ -27,6 +27,10 @@ class EnvSettings(BaseSettings):
     CELERY_REDIS_PORT: str
     DIFFICALCY_HOST: str
     DIFFICALCY_PERFORMANCEPLUS_HOST: str
+    DIFFICALCY_MAX_CONCURRENT_REQUESTS: int = 4
+    USE_STUB_DIFFICULTY_CALCULATOR: bool = False
+    STUB_DIFFICULTY_CALCULATOR_VERSION: str = "1.0.0"
+    STUB_DIFFICULTY_CALCULATOR_LATENCY: float = 0
     OSU_CLIENT_ID: str
     OSU_CLIENT_SECRET: str
     OSU_CLIENT_REDIRECT_URI: str
@@ -233,6 +237,10 @@ CELERY_BEAT_SCHEDULE = {
             "cooldown_seconds": timedelta(hours=12).total_seconds(),
         },
     },
+    "rebuild-known-users-every-day": {
+        "task": "profiles.tasks.rebuild_known_users",
+        "schedule": crontab(minute="0", hour="1"),  # 1am UTC
+    },
     "update-loved-beatmaps-every-month": {
         "task": "profiles.tasks.update_loved_beatmaps",
         "schedule": crontab(minute="0", hour="0", day_of_month="1"),
@@ -245,6 +253,10 @@ CELERY_BEAT_SCHEDULE = {
         "task": "profiles.tasks.ingest_recent_scores",
         "schedule": timedelta(seconds=10),
     },
+    "reconcile-tracked-users-every-minute": {
+        "task": "profiles.tasks.reconcile_tracked_users",
+        "schedule": timedelta(minutes=1),
+    },
     "update-minigames-every-minute": {
         "task": "minigames.tasks.dispatch_minigame_updates",
         "schedule": timedelta(seconds=10),
@@ -257,6 +269,14 @@ CELERY_BEAT_SCHEDULE = {
         "task": "events.tasks.dispatch_update_all_current_event_active_attendees",
         "schedule": crontab(minute="*/5"),  # every 5 minutes
     },
+    "refresh-difficulty-calculators-info-every-10-minutes": {
+        "task": "profiles.tasks.refresh_difficulty_calculators_info",
+        "schedule": crontab(minute="*/10"),  # every 10 minutes
+    },
+    "sync-leaderboard-ranks-every-5-minutes": {
+        "task": "leaderboards.tasks.sync_all_leaderboard_ranks",
+        "schedule": crontab(minute="*/5"),  # every 5 minutes
+    },
     "update-event-stats-every-10-minutes": {
         "task": "events.tasks.dispatch_update_all_current_event_stats",
         "schedule": crontab(minute="*/10"),  # every 10 minutes
@@ -375,25 +395,46 @@ else:
 
 # Difficulty calculation
 
-DIFFICULTY_CALCULATOR_CLASSES = {
-    "difficalcy-osu": "common.osu.difficultycalculator.DifficalcyOsuDifficultyCalculator",
-    "difficalcy-taiko": "common.osu.difficultycalculator.DifficalcyTaikoDifficultyCalculator",
-    "difficalcy-catch": "common.osu.difficultycalculator.DifficalcyCatchDifficultyCalculator",
-    "difficalcy-mania": "common.osu.difficultycalculator.DifficalcyManiaDifficultyCalculator",
-    "difficalcy-performanceplus": "common.osu.difficultycalculator.DifficalcyPerformancePlusDifficultyCalculator",
-}
+if env_settings.USE_STUB_DIFFICULTY_CALCULATOR:
+    DIFFICULTY_CALCULATOR_CLASSES = {
+        "stub-osu": "common.osu.difficultycalculator.StubOsuDifficultyCalculator",
+        "stub-taiko": "common.osu.difficultycalculator.StubTaikoDifficultyCalculator",
+        "stub-catch": "common.osu.difficultycalculator.StubCatchDifficultyCalculator",
+        "stub-mania": "common.osu.difficultycalculator.StubManiaDifficultyCalculator",
+    }
 
-DEFAULT_DIFFICULTY_CALCULATORS = {
-    Gamemode.STANDARD: "difficalcy-osu",
-    Gamemode.TAIKO: "difficalcy-taiko",
-    Gamemode.CATCH: "difficalcy-catch",
-    Gamemode.MANIA: "difficalcy-mania",
-}
+    DEFAULT_DIFFICULTY_CALCULATORS = {
+        Gamemode.STANDARD: "stub-osu",
+        Gamemode.TAIKO: "stub-taiko",
+        Gamemode.CATCH: "stub-catch",
+        Gamemode.MANIA: "stub-mania",
+    }
+else:
+    DIFFICULTY_CALCULATOR_CLASSES = {
+        "difficalcy-osu": "common.osu.difficultycalculator.DifficalcyOsuDifficultyCalculator",
+        "difficalcy-taiko": "common.osu.difficultycalculator.DifficalcyTaikoDifficultyCalculator",
+        "difficalcy-catch": "common.osu.difficultycalculator.DifficalcyCatchDifficultyCalculator",
+        "difficalcy-mania": "common.osu.difficultycalculator.DifficalcyManiaDifficultyCalculator",
+        "difficalcy-performanceplus": "common.osu.difficultycalculator.DifficalcyPerformancePlusDifficultyCalculator",
+    }
+
+    DEFAULT_DIFFICULTY_CALCULATORS = {
+        Gamemode.STANDARD: "difficalcy-osu",
+        Gamemode.TAIKO: "difficalcy-taiko",
+        Gamemode.CATCH: "difficalcy-catch",
+        Gamemode.MANIA: "difficalcy-mania",
+    }
 
 DIFFICALCY_URL = f"http://{env_settings.DIFFICALCY_HOST}"
 DIFFICALCY_PERFORMANCEPLUS_URL = (
     f"http://{env_settings.DIFFICALCY_PERFORMANCEPLUS_HOST}"
 )
+# calculation requests to keep in flight per calculator, scale with the number of difficalcy replicas
+DIFFICALCY_MAX_CONCURRENT_REQUESTS = env_settings.DIFFICALCY_MAX_CONCURRENT_REQUESTS
+
+# stub calculator version can be changed to simulate calculator updates, and latency (seconds per request) to simulate difficalcy
+STUB_DIFFICULTY_CALCULATOR_VERSION = env_settings.STUB_DIFFICULTY_CALCULATOR_VERSION
+STUB_DIFFICULTY_CALCULATOR_LATENCY = env_settings.STUB_DIFFICULTY_CALCULATOR_LATENCY
 
 
 # Error reporting
@@ -9,6 +9,7 @@ from ppraces.enums import PPRaceStatus
 from ppraces.models import PPRace, PPRacePlayer, PPRaceScore, PPRaceTeam
 from profiles.enums import ScoreSet
 from profiles.models import Score
+from profiles.services import invalidate_score_impact_contexts
 
 
 @transaction.atomic
@@ -37,6 +38,7 @@ def create_pprace_lobby(
             PPRacePlayer.objects.create(
                 user_id=player_id, team=team, pp=0, pp_contribution=0, score_count=0
             )
+    transaction.on_commit(invalidate_score_impact_contexts)
     return pprace
 
 
@@ -167,6 +169,7 @@ def start_pprace(pprace: PPRace, race_length: int, countdown: int) -> PPRace:
     pprace.end_time = pprace.start_time + timedelta(seconds=race_length)
     pprace.status = PPRaceStatus.WAITING_TO_START
     pprace.save()
+    transaction.on_commit(invalidate_score_impact_contexts)
     return pprace
 
 
@@ -185,4 +188,5 @@ def add_player_to_team(team: PPRaceTeam, user_id: int) -> tuple[PPRacePlayer, bo
             pp_contribution=0,
             score_count=0,
         )
+        transaction.on_commit(invalidate_score_impact_contexts)
         return player, True
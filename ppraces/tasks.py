@@ -44,7 +44,7 @@ def update_pprace(pprace_id: int):
     update_pprace_status(pprace)
 
     # TODO: fix circular import
-    from profiles.tasks import update_user_recent
+    from profiles.tasks import enqueue_update_user_recent
 
     if pprace.status == PPRaceStatus.IN_PROGRESS:
         for team in pprace.teams.all():
@@ -52,12 +52,10 @@ def update_pprace(pprace_id: int):
 
             if team.is_small_team():
                 for player in team.players.all():
-                    update_user_recent.apply_async(
-                        kwargs={
-                            "user_id": player.user_id,
-                            "gamemode": pprace.gamemode,
-                            "cooldown_seconds": 30,
-                        },
+                    enqueue_update_user_recent(
+                        user_id=player.user_id,
+                        gamemode=pprace.gamemode,
+                        cooldown_seconds=30,
                         priority=1,
                     )
                 continue
@@ -72,7 +70,7 @@ def update_pprace(pprace_id: int):
                 if user_stats.scores.filter(
                     date__gte=datetime.now(tz=timezone.utc) - timedelta(minutes=10)
                 ).exists():
-                    update_user_recent.delay(
+                    enqueue_update_user_recent(
                         user_id=player.user_id,
                         gamemode=pprace.gamemode,
                         cooldown_seconds=30,
@@ -82,7 +80,7 @@ def update_pprace(pprace_id: int):
                 if user_stats.last_updated < datetime.now(tz=timezone.utc) - timedelta(
                     minutes=5
                 ):
-                    update_user_recent.delay(
+                    enqueue_update_user_recent(
                         user_id=player.user_id, gamemode=pprace.gamemode
                     )
                     continue
@@ -97,12 +95,10 @@ def update_pprace(pprace_id: int):
         for user_id in unfinalised_player_ids:
             assert pprace.end_time is not None, "PPRace must have an end time"
             time_since_race_end = datetime.now(tz=timezone.utc) - pprace.end_time
-            update_user_recent.apply_async(
-                kwargs={
-                    "user_id": user_id,
-                    "gamemode": pprace.gamemode,
-                    "cooldown_seconds": time_since_race_end.total_seconds(),
-                },
+            enqueue_update_user_recent(
+                user_id=user_id,
+                gamemode=pprace.gamemode,
+                cooldown_seconds=time_since_race_end.total_seconds(),
                 priority=1,
             )
 
@@ -14,7 +14,7 @@ from ppraces.serialisers import (
 )
 from ppraces.services import create_pprace_lobby, start_pprace
 from ppraces.tasks import update_pprace_players
-from profiles.tasks import update_user_recent
+from profiles.tasks import run_update_user_recent
 
 
 class PPRaceList(APIView):
@@ -203,7 +203,9 @@ class PPRacePlayerTriggerUpdate(APIView):
         except ValueError:
             raise ParseError("Invalid gamemode parameter.")
 
-        update_user_recent(user_id, gamemode, cooldown_seconds=0)
+        run_update_user_recent(
+            user_id, gamemode, cooldown_seconds=0, wait_for_in_flight=True
+        )
         update_pprace_players(user_id=user_id, gamemode=gamemode)
 
         return Response({"status": "success"})
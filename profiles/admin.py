@@ -10,6 +10,7 @@ from profiles.models import (
     OsuUser,
     PerformanceCalculation,
     PerformanceValue,
+    PoisonCalculation,
     Score,
     ScoreFilter,
     UserStats,
@@ -213,6 +214,19 @@ class PerformanceValueAdmin(admin.ModelAdmin):
         return obj.calculation.calculator_version
 
 
+class PoisonCalculationAdmin(admin.ModelAdmin):
+    model = PoisonCalculation
+
+    list_display = [
+        "id",
+        "beatmap_id",
+        "mods_json",
+        "calculator_engine",
+        "calculator_version",
+    ]
+    list_filter = ["calculator_engine"]
+
+
 admin.site.register(OsuUser, OsuUserAdmin)
 admin.site.register(UserStats, UserStatsAdmin)
 admin.site.register(Beatmap, BeatmapAdmin)
@@ -221,4 +235,5 @@ admin.site.register(DifficultyValue, DifficultyValueAdmin)
 admin.site.register(Score, ScoreAdmin)
 admin.site.register(PerformanceCalculation, PerformanceCalculationAdmin)
 admin.site.register(PerformanceValue, PerformanceValueAdmin)
+admin.site.register(PoisonCalculation, PoisonCalculationAdmin)
 admin.site.register(ScoreFilter)
@@ -1,6 +1,6 @@
 # profiles related enums
 
-from enum import IntEnum
+from enum import IntEnum, StrEnum
 
 
 class ScoreResult(IntEnum):
@@ -30,3 +30,8 @@ class AllowedBeatmapStatus(IntEnum):
 class ScoreMutation(IntEnum):
     NONE = 0
     NO_CHOKE = 1
+
+
+class UserRefreshKind(StrEnum):
+    FULL = "full"
+    RECENT = "recent"
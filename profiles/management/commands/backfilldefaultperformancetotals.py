@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db.models import OuterRef, Subquery
+from tqdm import tqdm
+
+from common.osu.difficultycalculator import get_default_difficulty_calculator_class
+from common.osu.enums import Gamemode
+from profiles.models import PerformanceValue, Score
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfills the denormalised default calculator performance totals of all scores"
+    )
+
+    def handle(self, *args, **options):
+        self.backfill_default_performance_totals(Gamemode.STANDARD)
+        self.backfill_default_performance_totals(Gamemode.TAIKO)
+        self.backfill_default_performance_totals(Gamemode.CATCH)
+        self.backfill_default_performance_totals(Gamemode.MANIA)
+
+        self.stdout.write(
+            self.style.SUCCESS("Default performance totals backfilled successfully.")
+        )
+
+    def backfill_default_performance_totals(self, gamemode: Gamemode):
+        calculator_engine = get_default_difficulty_calculator_class(gamemode).engine()
+        scores = Score.objects.filter(gamemode=gamemode)
+        score_ids = list(scores.order_by("pk").values_list("pk", flat=True))
+
+        with tqdm(desc=gamemode.name, total=len(score_ids)) as pbar:
+            for i in range(0, len(score_ids), 10000):
+                page_ids = score_ids[i : i + 10000]
+                scores.filter(pk__in=page_ids).update(
+                    default_performance_total=Subquery(
+                        PerformanceValue.objects.filter(
+                            calculation__score_id=OuterRef("pk"),
+                            calculation__calculator_engine=calculator_engine,
+                            name="total",
+                        ).values("value")[:1]
+                    )
+                )
+                pbar.update(len(page_ids))
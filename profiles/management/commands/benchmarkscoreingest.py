@@ -0,0 +1,82 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from common.osu.difficultycalculator import get_default_difficulty_calculator_class
+from common.osu.enums import Gamemode
+from common.osu.osuapi import OsuApi
+from profiles.services import (
+    build_scores_from_data,
+    fetch_user,
+    prepare_performance_calculations,
+    refresh_user_from_api,
+)
+
+
+class Command(BaseCommand):
+    help = "Benchmarks building and calculating a large batch of scores through the ingest path, without saving them. Intended for use with the stub osu api"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user-id",
+            type=int,
+            help="User to build scores for",
+            default=5701575,
+        )
+        parser.add_argument(
+            "--scores",
+            type=int,
+            help="Number of scores to feed through, half of them duplicates",
+            default=10000,
+        )
+
+    def handle(self, *args, **options):
+        gamemode = Gamemode.STANDARD
+
+        user_stats = fetch_user(user_id=options["user_id"], gamemode=gamemode)
+        if user_stats is None:
+            user_stats, _ = refresh_user_from_api(
+                user_id=options["user_id"], gamemode=gamemode
+            )
+        if user_stats is None:
+            self.stderr.write(f"User {options['user_id']} not found")
+            return
+
+        osu_api = OsuApi()
+        template_scores = [
+            score
+            for score in osu_api.get_user_best_scores(user_stats.user_id, gamemode)
+            + osu_api.get_recent_scores().scores
+            if score.gamemode == gamemode
+        ]
+        if len(template_scores) == 0:
+            self.stderr.write("No stub scores to use as templates")
+            return
+
+        # Each score appears twice, as a top play also being a recent play would
+        latest_score_date = max(score.date for score in template_scores)
+        score_data_list = [
+            template_scores[(i // 2) % len(template_scores)]._replace(
+                user_id=user_stats.user_id,
+                date=latest_score_date + timedelta(seconds=i // 2 + 1),
+            )
+            for i in range(options["scores"])
+        ]
+
+        start_time = time.perf_counter()
+        scores = build_scores_from_data(user_stats, score_data_list)
+        build_seconds = time.perf_counter() - start_time
+
+        difficulty_calculator_class = get_default_difficulty_calculator_class(gamemode)
+        start_time = time.perf_counter()
+        with difficulty_calculator_class() as difficulty_calculator:
+            prepare_performance_calculations(scores, difficulty_calculator)
+        calculate_seconds = time.perf_counter() - start_time
+
+        self.stdout.write(
+            f"built {len(scores)} scores from {len(score_data_list)} score data in {build_seconds:.3f}s"
+        )
+        self.stdout.write(
+            f"calculated {len(scores)} scores with {difficulty_calculator_class.engine()} in {calculate_seconds:.3f}s"
+        )
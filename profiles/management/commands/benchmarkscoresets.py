@@ -0,0 +1,69 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from common.osu.difficultycalculator import get_default_difficulty_calculator_class
+from common.osu.enums import Gamemode
+from profiles.enums import ScoreSet
+from profiles.models import Score, UserStats
+
+
+class Command(BaseCommand):
+    help = "Benchmarks score set queries using the denormalised default performance totals against joining through the calculations"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--gamemode",
+            type=int,
+            help="Gamemode to benchmark score sets for",
+            choices=[Gamemode.STANDARD, Gamemode.TAIKO, Gamemode.CATCH, Gamemode.MANIA],
+            default=Gamemode.STANDARD,
+        )
+        parser.add_argument(
+            "--users",
+            type=int,
+            help="Number of users (with the highest playcount) to get score sets for",
+            default=100,
+        )
+
+    def handle(self, *args, **options):
+        gamemode = Gamemode(options["gamemode"])
+        calculator_engine = get_default_difficulty_calculator_class(gamemode).engine()
+
+        user_stats_ids = list(
+            UserStats.objects.filter(gamemode=gamemode)
+            .order_by("-playcount")
+            .values_list("id", flat=True)[: options["users"]]
+        )
+
+        def get_denormalised_score_set(user_stats_id: int):
+            return Score.objects.filter(user_stats_id=user_stats_id).get_score_set(
+                gamemode, ScoreSet.NORMAL
+            )
+
+        def get_joined_score_set(user_stats_id: int):
+            # equivalent to get_score_set before the denormalised totals
+            scores = Score.objects.filter(
+                user_stats_id=user_stats_id, gamemode=gamemode
+            ).filter_mutations()
+            annotated_scores = scores.annotate_performance_total(calculator_engine)
+            return annotated_scores.filter(
+                id__in=annotated_scores.order_by("beatmap_id", "-performance_total")
+                .distinct("beatmap_id")
+                .values("id")
+            ).order_by("-performance_total", "date")
+
+        for name, get_score_set in [
+            ("joined calculations", get_joined_score_set),
+            ("denormalised totals", get_denormalised_score_set),
+        ]:
+            start_time = time.perf_counter()
+            for user_stats_id in user_stats_ids:
+                list(
+                    get_score_set(user_stats_id)[:100].values("id", "performance_total")
+                )
+            elapsed_seconds = time.perf_counter() - start_time
+
+            self.stdout.write(
+                f"{name}: {elapsed_seconds:.3f}s total, {elapsed_seconds / max(len(user_stats_ids), 1) * 1000:.1f}ms per user over {len(user_stats_ids)} users"
+            )
@@ -150,7 +150,9 @@ class Command(BaseCommand):
             with tqdm(desc="Scores", total=scores.count(), smoothing=0) as pbar:
                 for page in paginator:
                     try:
-                        update_performance_calculations(page, difficulty_calculator)
+                        update_performance_calculations(
+                            page, difficulty_calculator, force=True
+                        )
                     except CalculationException as e:
                         ErrorReporter().report_error(e)
                         pbar.write(
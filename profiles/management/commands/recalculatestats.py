@@ -4,8 +4,8 @@ from django.db.models import QuerySet
 from tqdm import tqdm
 
 from common.osu.enums import Gamemode
-from leaderboards.models import Membership
-from leaderboards.services import update_membership
+from leaderboards.models import Leaderboard
+from leaderboards.services import recalculate_leaderboard
 from profiles.models import UserStats
 
 
@@ -29,10 +29,8 @@ class Command(BaseCommand):
         self.recalculate_user_stats(all_user_stats)
 
         # Recalculate memberships
-        memberships = Membership.objects.select_related("leaderboard").filter(
-            leaderboard__gamemode=gamemode
-        )
-        self.recalculate_memberships(memberships)
+        leaderboards = Leaderboard.objects.filter(gamemode=gamemode)
+        self.recalculate_memberships(leaderboards)
 
     def recalculate_user_stats(
         self,
@@ -66,23 +64,18 @@ class Command(BaseCommand):
 
     def recalculate_memberships(
         self,
-        memberships: QuerySet[Membership],
+        leaderboards: QuerySet[Leaderboard],
     ):
-        paginator = Paginator(memberships.order_by("pk"), per_page=2000)
-
-        with tqdm(desc="Memberships", total=memberships.count(), smoothing=0) as pbar:
-            for page in paginator:
-                for membership in page:
-                    update_membership(
-                        membership.leaderboard,
-                        membership.user_id,
-                        skip_notifications=True,
-                    )
-                    pbar.update()
-                Membership.objects.bulk_update(page, ["pp"])
+        for leaderboard in tqdm(
+            leaderboards.select_related("score_filter").order_by("pk"),
+            desc="Leaderboards",
+            total=leaderboards.count(),
+            smoothing=0,
+        ):
+            recalculate_leaderboard(leaderboard)
 
         self.stdout.write(
             self.style.SUCCESS(
-                f"Successfully updated {memberships.count()} memberships"
+                f"Successfully updated memberships of {leaderboards.count()} leaderboards"
             )
         )
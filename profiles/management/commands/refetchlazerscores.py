@@ -5,7 +5,7 @@ from tqdm import tqdm
 
 from common.osu.enums import Gamemode
 from profiles.models import UserStats
-from profiles.services import fetch_scores
+from profiles.services import fetch_scores, update_user_beatmap_bests
 
 
 class Command(BaseCommand):
@@ -30,5 +30,8 @@ class Command(BaseCommand):
                 .distinct()
             )
             stats.scores.filter(beatmap_id__in=beatmap_ids, is_stable=False).delete()
+            update_user_beatmap_bests(
+                (stats.id, beatmap_id) for beatmap_id in beatmap_ids
+            )
 
             fetch_scores(stats.user_id, beatmap_ids, gamemode)
@@ -0,0 +1,25 @@
+# Generated by Django 6.0.9 on 2026-10-17 00:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("profiles", "0030_alter_beatmap_approval_date"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PoisonCalculation",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("key", models.CharField(unique=True)),
+                ("beatmap_id", models.IntegerField()),
+                ("mods_json", models.JSONField()),
+                ("calculator_engine", models.CharField()),
+                ("calculator_version", models.CharField()),
+                ("error", models.TextField()),
+            ],
+        ),
+    ]
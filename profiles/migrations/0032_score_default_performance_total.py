@@ -0,0 +1,27 @@
+# Generated by Django 6.0.9 on 2026-10-17 00:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("profiles", "0031_poisoncalculation"),
+    ]
+
+    operations = [
+        # existing scores are backfilled by the backfilldefaultperformancetotals command,
+        #   since resolving the default calculator engines needs difficalcy
+        migrations.AddField(
+            model_name="score",
+            name="default_performance_total",
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="score",
+            index=models.Index(
+                fields=["default_performance_total"],
+                name="profiles_sc_default_808ab9_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,141 @@
+# Generated by Django 6.0.9 on 2026-10-17 00:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Max
+
+BACKFILL_BATCH_SIZE = 1000
+
+# ScoreSet values to the ScoreMutation values they include, frozen as of this migration
+SCORE_SET_MUTATIONS = {
+    0: [0],  # NORMAL: NONE
+    1: [0, 1],  # NEVER_CHOKE: NONE, NO_CHOKE
+}
+
+
+def backfill_user_beatmap_bests(apps, schema_editor):
+    UserStats = apps.get_model("profiles", "UserStats")
+    PerformanceValue = apps.get_model("profiles", "PerformanceValue")
+    UserBeatmapBest = apps.get_model("profiles", "UserBeatmapBest")
+
+    max_user_stats_id = UserStats.objects.aggregate(max_id=Max("pk"))["max_id"]
+    if max_user_stats_id is None:
+        return
+
+    # Batches of users are committed as they go (the migration is non-atomic)
+    for start_id in range(0, max_user_stats_id + 1, BACKFILL_BATCH_SIZE):
+        for score_set, mutations in SCORE_SET_MUTATIONS.items():
+            best_values = (
+                PerformanceValue.objects.filter(
+                    name="total",
+                    calculation__score__user_stats_id__gte=start_id,
+                    calculation__score__user_stats_id__lt=start_id
+                    + BACKFILL_BATCH_SIZE,
+                    calculation__score__mutation__in=mutations,
+                )
+                .order_by(
+                    "calculation__score__user_stats_id",
+                    "calculation__score__beatmap_id",
+                    "calculation__calculator_engine",
+                    "-value",
+                    "calculation__score__date",
+                    "calculation__score_id",
+                )
+                .distinct(
+                    "calculation__score__user_stats_id",
+                    "calculation__score__beatmap_id",
+                    "calculation__calculator_engine",
+                )
+                .values_list(
+                    "calculation__score__user_stats_id",
+                    "calculation__score__beatmap_id",
+                    "calculation__score_id",
+                    "calculation__calculator_engine",
+                    "value",
+                )
+            )
+
+            UserBeatmapBest.objects.bulk_create(
+                [
+                    UserBeatmapBest(
+                        user_stats_id=user_stats_id,
+                        beatmap_id=beatmap_id,
+                        score_id=score_id,
+                        score_set=score_set,
+                        calculator_engine=calculator_engine,
+                        performance_total=value,
+                    )
+                    for user_stats_id, beatmap_id, score_id, calculator_engine, value in best_values
+                ],
+                batch_size=BACKFILL_BATCH_SIZE,
+                ignore_conflicts=True,
+            )
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("profiles", "0032_score_default_performance_total"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserBeatmapBest",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("score_set", models.IntegerField()),
+                ("calculator_engine", models.CharField()),
+                ("performance_total", models.FloatField()),
+                (
+                    "beatmap",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="user_bests",
+                        to="profiles.beatmap",
+                    ),
+                ),
+                (
+                    "score",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="beatmap_bests",
+                        to="profiles.score",
+                    ),
+                ),
+                (
+                    "user_stats",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="beatmap_bests",
+                        to="profiles.userstats",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=[
+                            "user_stats",
+                            "score_set",
+                            "calculator_engine",
+                            "-performance_total",
+                        ],
+                        name="profiles_us_user_st_659968_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=(
+                            "user_stats_id",
+                            "beatmap_id",
+                            "score_set",
+                            "calculator_engine",
+                        ),
+                        name="unique_user_beatmap_best",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_user_beatmap_bests, migrations.RunPython.noop),
+    ]
@@ -85,6 +85,17 @@ class UserStats(models.Model):
 
     objects = UserStatsQuerySet.as_manager()
 
+    # fields set by recalculate
+    RECALCULATED_FIELDS = [
+        "extra_pp",
+        "score_style_accuracy",
+        "score_style_bpm",
+        "score_style_length",
+        "score_style_cs",
+        "score_style_ar",
+        "score_style_od",
+    ]
+
     def recalculate(self):
         """
         Calculates pp totals (extra pp, nochoke pp) and scores style using unique maps
@@ -196,7 +207,7 @@ class Beatmap(models.Model):
     )
 
     @classmethod
-    def from_data(cls, beatmap_data: BeatmapData):
+    def from_data(cls, beatmap_data: BeatmapData, hitobject_counts: dict[str, int]):
         beatmap = cls(id=beatmap_data.beatmap_id)
 
         beatmap.set_id = beatmap_data.set_id
@@ -224,14 +235,7 @@ class Beatmap(models.Model):
         beatmap.last_updated = beatmap_data.last_updated
         beatmap.approval_date = beatmap_data.approval_date
 
-        # TODO: refactor this so we aren't intantiating a new calc for every beatmap
-        difficulty_calculator = get_default_difficulty_calculator_class(
-            Gamemode(beatmap.gamemode)
-        )()
-        beatmap_details = difficulty_calculator.get_beatmap_details(
-            str(beatmap_data.beatmap_id)
-        )
-        beatmap.hitobject_counts = beatmap_details.hitobject_counts
+        beatmap.hitobject_counts = hitobject_counts
 
         return beatmap
 
@@ -331,6 +335,39 @@ class DifficultyValue(models.Model):
         indexes = [models.Index(fields=["value"])]
 
 
+class PoisonCalculation(models.Model):
+    """
+    Model representing a calculation that fails in a calculator version, to be skipped until the version changes
+    """
+
+    id = models.BigAutoField(primary_key=True)
+
+    # hash of the calculator engine, version and calculation inputs
+    key = models.CharField(unique=True)
+
+    beatmap_id = models.IntegerField()
+    mods_json = models.JSONField()
+    calculator_engine = models.CharField()
+    calculator_version = models.CharField()
+
+    error = models.TextField()
+
+    def __str__(self):
+        return f"{self.beatmap_id} {self.mods_json}: {self.calculator_engine} ({self.calculator_version})"
+
+
+def get_score_set_mutations(score_set: ScoreSet) -> list[ScoreMutation]:
+    """
+    Returns the score mutations which make up the passed score set.
+    """
+    if score_set == ScoreSet.NORMAL:
+        return [ScoreMutation.NONE]
+    elif score_set == ScoreSet.NEVER_CHOKE:
+        return [ScoreMutation.NONE, ScoreMutation.NO_CHOKE]
+    else:
+        raise ValueError(f"Invalid score set: {score_set}")
+
+
 class ScoreQuerySet(models.QuerySet):
     def non_restricted(self):
         return self.filter(user_stats__user__disabled=False)
@@ -394,39 +431,18 @@ class ScoreQuerySet(models.QuerySet):
 
         return scores
 
-    def get_score_set(
-        self,
-        gamemode: Gamemode,
-        score_set: ScoreSet = ScoreSet.NORMAL,
-        calculator_engine: str | None = None,
-        primary_performance_value: str = "total",
+    def annotate_performance_total(
+        self, calculator_engine: str, performance_value_name: str = "total"
     ):
         """
-        Queryset that returns distinct on beatmap_id prioritising highest pp given the score_set.
-        Remember to use at end of query to not unintentionally filter out scores before primary filtering.
+        Annotates performance_total with the passed performance value of the passed calculator engine's calculations.
         """
-        gamemode_scores = self.filter(gamemode=gamemode)
-        if score_set == ScoreSet.NORMAL:
-            scores = gamemode_scores.filter_mutations([ScoreMutation.NONE])
-        elif score_set == ScoreSet.NEVER_CHOKE:
-            scores = gamemode_scores.filter_mutations(
-                [ScoreMutation.NONE, ScoreMutation.NO_CHOKE]
-            )
-        else:
-            raise ValueError(f"Invalid score set: {score_set}")
-
-        difficulty_calculator_class = (
-            get_default_difficulty_calculator_class(gamemode)
-            if calculator_engine is None
-            else get_difficulty_calculator_class_for_engine(calculator_engine)
-        )
-
-        annotated_scores = (
-            scores.annotate(
+        return (
+            self.annotate(
                 performance_calculation=FilteredRelation(
                     "performance_calculations",
                     condition=Q(
-                        performance_calculations__calculator_engine=difficulty_calculator_class.engine()
+                        performance_calculations__calculator_engine=calculator_engine
                     ),
                 )
             )
@@ -434,25 +450,109 @@ class ScoreQuerySet(models.QuerySet):
                 performance_value=FilteredRelation(
                     "performance_calculation__performance_values",
                     condition=Q(
-                        performance_calculation__performance_values__name=primary_performance_value
+                        performance_calculation__performance_values__name=performance_value_name
                     ),
                 )
             )
             .annotate(performance_total=models.F("performance_value__value"))
         )
 
+    def annotate_primary_performance_total(
+        self,
+        gamemode: Gamemode,
+        calculator_engine: str | None = None,
+        primary_performance_value: str = "total",
+    ):
+        """
+        Annotates performance_total with the passed performance value, defaulting to the gamemode's default calculator engine.
+        """
+        default_calculator_engine = get_default_difficulty_calculator_class(
+            gamemode
+        ).engine()
+        if (
+            calculator_engine is None or calculator_engine == default_calculator_engine
+        ) and primary_performance_value == "total":
+            # use denormalised total to avoid joining through the calculations
+            return self.annotate(
+                performance_total=models.F("default_performance_total")
+            )
+
+        difficulty_calculator_class = (
+            get_default_difficulty_calculator_class(gamemode)
+            if calculator_engine is None
+            else get_difficulty_calculator_class_for_engine(calculator_engine)
+        )
+        return self.annotate_performance_total(
+            difficulty_calculator_class.engine(), primary_performance_value
+        )
+
+    def get_score_set(
+        self,
+        gamemode: Gamemode,
+        score_set: ScoreSet = ScoreSet.NORMAL,
+        calculator_engine: str | None = None,
+        primary_performance_value: str = "total",
+    ):
+        """
+        Queryset that returns distinct on beatmap_id prioritising highest pp given the score_set.
+        Remember to use at end of query to not unintentionally filter out scores before primary filtering.
+        """
+        annotated_scores = (
+            self.filter(gamemode=gamemode)
+            .filter_mutations(get_score_set_mutations(score_set))
+            .annotate_primary_performance_total(
+                gamemode, calculator_engine, primary_performance_value
+            )
+        )
+
         return annotated_scores.filter(
             id__in=Subquery(
                 annotated_scores.all()
                 .order_by(
                     "beatmap_id",  # ordering first by beatmap_id is required for distinct
                     "-performance_total",  # required to make sure we dont distinct out the wrong scores
+                    "date",  # tiebreak equal pp on the earliest score, same as UserBeatmapBests
+                    "id",
                 )
                 .distinct("beatmap_id")
                 .values("id")
             )
         ).order_by("-performance_total", "date")
 
+    def get_beatmap_bests(
+        self,
+        gamemode: Gamemode,
+        score_set: ScoreSet = ScoreSet.NORMAL,
+        calculator_engine: str | None = None,
+    ):
+        """
+        Equivalent of get_score_set for total performance, read from the maintained UserBeatmapBests instead of deduplicating at query time.
+        Only valid after filters on beatmap attributes, since the best score on a beatmap doesnt depend on them.
+        """
+        if score_set not in [ScoreSet.NORMAL, ScoreSet.NEVER_CHOKE]:
+            raise ValueError(f"Invalid score set: {score_set}")
+
+        if calculator_engine is None:
+            calculator_engine = get_default_difficulty_calculator_class(
+                gamemode
+            ).engine()
+
+        return (
+            self.filter(gamemode=gamemode)
+            .annotate(
+                beatmap_best=FilteredRelation(
+                    "beatmap_bests",
+                    condition=Q(
+                        beatmap_bests__score_set=score_set,
+                        beatmap_bests__calculator_engine=calculator_engine,
+                    ),
+                )
+            )
+            .filter(beatmap_best__isnull=False)
+            .annotate(performance_total=models.F("beatmap_best__performance_total"))
+            .order_by("-performance_total", "date")
+        )
+
 
 class Score(models.Model):
     """
@@ -507,6 +607,8 @@ class Score(models.Model):
     # null=True because result types are only supported by standard at the moment
     result = models.IntegerField(null=True, blank=True)
     mutation = models.IntegerField()
+    # denormalised total performance of the default calculator for the gamemode, kept in sync with performance calculations
+    default_performance_total = models.FloatField(null=True, blank=True)
 
     objects = ScoreQuerySet.as_manager()
 
@@ -632,6 +734,8 @@ class Score(models.Model):
             )
         ]
 
+        indexes = [models.Index(fields=["default_performance_total"])]
+
 
 class ScoreFilter(models.Model):
     id = models.BigAutoField(primary_key=True)
@@ -657,6 +761,85 @@ class ScoreFilter(models.Model):
     lowest_length = models.FloatField(null=True, blank=True)
     highest_length = models.FloatField(null=True, blank=True)
 
+    def allows_score(self, score: "Score") -> bool:
+        """
+        In memory equivalent of ScoreQuerySet.apply_score_filter for a single score and its beatmap.
+        """
+        # Mods
+        if any(mod not in score.mods_json for mod in self.required_mods_json):
+            return False
+        if any(mod in score.mods_json for mod in self.disqualified_mods_json):
+            return False
+
+        # Beatmap Status
+        if self.allowed_beatmap_status == AllowedBeatmapStatus.LOVED_ONLY:
+            if score.beatmap.status != BeatmapStatus.LOVED:
+                return False
+        elif self.allowed_beatmap_status == AllowedBeatmapStatus.RANKED_ONLY:
+            if score.beatmap.status not in [
+                BeatmapStatus.RANKED,
+                BeatmapStatus.APPROVED,
+            ]:
+                return False
+
+        # Optional filters (beatmaps without an approval date never match date bounds)
+        approval_date = score.beatmap.approval_date
+        if self.oldest_beatmap_date and (
+            approval_date is None or approval_date < self.oldest_beatmap_date
+        ):
+            return False
+        if self.newest_beatmap_date and (
+            approval_date is None or approval_date > self.newest_beatmap_date
+        ):
+            return False
+        if self.oldest_score_date and score.date < self.oldest_score_date:
+            return False
+        if self.newest_score_date and score.date > self.newest_score_date:
+            return False
+        if self.lowest_ar and score.approach_rate < self.lowest_ar:
+            return False
+        if self.highest_ar and score.approach_rate > self.highest_ar:
+            return False
+        if self.lowest_od and score.overall_difficulty < self.lowest_od:
+            return False
+        if self.highest_od and score.overall_difficulty > self.highest_od:
+            return False
+        if self.lowest_cs and score.circle_size < self.lowest_cs:
+            return False
+        if self.highest_cs and score.circle_size > self.highest_cs:
+            return False
+        if self.lowest_accuracy and score.accuracy < self.lowest_accuracy:
+            return False
+        if self.highest_accuracy and score.accuracy > self.highest_accuracy:
+            return False
+        if self.lowest_length and score.length < self.lowest_length:
+            return False
+        if self.highest_length and score.length > self.highest_length:
+            return False
+
+        return True
+
+    def filters_only_beatmaps(self) -> bool:
+        """
+        Whether this filter only restricts beatmap attributes, so it doesnt change which score is a user's best on a beatmap.
+        """
+        return (
+            self.required_mods_json == []
+            and self.disqualified_mods_json == []
+            and self.oldest_score_date is None
+            and self.newest_score_date is None
+            and self.lowest_ar is None
+            and self.highest_ar is None
+            and self.lowest_od is None
+            and self.highest_od is None
+            and self.lowest_cs is None
+            and self.highest_cs is None
+            and self.lowest_accuracy is None
+            and self.highest_accuracy is None
+            and self.lowest_length is None
+            and self.highest_length is None
+        )
+
 
 class PerformanceCalculation(models.Model):
     """
@@ -733,6 +916,58 @@ class PerformanceValue(models.Model):
         indexes = [models.Index(fields=["value"])]
 
 
+class UserBeatmapBest(models.Model):
+    """
+    Model representing a user's best score on a beatmap for a score set and calculator engine.
+    Maintained as scores are calculated, so score sets can be read without deduplicating at query time.
+    """
+
+    id = models.BigAutoField(primary_key=True)
+
+    user_stats = models.ForeignKey(
+        UserStats, on_delete=models.CASCADE, related_name="beatmap_bests"
+    )
+    beatmap = models.ForeignKey(
+        Beatmap, on_delete=models.CASCADE, related_name="user_bests"
+    )
+    score = models.ForeignKey(
+        Score, on_delete=models.CASCADE, related_name="beatmap_bests"
+    )
+
+    score_set = models.IntegerField()
+    calculator_engine = models.CharField()
+    performance_total = models.FloatField()
+
+    def __str__(self):
+        return f"{self.user_stats_id} {self.beatmap_id}: {self.score_id} ({self.calculator_engine})"
+
+    class Meta:
+        constraints = [
+            # Bests are unique on user + beatmap + score set + calculator_engine
+            models.UniqueConstraint(
+                fields=[
+                    "user_stats_id",
+                    "beatmap_id",
+                    "score_set",
+                    "calculator_engine",
+                ],
+                name="unique_user_beatmap_best",
+            )
+        ]
+
+        indexes = [
+            # Covers reading a user's score set in pp order
+            models.Index(
+                fields=[
+                    "user_stats",
+                    "score_set",
+                    "calculator_engine",
+                    "-performance_total",
+                ]
+            )
+        ]
+
+
 # Custom lookups
 
 
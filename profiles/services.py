@@ -1,30 +1,43 @@
 import itertools
+import json
 import logging
+import uuid
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
-from typing import Iterable
+from typing import Iterable, Iterator, NamedTuple
 
 from django.core.cache import cache
-from django.db import transaction
-from prometheus_client import Counter
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django_redis import get_redis_connection
+from prometheus_client import Counter, Gauge
 
 from common.error_reporter import ErrorReporter
 from common.osu import utils
 from common.osu.difficultycalculator import (
     AbstractDifficultyCalculator,
-    DifficultyCalculatorException,
 )
+from common.osu.difficultycalculator import (
+    Calculation as DifficultyCalculatorCalculation,
+)
+from common.osu.difficultycalculator import InvalidCalculationException
 from common.osu.difficultycalculator import Score as DifficultyCalculatorScore
 from common.osu.difficultycalculator import (
+    calculation_cache,
+    get_calculation_key,
+    get_default_difficulty_calculator_class,
     get_difficulty_calculators_for_gamemode,
 )
 from common.osu.enums import BeatmapStatus, BitMods, Gamemode, Mods
-from common.osu.osuapi import OsuApi, ScoreData
-from events.models import Event
+from common.osu.osuapi import BeatmapData, OsuApi, ScoreData
+from events.models import BeatmapChallenge, EventAttendee
 from leaderboards.models import Leaderboard, Membership
 from minigames.enums import MinigameStatus
 from minigames.models import Minigame, MinigamePlayer
 from osuchan.settings import env_settings
-from profiles.enums import ScoreMutation, ScoreResult
+from ppraces.enums import PPRaceStatus
+from ppraces.models import PPRacePlayer
+from profiles.enums import ScoreMutation, ScoreResult, ScoreSet, UserRefreshKind
 from profiles.models import (
     Beatmap,
     DifficultyCalculation,
@@ -32,8 +45,11 @@ from profiles.models import (
     OsuUser,
     PerformanceCalculation,
     PerformanceValue,
+    PoisonCalculation,
     Score,
+    UserBeatmapBest,
     UserStats,
+    get_score_set_mutations,
 )
 
 scores_added_counter = Counter(
@@ -41,12 +57,134 @@ scores_added_counter = Counter(
     "Total number of real scores (non-mutations) added to the database",
     ["gamemode"],
 )
+score_spool_lag_pages_gauge = Gauge(
+    "profiles_score_spool_lag_pages",
+    "Number of spooled /scores stream pages not yet ingested",
+)
+score_spool_lag_seconds_gauge = Gauge(
+    "profiles_score_spool_lag_seconds",
+    "Age in seconds of the oldest spooled /scores stream page not yet ingested",
+)
 
 logger = logging.getLogger(__name__)
 
 OSU_SCORES_CURSOR_CACHE_KEY = "osu_scores_cursor"
 OSU_SCORES_MAX_STREAM_PAGES = 10
 
+# Durable spool of raw /scores stream pages, drained by a checkpointed consumer.
+# Unbounded, so a lagging consumer never loses pages (see the spool lag metrics)
+OSU_SCORES_SPOOL_KEY = "osu_scores_spool"
+OSU_SCORES_SPOOL_CHECKPOINT_CACHE_KEY = "osu_scores_spool_checkpoint"
+OSU_SCORES_MAX_SPOOL_INGEST_PAGES = 50
+
+# Redis sets of osu user ids whose streamed scores we ingest, one per gamemode
+TRACKED_USER_IDS_KEY_PREFIX = "tracked_user_ids"
+# Events are tracked slightly beyond their dates so attendees are covered between reconciliations
+TRACKED_EVENT_MARGIN = timedelta(minutes=5)
+
+# Redis bitmaps with the bit at each osu user id set for users with UserStats, one per gamemode
+KNOWN_USER_IDS_KEY_PREFIX = "known_user_ids"
+KNOWN_USER_IDS_REBUILD_BATCH_SIZE = 10000
+# Sets a user's bit in a known user bitmap, and in its rebuild bitmap if a rebuild is in progress
+ADD_KNOWN_USER_SCRIPT = """
+redis.call("SETBIT", KEYS[1], ARGV[1], 1)
+if redis.call("EXISTS", KEYS[2]) == 1 then
+    redis.call("SETBIT", KEYS[2], ARGV[1], 1)
+end
+"""
+
+# Rows per INSERT statement, keeping well within postgres' bind parameter limit
+SCORE_INSERT_BATCH_SIZE = 500
+
+# Single-flight state of user refreshes, keyed by (kind, gamemode, osu user id)
+USER_REFRESH_PENDING_KEY_PREFIX = "user_refresh_pending"
+USER_REFRESH_IN_FLIGHT_KEY_PREFIX = "user_refresh_in_flight"
+# Lists pushed to when an in-flight refresh finishes, keyed by its token
+USER_REFRESH_DONE_KEY_PREFIX = "user_refresh_done"
+# Pending markers expire in case their task is lost, in-flight markers in case their worker dies
+USER_REFRESH_PENDING_SECONDS = 600
+USER_REFRESH_IN_FLIGHT_SECONDS = 120
+# Callers waiting for an in-flight refresh give up after this, rather than tying up a web request
+USER_REFRESH_MAX_WAIT_SECONDS = 10
+# Marks a refresh as queued with its priority and cooldown, unless one at least as urgent and with at most the
+#   same cooldown is already queued (lower celery priorities are more urgent, and shorter cooldowns refresh more often)
+CLAIM_PENDING_USER_REFRESH_SCRIPT = """
+local pending = redis.call("HMGET", KEYS[1], "priority", "cooldown_seconds")
+if pending[1] and pending[2]
+    and tonumber(pending[1]) <= tonumber(ARGV[1])
+    and tonumber(pending[2]) <= tonumber(ARGV[2]) then
+    return 0
+end
+redis.call("HSET", KEYS[1], "priority", ARGV[1], "cooldown_seconds", ARGV[2])
+redis.call("EXPIRE", KEYS[1], ARGV[3])
+return 1
+"""
+
+# Cached standings of users which new scores are checked against, keyed by (gamemode, osu user id).
+# Contexts from before the last invalidation are ignored, and the rest expire as a backstop
+SCORE_IMPACT_CONTEXT_KEY_PREFIX = "score_impact_context"
+SCORE_IMPACT_CONTEXT_GENERATION_KEY = "score_impact_context_generation"
+SCORE_IMPACT_CONTEXT_SECONDS = 600
+
+
+class ScoreImpact(NamedTuple):
+    """
+    Which downstream standings newly created scores of a user can change
+    """
+
+    memberships: bool
+    ppraces: bool
+    minigames: bool
+    event_challenges: bool
+
+
+class ScoreImpactContext(NamedTuple):
+    """
+    The standings of a user which analyse_score_impact checks new scores against, cached between refreshes
+    """
+
+    generation: int
+    has_score_filtered_memberships: bool
+    # (start, end) of unfinished pp races and minigames, and (start, end, beatmap id) of unfinished event challenges
+    pprace_windows: list[tuple[datetime, datetime]]
+    minigame_windows: list[tuple[datetime, datetime]]
+    event_challenges: list[tuple[datetime, datetime, int]]
+
+
+class PreparedCalculations(NamedTuple):
+    """
+    Unsaved calculations and their calculated values, ready to be saved with save_calculations
+    """
+
+    difficulty_calculations: list[DifficultyCalculation]
+    difficulty_values: list[DifficultyValue]
+    performance_calculations: list[PerformanceCalculation]
+    performance_values: list[PerformanceValue]
+
+    def for_scores(self, scores: Iterable[Score]) -> "PreparedCalculations":
+        """
+        Returns a copy with only the performance calculations of the passed scores
+        """
+        score_object_ids = set(id(score) for score in scores)
+        performance_calculations = [
+            performance_calculation
+            for performance_calculation in self.performance_calculations
+            if id(performance_calculation.score) in score_object_ids
+        ]
+        performance_calculation_object_ids = set(
+            id(performance_calculation)
+            for performance_calculation in performance_calculations
+        )
+        return self._replace(
+            performance_calculations=performance_calculations,
+            performance_values=[
+                performance_value
+                for performance_value in self.performance_values
+                if id(performance_value.calculation)
+                in performance_calculation_object_ids
+            ],
+        )
+
 
 def fetch_user(user_id=None, username=None, gamemode=Gamemode.STANDARD):
     """
@@ -71,7 +209,6 @@ def fetch_user(user_id=None, username=None, gamemode=Gamemode.STANDARD):
         return None
 
 
-@transaction.atomic
 def refresh_user_from_api(
     user_id=None,
     username=None,
@@ -79,7 +216,11 @@ def refresh_user_from_api(
     cooldown_seconds: int = 300,
 ):
     """
-    Fetch and add user with top 100 scores
+    Fetch and add user with top 100 scores, returning the user_stats (or None if the user doesn't exist) and any scores created.
+    No scores are returned if the refresh was skipped, eg. within its cooldown or in favour of a concurrent refresh.
+
+    All osu! api and difficulty calculator requests are made before opening a transaction.
+    The results are then applied in one short transaction, skipped if another refresh was applied in the meantime.
     """
     # Check for invalid inputs
     if not user_id and not username:
@@ -87,11 +228,6 @@ def refresh_user_from_api(
 
     user_stats = fetch_user(user_id=user_id, username=username, gamemode=gamemode)
 
-    if user_stats is not None:
-        # Refetch user stats with select_for_update to lock it for the transaction (crude way to prevent multiple simultaneous refreshes for the same user)
-        # TODO: refactor user updating flow to replace this with a properly readable and maintainable locking mechanism
-        UserStats.objects.select_for_update().get(id=user_stats.id)
-
     if (
         not env_settings.DISABLE_PROFILE_UPDATE_COOLDOWN
         and user_stats is not None
@@ -102,7 +238,7 @@ def refresh_user_from_api(
         )
     ):
         # User was last updated less than 5 minutes ago, so just return it
-        return user_stats, False
+        return user_stats, []
 
     osu_api = OsuApi()
 
@@ -116,156 +252,163 @@ def refresh_user_from_api(
     if user_data is None:
         if user_id:
             # User either doesnt exist, or is restricted and needs to be disabled
-            try:
-                osu_user = OsuUser.objects.select_for_update().get(id=user_id)
-                # Restricted
-                osu_user.disabled = True
-                osu_user.save()
-            except OsuUser.DoesNotExist:
-                # Doesnt exist (or was restricted before osuchan ever saw them)
-                pass
-            return None, False
+            # (or doesnt exist because they were restricted before osuchan ever saw them)
+            OsuUser.objects.filter(id=user_id).update(disabled=True)
+            return None, []
         else:
             # User either doesnt exist, is restricted, or name changed
-            try:
-                osu_user = OsuUser.objects.select_for_update().get(
-                    username__iexact=username
-                )
-                # Fetch from osu api with user id incase of name change
-                user_data = osu_api.get_user_by_id(osu_user.id, gamemode)
-
-                if user_data is None:
-                    # Restricted
-                    osu_user.disabled = True
-                    osu_user.save()
-                    return None, False
-            except OsuUser.DoesNotExist:
+            osu_user = OsuUser.objects.filter(username__iexact=username).first()
+            if osu_user is None:
                 # Doesnt exist
-                return None, False
+                return None, []
+
+            # Fetch from osu api with user id incase of name change
+            user_data = osu_api.get_user_by_id(osu_user.id, gamemode)
+
+            if user_data is None:
+                # Restricted
+                OsuUser.objects.filter(id=osu_user.id).update(disabled=True)
+                return None, []
 
     # try to fetch user stats by id in case of namechange
     if user_id is None and user_stats is None:
         user_stats = fetch_user(user_id=user_data.user_id, gamemode=gamemode)
 
-    if user_stats is not None:
-        osu_user = user_stats.user
+    if user_stats is None:
+        user_stats = UserStats(
+            user_id=user_data.user_id,
+            gamemode=gamemode,
+            last_updated=datetime.now(tz=timezone.utc),
+        )
+        latest_score_date = None
     else:
-        user_stats = UserStats()
-        user_stats.gamemode = gamemode
-        user_stats.last_updated = datetime.now(tz=timezone.utc)
-
-        # Get or create OsuUser model
-        try:
-            osu_user = OsuUser.objects.select_for_update().get(id=user_data.user_id)
-        except OsuUser.DoesNotExist:
-            osu_user = OsuUser(id=user_data.user_id)
-
-            # Create memberships with global leaderboards
-            global_leaderboards = Leaderboard.global_leaderboards.values("id")
-            # TODO: refactor this to be somewhere else. dont really like setting values to 0
-            global_memberships = [
-                Membership(
-                    leaderboard_id=leaderboard["id"],
-                    user_id=osu_user.id,
-                    pp=0,
-                    rank=0,
-                    score_count=0,
-                )
-                for leaderboard in global_leaderboards
-            ]
-            Membership.objects.bulk_create(global_memberships)
-
-    # Update OsuUser fields
-    osu_user.username = user_data.username
-    osu_user.country = user_data.country
-    osu_user.join_date = user_data.join_date
-    osu_user.disabled = False
-
-    # Save OsuUser model
-    osu_user.save()
-
-    # Set OsuUser relation id on UserStats
-    user_stats.user_id = osu_user.id
-
-    # Update UserStats fields
-    user_stats.playcount = user_data.playcount
-    user_stats.playtime = user_data.playtime
-    user_stats.level = user_data.level
-    user_stats.ranked_score = user_data.ranked_score
-    user_stats.total_score = user_data.total_score
-    user_stats.rank = user_data.rank
-    user_stats.country_rank = user_data.country_rank
-    user_stats.pp = user_data.pp
-    user_stats.accuracy = user_data.accuracy
-    user_stats.count_300 = user_data.count_300
-    user_stats.count_100 = user_data.count_100
-    user_stats.count_50 = user_data.count_50
-    user_stats.count_rank_ss = user_data.count_rank_ss
-    user_stats.count_rank_ssh = user_data.count_rank_ssh
-    user_stats.count_rank_s = user_data.count_rank_s
-    user_stats.count_rank_sh = user_data.count_rank_sh
-    user_stats.count_rank_a = user_data.count_rank_a
-
-    user_stats.save()
-
-    # Fetch date of latest score
-    latest_score_date = (
-        user_stats.scores.order_by("-date").values_list("date", flat=True).first()
-    )
+        # Fetch date of latest score
+        latest_score_date = (
+            user_stats.scores.order_by("-date").values_list("date", flat=True).first()
+        )
 
     # Fetch user scores from osu api
     score_data_list = []
-    score_data_list.extend(osu_api.get_user_best_scores(user_stats.user_id, gamemode))
+    score_data_list.extend(osu_api.get_user_best_scores(user_data.user_id, gamemode))
     score_data_list.extend(
         score
-        for score in osu_api.get_user_recent_scores(user_stats.user_id, gamemode)
+        for score in osu_api.get_user_recent_scores(user_data.user_id, gamemode)
         if score.rank != "F"
         and (latest_score_date is None or score.date > latest_score_date)
     )
 
-    # Process and add scores
-    created_scores = add_scores_from_data(user_stats, score_data_list)
+    # Process and calculate scores
+    scores, prepared_calculations = prepare_scores_from_data(
+        user_stats, score_data_list
+    )
 
-    if len(created_scores) > 0:
-        difficulty_calculators = get_difficulty_calculators_for_gamemode(gamemode)
-        for difficulty_calculator in difficulty_calculators:
-            with difficulty_calculator() as calc:
-                update_performance_calculations(created_scores, calc)
+    is_new_user = user_stats.pk is None
+    try:
+        with transaction.atomic():
+            if not is_new_user and not lock_user_stats_version(user_stats):
+                # Another refresh has been applied since we fetched, so use that instead
+                return fetch_user(user_id=user_stats.user_id, gamemode=gamemode), []
 
-        # Recalculate with new scores added
-        user_stats.recalculate()
+            # Get or create OsuUser model
+            try:
+                osu_user = OsuUser.objects.select_for_update().get(id=user_data.user_id)
+            except OsuUser.DoesNotExist:
+                osu_user = OsuUser(id=user_data.user_id)
+
+                # Create memberships with global leaderboards
+                global_leaderboards = Leaderboard.global_leaderboards.values("id")
+                # TODO: refactor this to be somewhere else. dont really like setting values to 0
+                global_memberships = [
+                    Membership(
+                        leaderboard_id=leaderboard["id"],
+                        user_id=osu_user.id,
+                        pp=0,
+                        rank=0,
+                        score_count=0,
+                    )
+                    for leaderboard in global_leaderboards
+                ]
+                Membership.objects.bulk_create(global_memberships)
+
+            # Update OsuUser fields
+            osu_user.username = user_data.username
+            osu_user.country = user_data.country
+            osu_user.join_date = user_data.join_date
+            osu_user.disabled = False
+
+            # Save OsuUser model
+            osu_user.save()
+
+            # Set OsuUser relation on UserStats
+            user_stats.user = osu_user
+
+            # Update UserStats fields
+            user_stats.playcount = user_data.playcount
+            user_stats.playtime = user_data.playtime
+            user_stats.level = user_data.level
+            user_stats.ranked_score = user_data.ranked_score
+            user_stats.total_score = user_data.total_score
+            user_stats.rank = user_data.rank
+            user_stats.country_rank = user_data.country_rank
+            user_stats.pp = user_data.pp
+            user_stats.accuracy = user_data.accuracy
+            user_stats.count_300 = user_data.count_300
+            user_stats.count_100 = user_data.count_100
+            user_stats.count_50 = user_data.count_50
+            user_stats.count_rank_ss = user_data.count_rank_ss
+            user_stats.count_rank_ssh = user_data.count_rank_ssh
+            user_stats.count_rank_s = user_data.count_rank_s
+            user_stats.count_rank_sh = user_data.count_rank_sh
+            user_stats.count_rank_a = user_data.count_rank_a
+
+            if is_new_user:
+                # New users have their streamed scores ingested from now on
+                transaction.on_commit(
+                    lambda: add_known_user(user_stats.user_id, gamemode)
+                )
 
-    user_stats.last_updated = datetime.now(tz=timezone.utc)
-    user_stats.save()
+            user_stats.save()
 
-    return user_stats, True
+            # Add scores and calculations, and recalculate with new scores added
+            created_scores = save_scores_and_calculations(
+                user_stats, scores, prepared_calculations
+            )
+
+            user_stats.last_updated = datetime.now(tz=timezone.utc)
+            user_stats.save()
+    except IntegrityError:
+        if not is_new_user:
+            raise
+        # A concurrent first refresh of the user inserted them first, so use that instead
+        return fetch_user(user_id=user_data.user_id, gamemode=gamemode), []
+
+    return user_stats, created_scores
 
 
-@transaction.atomic
 def refresh_user_recent_from_api(
     user_id: int,
     gamemode: Gamemode = Gamemode.STANDARD,
     cooldown_seconds: int = 300,
 ):
     """
-    Fetch and update user recent scores
+    Fetch and update user recent scores, returning the user_stats (or None if the user isn't in the db) and any scores created.
+    No scores are returned if the refresh was skipped, eg. within its cooldown or in favour of a concurrent refresh.
+
+    All osu! api and difficulty calculator requests are made before opening a transaction.
+    The results are then applied in one short transaction, skipped if another refresh was applied in the meantime.
     """
     user_stats = fetch_user(user_id=user_id, gamemode=gamemode)
 
     if user_stats is None:
         # User does not exist in the db, so return None
-        return None, False
-    else:
-        # Refetch user stats with select_for_update to lock it for the transaction (crude way to prevent multiple simultaneous refreshes for the same user)
-        # TODO: refactor user updating flow to replace this with a properly readable and maintainable locking mechanism
-        UserStats.objects.select_for_update().get(id=user_stats.id)
+        return None, []
 
     if not env_settings.DISABLE_PROFILE_UPDATE_COOLDOWN and user_stats.last_updated > (
         datetime.utcnow().replace(tzinfo=timezone.utc)
         - timedelta(seconds=cooldown_seconds)
     ):
         # User was last updated less than 1 minutes ago, so just return it
-        return user_stats, False
+        return user_stats, []
 
     osu_api = OsuApi()
 
@@ -282,48 +425,78 @@ def refresh_user_recent_from_api(
         and (latest_score_date is None or score.date > latest_score_date)
     ]
 
-    # Process and add scores
-    created_scores = add_scores_from_data(user_stats, score_data_list)
+    # Process and calculate scores
+    scores, prepared_calculations = prepare_scores_from_data(
+        user_stats, score_data_list
+    )
+
+    with transaction.atomic():
+        if not lock_user_stats_version(user_stats):
+            # Another refresh has been applied since we fetched, so use that instead
+            return fetch_user(user_id=user_stats.user_id, gamemode=gamemode), []
 
-    if len(created_scores) > 0:
-        difficulty_calculators = get_difficulty_calculators_for_gamemode(gamemode)
-        for difficulty_calculator in difficulty_calculators:
-            with difficulty_calculator() as calc:
-                update_performance_calculations(created_scores, calc)
+        # Add scores and calculations, and recalculate with new scores added
+        created_scores = save_scores_and_calculations(
+            user_stats, scores, prepared_calculations
+        )
 
-        # Recalculate with new scores added
-        user_stats.recalculate()
+        user_stats.last_updated = datetime.now(tz=timezone.utc)
+        user_stats.save()
 
-    user_stats.last_updated = datetime.now(tz=timezone.utc)
-    user_stats.save()
-    return user_stats, True
+    return user_stats, created_scores
+
+
+def lock_user_stats_version(user_stats: UserStats) -> bool:
+    """
+    Locks the passed user_stats row for the current transaction.
+    Returns False if it has been refreshed since it was fetched (last_updated acts as the version).
+    """
+    current_last_updated = (
+        UserStats.objects.select_for_update()
+        .values_list("last_updated", flat=True)
+        .get(id=user_stats.id)
+    )
+    return current_last_updated == user_stats.last_updated
 
 
-@transaction.atomic
 def refresh_beatmaps_from_api(beatmap_ids: Iterable[int]):
     """
     Fetches and adds a list of beatmaps from the osu api
     """
     osu_api = OsuApi()
-    beatmaps = []
-    for beatmap_id in beatmap_ids:
-        beatmap_data = osu_api.get_beatmap(beatmap_id)
-
-        if beatmap_data is None:
-            continue
-
-        if beatmap_data.status not in [
+    beatmap_data_list = [
+        beatmap_data
+        for beatmap_data in osu_api.get_beatmaps(list(beatmap_ids))
+        if beatmap_data.status
+        in [
             BeatmapStatus.APPROVED,
             BeatmapStatus.RANKED,
             BeatmapStatus.LOVED,
-        ]:
-            continue
+        ]
+    ]
 
-        beatmap = Beatmap.from_data(beatmap_data)
+    beatmaps = build_beatmaps_from_data(beatmap_data_list)
 
-        beatmaps.append(beatmap)
+    # Beatmaps updated in place (eg. loved beatmaps) need their cached calculations invalidated
+    stored_last_updated = dict(
+        Beatmap.objects.filter(id__in=[beatmap.id for beatmap in beatmaps]).values_list(
+            "id", "last_updated"
+        )
+    )
+    calculation_cache.invalidate_beatmaps(
+        str(beatmap.id)
+        for beatmap in beatmaps
+        if beatmap.id in stored_last_updated
+        and beatmap.last_updated > stored_last_updated[beatmap.id]
+    )
 
-    Beatmap.objects.bulk_create(beatmaps, ignore_conflicts=True)
+    # Only last_updated is updated on existing beatmaps, so each update is only invalidated once
+    Beatmap.objects.bulk_create(
+        beatmaps,
+        update_conflicts=True,
+        update_fields=["last_updated"],
+        unique_fields=["id"],
+    )
 
     beatmaps_by_gamemode = {}
     for beatmap in beatmaps:
@@ -331,12 +504,45 @@ def refresh_beatmaps_from_api(beatmap_ids: Iterable[int]):
             beatmaps_by_gamemode[beatmap.gamemode] = []
         beatmaps_by_gamemode[beatmap.gamemode].append(beatmap)
 
-    for gamemode, beatmaps in beatmaps_by_gamemode.items():
+    for gamemode, gamemode_beatmaps in beatmaps_by_gamemode.items():
         for difficulty_calculator_class in get_difficulty_calculators_for_gamemode(
             gamemode
         ):
             with difficulty_calculator_class() as difficulty_calculator:
-                update_difficulty_calculations(beatmaps, difficulty_calculator)
+                update_difficulty_calculations(gamemode_beatmaps, difficulty_calculator)
+
+    return beatmaps
+
+
+def build_beatmaps_from_data(beatmap_data_list: list[BeatmapData]) -> list[Beatmap]:
+    """
+    Builds unsaved beatmaps from the passed beatmap_data_list.
+    Hitobject counts are fetched in one batch per gamemode from the default difficulty calculator.
+    Beatmaps whose details couldn't be fetched are left out, so they can be retried on a later refresh.
+    """
+    beatmap_data_by_gamemode: dict[Gamemode, list[BeatmapData]] = {}
+    for beatmap_data in beatmap_data_list:
+        beatmap_data_by_gamemode.setdefault(beatmap_data.gamemode, []).append(
+            beatmap_data
+        )
+
+    beatmaps = []
+    for gamemode, gamemode_beatmap_data_list in beatmap_data_by_gamemode.items():
+        with get_default_difficulty_calculator_class(
+            gamemode
+        )() as difficulty_calculator:
+            beatmaps_details = difficulty_calculator.get_beatmaps_details(
+                str(beatmap_data.beatmap_id)
+                for beatmap_data in gamemode_beatmap_data_list
+            )
+
+        for beatmap_data in gamemode_beatmap_data_list:
+            beatmap_details = beatmaps_details.get(str(beatmap_data.beatmap_id))
+            if beatmap_details is None:
+                continue
+            beatmaps.append(
+                Beatmap.from_data(beatmap_data, beatmap_details.hitobject_counts)
+            )
 
     return beatmaps
 
@@ -348,7 +554,10 @@ def store_beatmap(beatmap_id: int) -> Beatmap | None:
     beatmap_data = osu_api.get_beatmap(beatmap_id)
     if beatmap_data is None:
         return None
-    beatmap = Beatmap.from_data(beatmap_data)
+    beatmaps = build_beatmaps_from_data([beatmap_data])
+    if len(beatmaps) == 0:
+        return None
+    beatmap = beatmaps[0]
     beatmap.save()
     for difficulty_calculator_class in get_difficulty_calculators_for_gamemode(
         beatmap.gamemode
@@ -358,16 +567,13 @@ def store_beatmap(beatmap_id: int) -> Beatmap | None:
     return beatmap
 
 
-@transaction.atomic
 def fetch_scores(user_id, beatmap_ids, gamemode):
     """
     Fetch and add scores for a user on beatmaps in a gamemode
     """
     # Fetch UserStats from database
     try:
-        user_stats = UserStats.objects.select_for_update().get(
-            user_id=user_id, gamemode=gamemode
-        )
+        user_stats = UserStats.objects.get(user_id=user_id, gamemode=gamemode)
     except UserStats.DoesNotExist:
         return []
 
@@ -381,55 +587,122 @@ def fetch_scores(user_id, beatmap_ids, gamemode):
 
         full_score_data_list += score_data_list
 
-    # Process add scores
-    created_scores = add_scores_from_data(user_stats, full_score_data_list)
+    # Process and calculate scores
+    scores, prepared_calculations = prepare_scores_from_data(
+        user_stats, full_score_data_list
+    )
 
-    if len(created_scores) > 0:
+    with transaction.atomic():
+        # Lock user stats so scores and calculations are applied consistently with concurrent refreshes
+        UserStats.objects.select_for_update().get(id=user_stats.id)
+
+        # Add scores and calculations, and recalculate with new scores added
+        created_scores = save_scores_and_calculations(
+            user_stats, scores, prepared_calculations
+        )
+
+        if len(created_scores) > 0:
+            user_stats.save()
+
+    return created_scores
+
+
+def prepare_scores_from_data(
+    user_stats: UserStats, score_data_list: list[ScoreData]
+) -> tuple[list[Score], list[PreparedCalculations]]:
+    """
+    Builds unsaved scores from the passed score_data_list and calculates them with all calculators for the gamemode.
+    Makes no changes to the user's scores, so can be called outside of a transaction.
+    """
+    scores = build_scores_from_data(user_stats, score_data_list)
+
+    prepared_calculations = []
+    if len(scores) > 0:
         for difficulty_calculator_class in get_difficulty_calculators_for_gamemode(
-            gamemode
+            Gamemode(user_stats.gamemode)
         ):
             with difficulty_calculator_class() as difficulty_calculator:
-                update_performance_calculations(created_scores, difficulty_calculator)
+                prepared_calculations.append(
+                    prepare_performance_calculations(scores, difficulty_calculator)
+                )
+
+    return scores, prepared_calculations
+
+
+def save_scores_and_calculations(
+    user_stats: UserStats,
+    scores: list[Score],
+    prepared_calculations: list[PreparedCalculations],
+) -> list[Score]:
+    """
+    Saves scores and their prepared calculations for the passed user_stats, recalculating it if any were added.
+    Should be called in a transaction with the user_stats row locked.
+    """
+    created_scores = save_scores(scores)
+
+    if len(created_scores) > 0:
+        for prepared in prepared_calculations:
+            save_calculations(prepared.for_scores(created_scores))
 
         # Recalculate with new scores added
         user_stats.recalculate()
-        user_stats.save()
 
     return created_scores
 
 
-# TODO: refactor this
 def add_scores_from_data(user_stats: UserStats, score_data_list: list[ScoreData]):
     """
     Adds a list of scores to the passed user_stats from the passed score_data_list.
     (requires all dicts to have beatmap_id set along with usual score data)
     """
+    return save_scores(build_scores_from_data(user_stats, score_data_list))
+
+
+# TODO: refactor this
+def build_scores_from_data(
+    user_stats: UserStats, score_data_list: list[ScoreData]
+) -> list[Score]:
+    """
+    Builds unsaved scores (and their mutations) for the passed user_stats from the passed score_data_list.
+    Scores which already exist in the db or are on missing beatmaps are skipped.
+    """
     # Remove potential duplicates from a top 100 play also being in the recent 50
-    unique_score_data_list = []
+    unique_score_data_by_key: dict[tuple[datetime, int], ScoreData] = {}
     for score_data in score_data_list:
-        if score_data not in unique_score_data_list:
-            unique_score_data_list.append(score_data)
+        unique_score_data_by_key.setdefault(
+            (score_data.date, score_data.beatmap_id), score_data
+        )
+    unique_score_data_list = list(unique_score_data_by_key.values())
 
     # Remove scores which already exist in db
-    score_dates = [score.date for score in unique_score_data_list]
-    existing_score_dates = user_stats.scores.filter(date__in=score_dates).values_list(
-        "date", flat=True
-    )
+    if user_stats.pk is not None:
+        score_dates = [score.date for score in unique_score_data_list]
+        existing_score_dates = set(
+            user_stats.scores.filter(date__in=score_dates).values_list(
+                "date", flat=True
+            )
+        )
+    else:
+        existing_score_dates = set()
     new_score_data_list: list[ScoreData] = []
     for score_data in unique_score_data_list:
         if score_data.date not in existing_score_dates:
             new_score_data_list.append(score_data)
 
     # Fetch beatmaps from database in bulk
-    beatmap_ids = [score.beatmap_id for score in new_score_data_list]
-    beatmaps = list(Beatmap.objects.filter(id__in=beatmap_ids))
-
-    missing_beatmaps = set(beatmap_ids) - set(beatmap.id for beatmap in beatmaps)
-    beatmaps.extend(refresh_beatmaps_from_api(missing_beatmaps))
+    beatmap_ids = set(score.beatmap_id for score in new_score_data_list)
+    beatmaps_by_id = {
+        beatmap.id: beatmap for beatmap in Beatmap.objects.filter(id__in=beatmap_ids)
+    }
+
+    missing_beatmaps = beatmap_ids - beatmaps_by_id.keys()
+    beatmaps_by_id.update(
+        (beatmap.id, beatmap) for beatmap in refresh_beatmaps_from_api(missing_beatmaps)
+    )
 
     gamemode = Gamemode(user_stats.gamemode)
 
-    scores_to_create = []
+    scores = []
     for score_data in new_score_data_list:
         score = Score()
 
@@ -456,14 +729,11 @@ def add_scores_from_data(user_stats: UserStats, score_data_list: list[ScoreData]
             continue
 
         # Update foreign keys
-        beatmap_id = score_data.beatmap_id
-        try:
-            score.beatmap = next(
-                beatmap for beatmap in beatmaps if beatmap.id == beatmap_id
-            )
-        except StopIteration:
+        beatmap = beatmaps_by_id.get(score_data.beatmap_id)
+        if beatmap is None:
             # Beatmap not ranked/loved or otherwise missing
             continue
+        score.beatmap = beatmap
 
         score.user_stats = user_stats
 
@@ -492,26 +762,105 @@ def add_scores_from_data(user_stats: UserStats, score_data_list: list[ScoreData]
         # Process score
         score.process()
 
-        scores_to_create.append(score)
+        scores.append(score)
 
-    # Bulk add and update and scores
-    created_scores = Score.objects.bulk_create(scores_to_create)
+    if gamemode == Gamemode.STANDARD:
+        scores.extend(
+            [
+                score.get_nochoke_mutation()
+                for score in scores
+                if score.result & ScoreResult.CHOKE
+            ]
+        )
 
-    scores_added_counter.labels(gamemode=gamemode.value).inc(len(created_scores))
+    return scores
 
-    if gamemode == Gamemode.STANDARD:
-        nochoke_mutations_to_create = [
-            score.get_nochoke_mutation()
-            for score in created_scores
-            if score.result & ScoreResult.CHOKE
-        ]
-        created_scores.extend(Score.objects.bulk_create(nochoke_mutations_to_create))
 
-    # Return new scores
+@transaction.atomic
+def save_scores(scores: list[Score]) -> list[Score]:
+    """
+    Saves unsaved scores built by build_scores_from_data, skipping any which already exist, and returns those created.
+    Safe to run concurrently for the same user without locking, as conflicting scores are skipped by the insert itself.
+    """
+    # Mutations reference their original score, so it must be created first
+    created_scores = insert_scores_ignoring_conflicts(
+        [score for score in scores if score.mutation == ScoreMutation.NONE]
+    )
+
+    for gamemode in Gamemode:
+        gamemode_score_count = sum(
+            1 for score in created_scores if score.gamemode == gamemode
+        )
+        if gamemode_score_count > 0:
+            scores_added_counter.labels(gamemode=gamemode.value).inc(
+                gamemode_score_count
+            )
+
+    # Mutations of scores which already existed are skipped along with them
+    created_score_object_ids = set(id(score) for score in created_scores)
+    mutations = []
+    for score in scores:
+        if (
+            score.mutation != ScoreMutation.NONE
+            and id(score.original_score) in created_score_object_ids
+        ):
+            mutations.append(score)
+
+    created_scores.extend(insert_scores_ignoring_conflicts(mutations))
+
+    return created_scores
+
+
+def insert_scores_ignoring_conflicts(scores: list[Score]) -> list[Score]:
+    """
+    Inserts the passed unsaved scores with INSERT ... ON CONFLICT DO NOTHING RETURNING id,
+    setting ids on and returning only the scores that were inserted.
+    """
+    fields = [field for field in Score._meta.concrete_fields if not field.primary_key]
+    columns = ", ".join(connection.ops.quote_name(field.column) for field in fields)
+    row_placeholder = f"({', '.join(['%s'] * len(fields))})"
+
+    for score in scores:
+        # Picks up ids of related objects saved since they were assigned, as bulk_create does
+        score._prepare_related_fields_for_save(operation_name="insert_scores")
+
+    # The insert skips all but the first of any scores conflicting with each other (eg. plays on different
+    #   beatmaps in the same second), so drop those up front so RETURNING rows map back to the inserted scores
+    scores_by_key = {}
+    for score in scores:
+        scores_by_key.setdefault(
+            (score.user_stats_id, score.date, score.mutation), score
+        )
+    scores = list(scores_by_key.values())
+
+    created_scores = []
+    with connection.cursor() as cursor:
+        for i in range(0, len(scores), SCORE_INSERT_BATCH_SIZE):
+            batch = scores[i : i + SCORE_INSERT_BATCH_SIZE]
+            params = [
+                field.get_db_prep_save(field.pre_save(score, True), connection)
+                for score in batch
+                for field in fields
+            ]
+            cursor.execute(
+                f"""
+                INSERT INTO {connection.ops.quote_name(Score._meta.db_table)} ({columns})
+                VALUES {", ".join([row_placeholder] * len(batch))}
+                ON CONFLICT (user_stats_id, date, mutation) DO NOTHING
+                RETURNING id, user_stats_id, date, mutation
+                """,
+                params,
+            )
+            for score_id, user_stats_id, date, mutation in cursor.fetchall():
+                score = scores_by_key[(user_stats_id, date, mutation)]
+                score.id = score_id
+                score._state.adding = False
+                score._state.db = connection.alias
+                created_scores.append(score)
+
     return created_scores
 
 
-@transaction.atomic
 def update_difficulty_calculations(
     beatmaps: Iterable[Beatmap], difficulty_calculator: AbstractDifficultyCalculator
 ):
@@ -519,6 +868,30 @@ def update_difficulty_calculations(
     Update difficulty calculations for passed beatmaps using passed difficulty calculator.
     Existing calculations will be updated.
     """
+    save_calculations(prepare_difficulty_calculations(beatmaps, difficulty_calculator))
+
+
+def update_performance_calculations(
+    scores: Iterable[Score],
+    difficulty_calculator: AbstractDifficultyCalculator,
+    force: bool = False,
+):
+    """
+    Update performance (and difficulty) calculations for passed scores using passed difficulty calculator.
+    Existing performance calculations will be updated, and outdated difficulty calculations recalculated.
+    Pass force to recalculate difficulty calculations even if they are up to date.
+    """
+    save_calculations(
+        prepare_performance_calculations(scores, difficulty_calculator, force)
+    )
+
+
+def prepare_difficulty_calculations(
+    beatmaps: Iterable[Beatmap], difficulty_calculator: AbstractDifficultyCalculator
+) -> PreparedCalculations:
+    """
+    Calculate difficulty values for passed beatmaps using passed difficulty calculator, without saving.
+    """
     # Create calculations
     calculations = []
     for beatmap in beatmaps:
@@ -531,59 +904,60 @@ def update_difficulty_calculations(
             )
         )
 
-    DifficultyCalculation.objects.bulk_create(
-        calculations,
-        update_conflicts=True,
-        update_fields=["calculator_version"],
-        unique_fields=["beatmap_id", "mods", "calculator_engine"],
-    )
-
     values = list(
         itertools.chain.from_iterable(
             calculate_difficulty_values(calculations, difficulty_calculator)
         )
     )
 
-    DifficultyValue.objects.bulk_create(
-        values,
-        update_conflicts=True,
-        update_fields=["value"],
-        unique_fields=["calculation_id", "name"],
+    return PreparedCalculations(
+        difficulty_calculations=filter_calculated(calculations, values),
+        difficulty_values=values,
+        performance_calculations=[],
+        performance_values=[],
     )
 
-    # Delete outdated values (non-existent in current calculator)
-    DifficultyValue.objects.filter(
-        calculation_id__in=[c.id for c in calculations]
-    ).exclude(id__in=[v.id for v in values]).delete()
-
 
-@transaction.atomic
-def update_performance_calculations(
-    scores: Iterable[Score], difficulty_calculator: AbstractDifficultyCalculator
-):
+def prepare_performance_calculations(
+    scores: Iterable[Score],
+    difficulty_calculator: AbstractDifficultyCalculator,
+    force: bool = False,
+) -> PreparedCalculations:
     """
-    Update performance (and difficulty) calculations for passed scores using passed difficulty calculator.
-    Existing calculations will be updated.
+    Calculate performance (and difficulty) values for passed scores using passed difficulty calculator, without saving.
+    Scores may be unsaved, as long as they are saved before the calculations.
+    Difficulty calculations already up to date with the calculator are reused rather than recalculated, unless forced.
     """
-    # Create or update difficulty calculations
     unique_beatmaps = set((score.beatmap_id, score.mods) for score in scores)
-    difficulty_calculations = []
-    for beatmap_id, mods in unique_beatmaps:
-        difficulty_calculations.append(
-            DifficultyCalculation(
-                beatmap_id=beatmap_id,
-                mods=mods,
+
+    # Reuse difficulty calculations already up to date with the current calculator
+    if force:
+        difficulty_calculations_by_beatmap = {}
+    else:
+        difficulty_calculations_by_beatmap = {
+            (calculation.beatmap_id, calculation.mods): calculation
+            for calculation in DifficultyCalculation.objects.filter(
+                beatmap_id__in=set(beatmap_id for beatmap_id, _ in unique_beatmaps),
                 calculator_engine=difficulty_calculator.engine(),
                 calculator_version=difficulty_calculator.version(),
-            )
-        )
+                difficulty_values__isnull=False,
+            ).distinct()
+            if (calculation.beatmap_id, calculation.mods) in unique_beatmaps
+        }
 
-    DifficultyCalculation.objects.bulk_create(
-        difficulty_calculations,
-        update_conflicts=True,
-        update_fields=["calculator_version"],
-        unique_fields=["beatmap_id", "mods", "calculator_engine"],
-    )
+    # Create difficulty calculations for the missing or outdated ones
+    difficulty_calculations = []
+    for beatmap_id, mods in unique_beatmaps:
+        if (beatmap_id, mods) in difficulty_calculations_by_beatmap:
+            continue
+        difficulty_calculation = DifficultyCalculation(
+            beatmap_id=beatmap_id,
+            mods=mods,
+            calculator_engine=difficulty_calculator.engine(),
+            calculator_version=difficulty_calculator.version(),
+        )
+        difficulty_calculations.append(difficulty_calculation)
+        difficulty_calculations_by_beatmap[(beatmap_id, mods)] = difficulty_calculation
 
     # Do difficulty calculations
     difficulty_values = list(
@@ -592,44 +966,35 @@ def update_performance_calculations(
         )
     )
 
-    # Create or update difficulty values
-    DifficultyValue.objects.bulk_create(
-        difficulty_values,
-        update_conflicts=True,
-        update_fields=["value"],
-        unique_fields=["calculation_id", "name"],
+    # Drop failed difficulty calculations, along with the scores depending on them
+    calculated_difficulty_calculations = filter_calculated(
+        difficulty_calculations, difficulty_values
     )
+    failed_beatmaps = set(
+        (calculation.beatmap_id, calculation.mods)
+        for calculation in difficulty_calculations
+    ) - set(
+        (calculation.beatmap_id, calculation.mods)
+        for calculation in calculated_difficulty_calculations
+    )
+    difficulty_calculations = calculated_difficulty_calculations
 
-    # Delete outdated values (non-existent in current calculator)
-    DifficultyValue.objects.filter(
-        calculation_id__in=[c.id for c in difficulty_calculations]
-    ).exclude(id__in=[v.id for v in difficulty_values]).delete()
-
-    # Create or update performance calculations
+    # Create performance calculations
     performance_calculations = []
     for score in scores:
-        difficulty_calculation = next(
-            calculation
-            for calculation in difficulty_calculations
-            if calculation.beatmap_id == score.beatmap_id
-            and calculation.mods == score.mods
-        )
+        if (score.beatmap_id, score.mods) in failed_beatmaps:
+            continue
         performance_calculations.append(
             PerformanceCalculation(
                 score=score,
-                difficulty_calculation_id=difficulty_calculation.id,
+                difficulty_calculation=difficulty_calculations_by_beatmap[
+                    (score.beatmap_id, score.mods)
+                ],
                 calculator_engine=difficulty_calculator.engine(),
                 calculator_version=difficulty_calculator.version(),
             )
         )
 
-    PerformanceCalculation.objects.bulk_create(
-        performance_calculations,
-        update_conflicts=True,
-        update_fields=["calculator_version", "difficulty_calculation_id"],
-        unique_fields=["score_id", "calculator_engine"],
-    )
-
     # Do performance calculations
     performance_values = list(
         itertools.chain.from_iterable(
@@ -639,9 +1004,68 @@ def update_performance_calculations(
         )
     )
 
+    return PreparedCalculations(
+        difficulty_calculations=difficulty_calculations,
+        difficulty_values=difficulty_values,
+        performance_calculations=filter_calculated(
+            performance_calculations, performance_values
+        ),
+        performance_values=performance_values,
+    )
+
+
+def filter_calculated(
+    calculations: Iterable[DifficultyCalculation | PerformanceCalculation],
+    values: Iterable[DifficultyValue | PerformanceValue],
+) -> list:
+    """
+    Returns the passed calculations which have calculated values.
+    Failed calculations are dropped so saving doesn't overwrite existing calculations and values with them.
+    """
+    calculated_ids = set(id(value.calculation) for value in values)
+    return [
+        calculation for calculation in calculations if id(calculation) in calculated_ids
+    ]
+
+
+@transaction.atomic
+def save_calculations(prepared: PreparedCalculations):
+    """
+    Save prepared calculations and their values.
+    Existing calculations will be updated, and values non-existent in the current calculator deleted.
+    """
+    # Create or update difficulty calculations
+    DifficultyCalculation.objects.bulk_create(
+        prepared.difficulty_calculations,
+        update_conflicts=True,
+        update_fields=["calculator_version"],
+        unique_fields=["beatmap_id", "mods", "calculator_engine"],
+    )
+
+    # Create or update difficulty values
+    DifficultyValue.objects.bulk_create(
+        prepared.difficulty_values,
+        update_conflicts=True,
+        update_fields=["value"],
+        unique_fields=["calculation_id", "name"],
+    )
+
+    # Delete outdated values (non-existent in current calculator)
+    DifficultyValue.objects.filter(
+        calculation_id__in=[c.id for c in prepared.difficulty_calculations]
+    ).exclude(id__in=[v.id for v in prepared.difficulty_values]).delete()
+
+    # Create or update performance calculations
+    PerformanceCalculation.objects.bulk_create(
+        prepared.performance_calculations,
+        update_conflicts=True,
+        update_fields=["calculator_version", "difficulty_calculation_id"],
+        unique_fields=["score_id", "calculator_engine"],
+    )
+
     # Create or update performance values
     PerformanceValue.objects.bulk_create(
-        performance_values,
+        prepared.performance_values,
         update_conflicts=True,
         update_fields=["value"],
         unique_fields=["calculation_id", "name"],
@@ -649,8 +1073,114 @@ def update_performance_calculations(
 
     # Delete outdated values (non-existent in current calculator)
     PerformanceValue.objects.filter(
-        calculation_id__in=[c.id for c in performance_calculations]
-    ).exclude(id__in=[v.id for v in performance_values]).delete()
+        calculation_id__in=[c.id for c in prepared.performance_calculations]
+    ).exclude(id__in=[v.id for v in prepared.performance_values]).delete()
+
+    # Keep denormalised default performance totals in sync
+    save_default_performance_totals(prepared)
+
+    # Keep bests in sync for the users and beatmaps of the calculated scores
+    update_user_beatmap_bests(
+        (c.score.user_stats_id, c.score.beatmap_id)
+        for c in prepared.performance_calculations
+    )
+
+
+def save_default_performance_totals(prepared: PreparedCalculations):
+    """
+    Save the total performance of prepared default calculator performance calculations to their scores.
+    """
+    totals = {
+        id(value.calculation): value.value
+        for value in prepared.performance_values
+        if value.name == "total"
+    }
+
+    scores = []
+    for calculation in prepared.performance_calculations:
+        score = calculation.score
+        default_calculator_engine = get_default_difficulty_calculator_class(
+            Gamemode(score.gamemode)
+        ).engine()
+        if calculation.calculator_engine != default_calculator_engine:
+            continue
+
+        score.default_performance_total = totals.get(id(calculation))
+        scores.append(score)
+
+    Score.objects.bulk_update(scores, ["default_performance_total"])
+
+
+@transaction.atomic
+def update_user_beatmap_bests(user_beatmaps: Iterable[tuple[int, int]]):
+    """
+    Recalculates the UserBeatmapBests of the passed (user stats id, beatmap id) pairs, for each score set and calculator engine.
+    """
+    beatmap_ids_by_user_stats_id: dict[int, set[int]] = {}
+    for user_stats_id, beatmap_id in user_beatmaps:
+        beatmap_ids_by_user_stats_id.setdefault(user_stats_id, set()).add(beatmap_id)
+    if len(beatmap_ids_by_user_stats_id) == 0:
+        return
+
+    # Match only the passed pairs, rather than every beatmap of every passed user
+    user_beatmaps_filter = Q()
+    for user_stats_id, beatmap_ids in beatmap_ids_by_user_stats_id.items():
+        user_beatmaps_filter |= Q(
+            user_stats_id=user_stats_id, beatmap_id__in=beatmap_ids
+        )
+
+    user_beatmap_bests = []
+    for score_set in [ScoreSet.NORMAL, ScoreSet.NEVER_CHOKE]:
+        best_values = (
+            PerformanceValue.objects.filter(
+                name="total",
+                calculation__score__in=Score.objects.filter(user_beatmaps_filter),
+                calculation__score__mutation__in=get_score_set_mutations(score_set),
+            )
+            .order_by(
+                # ordering first by the distinct fields is required for distinct
+                "calculation__score__user_stats_id",
+                "calculation__score__beatmap_id",
+                "calculation__calculator_engine",
+                "-value",
+                "calculation__score__date",
+                "calculation__score_id",
+            )
+            .distinct(
+                "calculation__score__user_stats_id",
+                "calculation__score__beatmap_id",
+                "calculation__calculator_engine",
+            )
+            .values_list(
+                "calculation__score__user_stats_id",
+                "calculation__score__beatmap_id",
+                "calculation__score_id",
+                "calculation__calculator_engine",
+                "value",
+            )
+        )
+
+        user_beatmap_bests.extend(
+            UserBeatmapBest(
+                user_stats_id=user_stats_id,
+                beatmap_id=beatmap_id,
+                score_id=score_id,
+                score_set=score_set,
+                calculator_engine=calculator_engine,
+                performance_total=value,
+            )
+            for user_stats_id, beatmap_id, score_id, calculator_engine, value in best_values
+        )
+
+    UserBeatmapBest.objects.filter(user_beatmaps_filter).delete()
+
+    # Upsert in case a concurrent update has inserted the same bests since deleting
+    UserBeatmapBest.objects.bulk_create(
+        user_beatmap_bests,
+        update_conflicts=True,
+        update_fields=["score_id", "performance_total"],
+        unique_fields=["user_stats_id", "beatmap_id", "score_set", "calculator_engine"],
+    )
 
 
 def calculate_difficulty_values(
@@ -668,25 +1198,12 @@ def calculate_difficulty_values(
         for difficulty_calculation in difficulty_calculations
     ]
 
-    results = []
-    try:
-        results.extend(difficulty_calculator.calculate_scores(calc_scores))
-    except DifficultyCalculatorException as e:
-        error_reporter = ErrorReporter()
-        error_reporter.report_error(e)
-
-        # Batch failed, so let's try one by one to get as many values as possible
-        for calc_score in calc_scores:
-            try:
-                results.append(difficulty_calculator.calculate_scores([calc_score])[0])
-            except DifficultyCalculatorException as e:
-                error_reporter.report_error(e)
-                results.append(None)
+    results = calculate_scores_isolating_failures(calc_scores, difficulty_calculator)
 
     values = [
         [
             DifficultyValue(
-                calculation_id=difficulty_calculation.id,
+                calculation=difficulty_calculation,
                 name=name,
                 value=value,
             )
@@ -719,25 +1236,12 @@ def calculate_performance_values(
         for performance_calculation in performance_calculations
     ]
 
-    results = []
-    try:
-        results.extend(difficulty_calculator.calculate_scores(calc_scores))
-    except DifficultyCalculatorException as e:
-        error_reporter = ErrorReporter()
-        error_reporter.report_error(e)
-
-        # Batch failed, so let's try one by one to get as many values as possible
-        for calc_score in calc_scores:
-            try:
-                results.append(difficulty_calculator.calculate_scores([calc_score])[0])
-            except DifficultyCalculatorException as e:
-                error_reporter.report_error(e)
-                results.append(None)
+    results = calculate_scores_isolating_failures(calc_scores, difficulty_calculator)
 
     values = [
         [
             PerformanceValue(
-                calculation_id=performance_calculation.id,
+                calculation=performance_calculation,
                 name=name,
                 value=value,
             )
@@ -750,102 +1254,706 @@ def calculate_performance_values(
     return values
 
 
-def ingest_scores_from_stream() -> list[Score]:
+def calculate_scores_isolating_failures(
+    calc_scores: list[DifficultyCalculatorScore],
+    difficulty_calculator: AbstractDifficultyCalculator,
+) -> list[DifficultyCalculatorCalculation | None]:
+    """
+    Calculate scores using passed difficulty calculator, skipping known poison calculations.
+    Batches failing due to invalid inputs are bisected to isolate the failing scores, which are stored as poison calculations.
+    Other failures (eg. the calculator being unavailable) are raised without storing anything.
+    Returns calculations in the order of the passed scores, with None for poison calculations.
+    """
+    engine = difficulty_calculator.engine()
+    version = difficulty_calculator.version()
+
+    keys = [
+        get_calculation_key(engine, version, calc_score) for calc_score in calc_scores
+    ]
+    poison_keys = set(
+        PoisonCalculation.objects.filter(key__in=keys).values_list("key", flat=True)
+    )
+
+    calc_scores_to_calculate = [
+        calc_score
+        for key, calc_score in zip(keys, calc_scores)
+        if key not in poison_keys
+    ]
+    failures: list[tuple[DifficultyCalculatorScore, InvalidCalculationException]] = []
+    calculated_results = iter(
+        bisect_calculate_scores(
+            calc_scores_to_calculate, difficulty_calculator, failures
+        )
+    )
+
+    if len(failures) > 0:
+        PoisonCalculation.objects.bulk_create(
+            [
+                PoisonCalculation(
+                    key=get_calculation_key(engine, version, calc_score),
+                    beatmap_id=int(calc_score.beatmap_id),
+                    mods_json=calc_score.mods,
+                    calculator_engine=engine,
+                    calculator_version=version,
+                    error=str(e),
+                )
+                for calc_score, e in failures
+            ],
+            ignore_conflicts=True,
+        )
+
+        error_reporter = ErrorReporter()
+        for _, e in failures:
+            error_reporter.report_error(e)
+
+    return [None if key in poison_keys else next(calculated_results) for key in keys]
+
+
+def bisect_calculate_scores(
+    calc_scores: list[DifficultyCalculatorScore],
+    difficulty_calculator: AbstractDifficultyCalculator,
+    failures: list[tuple[DifficultyCalculatorScore, InvalidCalculationException]],
+) -> list[DifficultyCalculatorCalculation | None]:
+    """
+    Calculate scores using passed difficulty calculator, splitting batches failing due to invalid inputs in half until the failing scores are isolated.
+    Failing scores are appended to failures and returned as None.
+    """
+    if len(calc_scores) == 0:
+        return []
+
+    try:
+        return list(difficulty_calculator.calculate_scores(calc_scores))
+    except InvalidCalculationException as e:
+        if len(calc_scores) == 1:
+            failures.append((calc_scores[0], e))
+            return [None]
+
+        middle = len(calc_scores) // 2
+        return bisect_calculate_scores(
+            calc_scores[:middle], difficulty_calculator, failures
+        ) + bisect_calculate_scores(
+            calc_scores[middle:], difficulty_calculator, failures
+        )
+
+
+def spool_scores_from_stream() -> int:
     """
-    Poll for latest scores using the stored cursor, and update the cursor.
+    Append new pages of the /scores stream to the spool using the stored cursor, and update the cursor.
+    Only scores of currently tracked or known users are spooled.
+    At most OSU_SCORES_MAX_STREAM_PAGES pages are fetched per call, leaving any backlog for the next call.
+    Returns the number of pages spooled.
     """
     osu_api = OsuApi()
+    redis = get_redis_connection()
     cursor = cache.get(OSU_SCORES_CURSOR_CACHE_KEY)
 
-    streamed_scores = []
-    pages_fetched = 0
-    while True:
-        page = osu_api.get_recent_scores(cursor_string=cursor)
+    pages_spooled = 0
+    for _ in range(OSU_SCORES_MAX_STREAM_PAGES):
+        page = osu_api.get_recent_scores(
+            cursor_string=cursor, user_filter=filter_ingested_users
+        )
         if page.cursor_string is None:
             logger.warning(
                 "Failed to fetch new scores from the osu! /scores stream; keeping cursor"
             )
-            return []
-        streamed_scores.extend(page.scores)
-        pages_fetched += 1
-        cache.set(OSU_SCORES_CURSOR_CACHE_KEY, page.cursor_string)
-        if cursor is None or page.cursor_string == cursor or len(page.scores) < 1000:
             break
-        if pages_fetched >= OSU_SCORES_MAX_STREAM_PAGES:
-            logger.warning(
-                "Reached the %d page limit for the /scores stream; dropping backlog and resetting cursor",
-                OSU_SCORES_MAX_STREAM_PAGES,
+
+        if len(page.scores) > 0:
+            redis.xadd(
+                OSU_SCORES_SPOOL_KEY,
+                {"scores": json.dumps([score.as_json() for score in page.scores])},
             )
-            cache.delete(OSU_SCORES_CURSOR_CACHE_KEY)
-            return []
+            pages_spooled += 1
+
+        # Cursor is only advanced once the page is spooled, so a failure re-fetches it rather than losing it
+        cache.set(OSU_SCORES_CURSOR_CACHE_KEY, page.cursor_string, timeout=None)
+
+        if cursor is None or page.cursor_string == cursor or page.page_size < 1000:
+            break
         cursor = page.cursor_string
 
-    tracked_user_ids = get_tracked_user_ids()
+    return pages_spooled
+
+
+def read_spooled_scores(max_pages: int) -> tuple[list[ScoreData], str | None, int]:
+    """
+    Reads up to max_pages spooled pages after the stored checkpoint.
+    Returns the scores, the id of the last page read (None if there were none) and the number of pages read.
+    The pages are only consumed once checkpoint_spool is called with the returned id.
+    """
+    checkpoint = cache.get(OSU_SCORES_SPOOL_CHECKPOINT_CACHE_KEY)
+    entries = get_redis_connection().xrange(
+        OSU_SCORES_SPOOL_KEY,
+        min="-" if checkpoint is None else f"({checkpoint}",
+        max="+",
+        count=max_pages,
+    )
+    if len(entries) == 0:
+        return [], None, 0
+
+    streamed_scores = [
+        ScoreData.from_json(data, data["user_id"], Gamemode(data["gamemode"]))
+        for _, fields in entries
+        for data in json.loads(fields[b"scores"])
+    ]
+    return streamed_scores, entries[-1][0].decode(), len(entries)
+
+
+def checkpoint_spool(entry_id: str) -> None:
+    """
+    Marks spooled pages up to and including entry_id as consumed, trimming them from the spool.
+    """
+    cache.set(OSU_SCORES_SPOOL_CHECKPOINT_CACHE_KEY, entry_id, timeout=None)
+
+    # Consumed pages are no longer needed
+    redis = get_redis_connection()
+    redis.xtrim(OSU_SCORES_SPOOL_KEY, minid=entry_id)
+    redis.xdel(OSU_SCORES_SPOOL_KEY, entry_id)
+
+
+def update_spool_lag_metrics() -> None:
+    redis = get_redis_connection()
+
+    # Everything left in the spool is yet to be ingested
+    score_spool_lag_pages_gauge.set(redis.xlen(OSU_SCORES_SPOOL_KEY))
+    oldest_entries = redis.xrange(OSU_SCORES_SPOOL_KEY, count=1)
+    if len(oldest_entries) > 0:
+        oldest_entry_milliseconds = int(oldest_entries[0][0].decode().split("-")[0])
+        score_spool_lag_seconds_gauge.set(
+            datetime.now(tz=timezone.utc).timestamp() - oldest_entry_milliseconds / 1000
+        )
+    else:
+        score_spool_lag_seconds_gauge.set(0)
+
+
+def partition_streamed_scores(
+    streamed_scores: list[ScoreData], shard_count: int
+) -> dict[int, list[ScoreData]]:
+    """
+    Partitions streamed scores of tracked or known users into shards by user id,
+    so each user's scores are always ingested together.
+    """
+    ingested_users = filter_ingested_users(
+        {(score.gamemode.value, score.user_id) for score in streamed_scores}
+    )
+
+    shards: dict[int, list[ScoreData]] = {}
+    for score in streamed_scores:
+        if (score.gamemode.value, score.user_id) in ingested_users:
+            shards.setdefault(score.user_id % shard_count, []).append(score)
+
+    return shards
+
+
+def ingest_streamed_scores(streamed_scores: list[ScoreData]) -> list[Score]:
+    """
+    Adds and calculates the passed streamed scores of tracked or known users, returning the created scores.
+
+    Scores of all users are calculated together in one batch per calculator before opening any transactions,
+    so difficulty calculator requests scale with the number of calculators rather than users.
+    The shared difficulty calculations are then saved, before saving and recalculating each user in their own transaction
+    so a failure for one user doesn't lose the scores of the others.
+    """
+    # Users may have stopped being tracked since their scores were spooled
+    ingested_users = filter_ingested_users(
+        {(score.gamemode.value, score.user_id) for score in streamed_scores}
+    )
 
     scores_by_user: dict[tuple[int, Gamemode], list] = {}
     for score in streamed_scores:
-        if score.user_id in tracked_user_ids[score.gamemode.value]:
+        if (score.gamemode.value, score.user_id) in ingested_users:
             scores_by_user.setdefault((score.user_id, score.gamemode), []).append(score)
 
-    created_scores: list[Score] = []
-    for (user_id, gamemode), user_scores in scores_by_user.items():
+    if len(scores_by_user) == 0:
+        return []
+
+    # Build scores for each user
+    built_scores_by_user_stats_id: dict[int, tuple[UserStats, list[Score]]] = {}
+    for user_stats in UserStats.objects.filter(
+        user_id__in=set(user_id for user_id, _ in scores_by_user)
+    ):
+        user_scores = scores_by_user.get((user_stats.user_id, user_stats.gamemode))
+        if user_scores is None:
+            continue
+
         try:
-            with transaction.atomic():
-                user_stats = (
-                    UserStats.objects.select_for_update()
-                    .filter(user_id=user_id, gamemode=gamemode)
-                    .first()
+            scores = build_scores_from_data(user_stats, user_scores)
+        except Exception:
+            logger.exception(
+                "Failed to build %d streamed scores for user %s (gamemode %s)",
+                len(user_scores),
+                user_stats.user_id,
+                user_stats.gamemode,
+            )
+            continue
+
+        if len(scores) > 0:
+            built_scores_by_user_stats_id[user_stats.id] = (user_stats, scores)
+
+    if len(built_scores_by_user_stats_id) == 0:
+        return []
+
+    # Calculate scores of all users in one batch per calculator
+    prepared_calculations = []
+    for gamemode in Gamemode:
+        gamemode_scores = [
+            score
+            for user_stats, scores in built_scores_by_user_stats_id.values()
+            if user_stats.gamemode == gamemode
+            for score in scores
+        ]
+        if len(gamemode_scores) == 0:
+            continue
+
+        for difficulty_calculator_class in get_difficulty_calculators_for_gamemode(
+            gamemode
+        ):
+            with difficulty_calculator_class() as difficulty_calculator:
+                prepared_calculations.append(
+                    prepare_performance_calculations(
+                        gamemode_scores, difficulty_calculator
+                    )
                 )
-                if user_stats is None:
+
+    # Difficulty calculations are shared between users, so are saved first
+    with transaction.atomic():
+        for prepared in prepared_calculations:
+            save_calculations(
+                prepared._replace(performance_calculations=[], performance_values=[])
+            )
+
+    created_scores = []
+    for user_stats, scores in built_scores_by_user_stats_id.values():
+        try:
+            with transaction.atomic():
+                # Scores already added by a concurrent refresh are skipped by the insert, so no user lock is needed
+                user_created_scores = save_scores(scores)
+                if len(user_created_scores) == 0:
                     continue
 
-                new_scores = add_scores_from_data(user_stats, user_scores)
-
-                if len(new_scores) > 0:
-                    for (
-                        difficulty_calculator_class
-                    ) in get_difficulty_calculators_for_gamemode(gamemode):
-                        with difficulty_calculator_class() as difficulty_calculator:
-                            update_performance_calculations(
-                                new_scores, difficulty_calculator
-                            )
-                    user_stats.recalculate()
-                    user_stats.save()
+                for prepared in prepared_calculations:
+                    save_calculations(
+                        prepared.for_scores(user_created_scores)._replace(
+                            difficulty_calculations=[], difficulty_values=[]
+                        )
+                    )
+
+                # Recalculate with new scores added, only writing the recalculated fields
+                user_stats = UserStats.objects.get(id=user_stats.id)
+                user_stats.recalculate()
+                user_stats.save(update_fields=UserStats.RECALCULATED_FIELDS)
         except Exception:
             logger.exception(
-                "Failed to ingest %d streamed scores for user %s (gamemode %s)",
-                len(user_scores),
-                user_id,
-                gamemode.value,
+                "Failed to save %d streamed scores for user %s (gamemode %s)",
+                len(scores),
+                user_stats.user_id,
+                user_stats.gamemode,
             )
             continue
 
-        created_scores.extend(new_scores)
+        created_scores.extend(user_created_scores)
 
     return created_scores
 
 
-def get_tracked_user_ids() -> dict[int, set[int]]:
+def get_tracked_user_ids_key(gamemode: Gamemode) -> str:
+    return f"{TRACKED_USER_IDS_KEY_PREFIX}:{gamemode.value}"
+
+
+def query_tracked_user_ids(
+    user_ids: list[int] | None = None,
+) -> dict[int, set[int]]:
     """
-    Returns a mapping of gamemode value -> set of osu user ids whose streamed scores we want to ingest.
+    Returns a mapping of gamemode value -> set of osu user ids whose streamed scores we want to ingest,
+    optionally restricted to the passed user ids.
     """
     tracked_user_ids = {gamemode.value: set() for gamemode in Gamemode}
 
     now = datetime.now(tz=timezone.utc)
 
     # Players in active minigames, per the minigame's gamemode
-    active_minigames = Minigame.objects.exclude(status=MinigameStatus.FINISHED)
-    for gamemode, user_id in MinigamePlayer.objects.filter(
-        team__minigame__in=active_minigames
-    ).values_list("team__minigame__gamemode", "user_id"):
+    players = MinigamePlayer.objects.filter(
+        team__minigame__in=Minigame.objects.exclude(status=MinigameStatus.FINISHED)
+    )
+    if user_ids is not None:
+        players = players.filter(user_id__in=user_ids)
+    for gamemode, user_id in players.values_list("team__minigame__gamemode", "user_id"):
         tracked_user_ids[gamemode].add(user_id)
 
     # Attendees of active events
-    active_events = Event.objects.filter(start_date__lte=now, end_date__gte=now)
-    event_user_ids = set(active_events.values_list("attendees__id", flat=True))
-    event_user_ids.discard(None)
-    for user_id in event_user_ids:
+    attendees = EventAttendee.objects.filter(
+        event__start_date__lte=now + TRACKED_EVENT_MARGIN,
+        event__end_date__gte=now - TRACKED_EVENT_MARGIN,
+    )
+    if user_ids is not None:
+        attendees = attendees.filter(user_id__in=user_ids)
+    for user_id in set(attendees.values_list("user_id", flat=True)):
         for gamemode in tracked_user_ids:
             tracked_user_ids[gamemode].add(user_id)
 
     return tracked_user_ids
+
+
+def refresh_tracked_users(user_ids: list[int]) -> None:
+    """
+    Re-evaluates whether the passed users are tracked, adding them to or removing them from the tracked user sets.
+    Should be called once changes to minigame players, event attendees or minigame statuses are committed.
+    """
+    if len(user_ids) == 0:
+        return
+
+    tracked_user_ids = query_tracked_user_ids(user_ids)
+
+    pipeline = get_redis_connection().pipeline()
+    for gamemode in Gamemode:
+        key = get_tracked_user_ids_key(gamemode)
+        tracked = tracked_user_ids[gamemode.value]
+        untracked = set(user_ids) - tracked
+        if len(tracked) > 0:
+            pipeline.sadd(key, *tracked)
+        if len(untracked) > 0:
+            pipeline.srem(key, *untracked)
+    pipeline.execute()
+
+
+def reconcile_tracked_user_ids() -> None:
+    """
+    Rebuilds the tracked user sets from the database, catching events starting or ending and any missed updates.
+    """
+    tracked_user_ids = query_tracked_user_ids()
+
+    # Transactional pipeline so ingestion never sees a partially rebuilt set
+    pipeline = get_redis_connection().pipeline()
+    for gamemode in Gamemode:
+        key = get_tracked_user_ids_key(gamemode)
+        pipeline.delete(key)
+        if len(tracked_user_ids[gamemode.value]) > 0:
+            pipeline.sadd(key, *tracked_user_ids[gamemode.value])
+    pipeline.execute()
+
+
+def get_known_user_ids_key(gamemode: Gamemode) -> str:
+    return f"{KNOWN_USER_IDS_KEY_PREFIX}:{gamemode.value}"
+
+
+def get_known_user_ids_rebuild_key(gamemode: Gamemode) -> str:
+    return f"{get_known_user_ids_key(gamemode)}:rebuild"
+
+
+def add_known_user(user_id: int, gamemode: Gamemode) -> None:
+    """
+    Marks a user as known so their streamed scores are ingested.
+    """
+    get_redis_connection().eval(
+        ADD_KNOWN_USER_SCRIPT,
+        2,
+        get_known_user_ids_key(gamemode),
+        get_known_user_ids_rebuild_key(gamemode),
+        user_id,
+    )
+
+
+def rebuild_known_user_ids() -> None:
+    """
+    Rebuilds the known user bitmaps from UserStats, swapping each in once complete.
+    """
+    redis = get_redis_connection()
+    for gamemode in Gamemode:
+        key = get_known_user_ids_key(gamemode)
+        rebuild_key = get_known_user_ids_rebuild_key(gamemode)
+
+        # Create the rebuild bitmap before reading UserStats, so users added after the read started
+        #   are also set in it by add_known_user rather than lost when it's swapped in
+        redis.delete(rebuild_key)
+        redis.setbit(rebuild_key, 0, 0)
+
+        user_ids = (
+            UserStats.objects.filter(gamemode=gamemode)
+            .values_list("user_id", flat=True)
+            .iterator(chunk_size=KNOWN_USER_IDS_REBUILD_BATCH_SIZE)
+        )
+        for batch in itertools.batched(user_ids, KNOWN_USER_IDS_REBUILD_BATCH_SIZE):
+            pipeline = redis.pipeline(transaction=False)
+            for user_id in batch:
+                pipeline.setbit(rebuild_key, user_id, 1)
+            pipeline.execute()
+
+        redis.rename(rebuild_key, key)
+
+
+def filter_ingested_users(users: set[tuple[int, int]]) -> set[tuple[int, int]]:
+    """
+    Returns which of the passed (gamemode value, osu user id) pairs have their streamed scores ingested,
+    being either tracked or known users, in a single redis round trip.
+    """
+    user_ids_by_gamemode: dict[int, list[int]] = {}
+    for gamemode, user_id in users:
+        user_ids_by_gamemode.setdefault(gamemode, []).append(user_id)
+
+    pipeline = get_redis_connection().pipeline(transaction=False)
+    for gamemode, user_ids in user_ids_by_gamemode.items():
+        pipeline.smismember(get_tracked_user_ids_key(Gamemode(gamemode)), user_ids)
+        pipeline.bitfield_ro(
+            get_known_user_ids_key(Gamemode(gamemode)),
+            "u1",
+            user_ids[0],
+            items=[("u1", user_id) for user_id in user_ids[1:]],
+        )
+    results = pipeline.execute()
+
+    ingested_users = set()
+    for index, (gamemode, user_ids) in enumerate(user_ids_by_gamemode.items()):
+        is_tracked = results[index * 2]
+        is_known = results[index * 2 + 1]
+        for user_id, tracked, known in zip(user_ids, is_tracked, is_known):
+            if tracked or known:
+                ingested_users.add((gamemode, user_id))
+
+    return ingested_users
+
+
+def get_user_refresh_key(
+    prefix: str, kind: UserRefreshKind, user_id: int, gamemode: int
+) -> str:
+    return f"{prefix}:{kind.value}:{Gamemode(gamemode).value}:{user_id}"
+
+
+def claim_pending_user_refresh(
+    kind: UserRefreshKind,
+    user_id: int,
+    gamemode: int,
+    priority: int,
+    cooldown_seconds: float,
+) -> bool:
+    """
+    Marks a refresh of a user as queued, returning False if one at least as urgent and with at most the same cooldown is already queued.
+    """
+    # Checked and set in one script, so concurrent enqueues can't both claim the refresh
+    return bool(
+        get_redis_connection().eval(
+            CLAIM_PENDING_USER_REFRESH_SCRIPT,
+            1,
+            get_user_refresh_key(
+                USER_REFRESH_PENDING_KEY_PREFIX, kind, user_id, gamemode
+            ),
+            priority,
+            cooldown_seconds,
+            USER_REFRESH_PENDING_SECONDS,
+        )
+    )
+
+
+def clear_pending_user_refresh(
+    kind: UserRefreshKind, user_id: int, gamemode: int
+) -> None:
+    """
+    Clears the queued marker of a user refresh once its task starts, so later enqueues aren't deduplicated against it.
+    """
+    get_redis_connection().delete(
+        get_user_refresh_key(USER_REFRESH_PENDING_KEY_PREFIX, kind, user_id, gamemode)
+    )
+
+
+@contextmanager
+def user_refresh_single_flight(
+    kind: UserRefreshKind,
+    user_id: int,
+    gamemode: int,
+    cooldown_seconds: float,
+    wait: bool = False,
+) -> Iterator[bool]:
+    """
+    Context manager yielding True if the caller should run the refresh of a user.
+    Yields False instead if the same refresh is already in flight with at most the caller's cooldown,
+    as it will leave the user as up to date as the caller needs.
+    Pass wait to first wait (up to USER_REFRESH_MAX_WAIT_SECONDS) for that refresh to finish, for callers needing its result.
+    """
+    redis = get_redis_connection()
+    key = get_user_refresh_key(
+        USER_REFRESH_IN_FLIGHT_KEY_PREFIX, kind, user_id, gamemode
+    )
+    token = uuid.uuid4().hex
+
+    if not redis.set(
+        key,
+        json.dumps({"token": token, "cooldown_seconds": cooldown_seconds}),
+        nx=True,
+        ex=USER_REFRESH_IN_FLIGHT_SECONDS,
+    ):
+        in_flight = redis.get(key)
+        if in_flight is not None:
+            in_flight = json.loads(in_flight)
+            if in_flight["cooldown_seconds"] <= cooldown_seconds:
+                if wait:
+                    done_key = f"{USER_REFRESH_DONE_KEY_PREFIX}:{in_flight['token']}"
+                    if redis.blpop([done_key], timeout=USER_REFRESH_MAX_WAIT_SECONDS):
+                        # Pass the notification on to any other waiters
+                        redis.lpush(done_key, 1)
+                yield False
+                return
+
+        # The in-flight refresh has a longer cooldown (or just finished), so refresh alongside it
+        yield True
+        return
+
+    try:
+        yield True
+    finally:
+        # Only release our own marker, in case it expired and another refresh claimed it
+        in_flight = redis.get(key)
+        if in_flight is not None and json.loads(in_flight)["token"] == token:
+            redis.delete(key)
+
+        done_key = f"{USER_REFRESH_DONE_KEY_PREFIX}:{token}"
+        pipeline = redis.pipeline(transaction=False)
+        pipeline.lpush(done_key, 1)
+        pipeline.expire(done_key, USER_REFRESH_MAX_WAIT_SECONDS)
+        pipeline.execute()
+
+
+def get_score_impact_context_key(user_id: int, gamemode: Gamemode) -> str:
+    return f"{SCORE_IMPACT_CONTEXT_KEY_PREFIX}:{Gamemode(gamemode).value}:{user_id}"
+
+
+def get_score_impact_context(user_id: int, gamemode: Gamemode) -> ScoreImpactContext:
+    """
+    Returns the score impact context of a user, querying and caching it if the cached one is missing or invalidated
+    """
+    key = get_score_impact_context_key(user_id, gamemode)
+    # The generation is read before querying, so a context built from data older than an invalidation is never reused
+    cached = cache.get_many([SCORE_IMPACT_CONTEXT_GENERATION_KEY, key])
+    generation = cached.get(SCORE_IMPACT_CONTEXT_GENERATION_KEY, 0)
+    context = cached.get(key)
+    if context is not None and context.generation == generation:
+        return context
+
+    # Leaderboards deduplicating the whole score set only change on a new best per beatmap, but ones
+    # filtering on the scores themselves can have a new best which isnt the user's overall best
+    memberships = Membership.objects.select_related(
+        "leaderboard", "leaderboard__score_filter"
+    ).filter(
+        user_id=user_id,
+        leaderboard__gamemode=gamemode,
+        leaderboard__archived=False,
+    )
+    has_score_filtered_memberships = any(
+        not membership.leaderboard.allow_past_scores
+        or membership.leaderboard.primary_performance_value != "total"
+        or not membership.leaderboard.score_filter.filters_only_beatmaps()
+        for membership in memberships
+    )
+
+    # Races and minigames are kept from when their times are set until they finish, as
+    # they move through their statuses without invalidating contexts
+    pprace_windows = list(
+        PPRacePlayer.objects.filter(
+            user_id=user_id,
+            team__pprace__gamemode=gamemode,
+            team__pprace__start_time__isnull=False,
+            team__pprace__end_time__isnull=False,
+        )
+        .exclude(team__pprace__status=PPRaceStatus.FINISHED)
+        .values_list("team__pprace__start_time", "team__pprace__end_time")
+    )
+    minigame_windows = list(
+        MinigamePlayer.objects.filter(
+            user_id=user_id,
+            team__minigame__gamemode=gamemode,
+            team__minigame__start_time__isnull=False,
+            team__minigame__end_time__isnull=False,
+        )
+        .exclude(team__minigame__status=MinigameStatus.FINISHED)
+        .values_list("team__minigame__start_time", "team__minigame__end_time")
+    )
+    event_challenges = list(
+        BeatmapChallenge.objects.filter(
+            event__attendees__id=user_id,
+            event__end_date__gte=datetime.now(tz=timezone.utc),
+            gamemode=gamemode,
+        ).values_list("event__start_date", "event__end_date", "beatmap_id")
+    )
+
+    context = ScoreImpactContext(
+        generation=generation,
+        has_score_filtered_memberships=has_score_filtered_memberships,
+        pprace_windows=pprace_windows,
+        minigame_windows=minigame_windows,
+        event_challenges=event_challenges,
+    )
+    cache.set(key, context, timeout=SCORE_IMPACT_CONTEXT_SECONDS)
+    return context
+
+
+def invalidate_score_impact_contexts():
+    """
+    Invalidates the cached score impact contexts of all users, eg. after someone joins a leaderboard, pp race, minigame or event.
+    Should be called once the change is committed.
+    """
+    # generations never expire, so old generations can't come back into use
+    cache.add(SCORE_IMPACT_CONTEXT_GENERATION_KEY, 0, timeout=None)
+    cache.incr(SCORE_IMPACT_CONTEXT_GENERATION_KEY)
+
+
+def analyse_score_impact(user_stats: UserStats, scores: list[Score]) -> ScoreImpact:
+    """
+    Decides which downstream standings the passed newly created scores of a user can change, so updates for the rest can be skipped.
+    Errs on the side of reporting an impact when unsure.
+    Expects scores with their beatmaps attached, as built by build_scores_from_data.
+    """
+    if len(scores) == 0:
+        return ScoreImpact(
+            memberships=False, ppraces=False, minigames=False, event_challenges=False
+        )
+
+    context = get_score_impact_context(
+        user_stats.user_id, Gamemode(user_stats.gamemode)
+    )
+
+    # Every new best can change a membership, as membership pp weights all of the user's bests
+    memberships_impacted = (
+        context.has_score_filtered_memberships
+        or UserBeatmapBest.objects.filter(
+            score_id__in=[score.id for score in scores]
+        ).exists()
+    )
+
+    # Pp races containing a new ranked score
+    ranked_score_dates = [
+        score.date
+        for score in scores
+        if score.beatmap.status in [BeatmapStatus.RANKED, BeatmapStatus.APPROVED]
+    ]
+    ppraces_impacted = any(
+        start_time <= date <= end_time
+        for start_time, end_time in context.pprace_windows
+        for date in ranked_score_dates
+    )
+
+    # Minigames containing a new unmutated ranked or loved score
+    minigame_score_dates = [
+        score.date
+        for score in scores
+        if score.mutation == ScoreMutation.NONE
+        and score.beatmap.status
+        in [BeatmapStatus.RANKED, BeatmapStatus.APPROVED, BeatmapStatus.LOVED]
+    ]
+    minigames_impacted = any(
+        start_time <= date <= end_time
+        for start_time, end_time in context.minigame_windows
+        for date in minigame_score_dates
+    )
+
+    # Beatmap challenges of current events on the beatmaps of new scores
+    now = datetime.now(tz=timezone.utc)
+    score_beatmap_ids = set(score.beatmap_id for score in scores)
+    event_challenges_impacted = any(
+        start_date <= now <= end_date and beatmap_id in score_beatmap_ids
+        for start_date, end_date, beatmap_id in context.event_challenges
+    )
+
+    return ScoreImpact(
+        memberships=memberships_impacted,
+        ppraces=ppraces_impacted,
+        minigames=minigames_impacted,
+        event_challenges=event_challenges_impacted,
+    )
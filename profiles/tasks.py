@@ -1,27 +1,81 @@
 import logging
 import time
+import uuid
+from collections import defaultdict
 
 from celery import shared_task
+from django.core.cache import cache
+from prometheus_client import Counter, Histogram
 
 from common.osu.beatmap_provider import BeatmapProvider
+from common.osu.difficultycalculator import refresh_difficulty_calculator_info
 from common.osu.enums import BeatmapStatus, Gamemode
-from common.osu.osuapi import OsuApi
+from common.osu.osuapi import OsuApi, ScoreData
 from events.tasks import update_user_event_challenge_scores
 from leaderboards.enums import LeaderboardAccessType
 from leaderboards.models import Leaderboard
 from leaderboards.tasks import update_memberships
 from minigames.tasks import update_minigame_players_scores
 from ppraces.tasks import update_pprace_players
-from profiles.models import Beatmap, OsuUser, UserStats
+from profiles.enums import UserRefreshKind
+from profiles.models import Beatmap, OsuUser, Score, UserStats
 from profiles.services import (
-    ingest_scores_from_stream,
+    OSU_SCORES_MAX_SPOOL_INGEST_PAGES,
+    analyse_score_impact,
+    checkpoint_spool,
+    claim_pending_user_refresh,
+    clear_pending_user_refresh,
+    fetch_user,
+    ingest_streamed_scores,
+    partition_streamed_scores,
+    read_spooled_scores,
+    rebuild_known_user_ids,
+    reconcile_tracked_user_ids,
     refresh_beatmaps_from_api,
     refresh_user_from_api,
     refresh_user_recent_from_api,
+    spool_scores_from_stream,
+    update_spool_lag_metrics,
+    update_user_beatmap_bests,
+    user_refresh_single_flight,
 )
 
 logger = logging.getLogger(__name__)
 
+LOVED_BEATMAPS_BATCH_SIZE = 50
+
+# Streamed scores are ingested by OSU_SCORES_INGEST_SHARDS tasks partitioned by user id,
+# dispatched by a single fetcher holding the lease
+OSU_SCORES_INGEST_SHARDS = 8
+OSU_SCORES_INGEST_LEASE_CACHE_KEY = "osu_scores_ingest_lease"
+OSU_SCORES_INGEST_LEASE_SECONDS = 60
+OSU_SCORES_INGEST_SHARD_MAX_RETRIES = 10
+
+score_updates_dispatched_counter = Counter(
+    "profiles_score_updates_dispatched_total",
+    "Total number of downstream update tasks dispatched for new scores",
+    ["task"],
+)
+score_updates_skipped_counter = Counter(
+    "profiles_score_updates_skipped_total",
+    "Total number of downstream update tasks skipped as new scores could not change them",
+    ["task"],
+)
+score_ingest_stage_histogram = Histogram(
+    "profiles_score_ingest_stage_seconds",
+    "Time taken by each stage of streamed score ingestion",
+    ["stage"],
+)
+user_refreshes_deduplicated_counter = Counter(
+    "profiles_user_refreshes_deduplicated_total",
+    "Total number of user refresh tasks not enqueued as one was already queued for the user",
+    ["kind"],
+)
+score_ingest_overlapping_ticks_counter = Counter(
+    "profiles_score_ingest_overlapping_ticks_total",
+    "Total number of score ingestion ticks skipped as the previous tick still held the lease",
+)
+
 
 @shared_task(priority=9)
 def dispatch_update_all_global_leaderboard_top_members(
@@ -38,12 +92,10 @@ def dispatch_update_all_global_leaderboard_top_members(
             updates_to_run.add((member["user_id"], leaderboard.gamemode))
 
     for user_id, gamemode in updates_to_run:
-        update_user_recent.apply_async(
-            kwargs={
-                "user_id": user_id,
-                "gamemode": gamemode,
-                "cooldown_seconds": cooldown_seconds,
-            },
+        enqueue_update_user_recent(
+            user_id=user_id,
+            gamemode=gamemode,
+            cooldown_seconds=cooldown_seconds,
             priority=6,
         )
 
@@ -59,12 +111,8 @@ def dispatch_update_community_leaderboard_members(
     members = leaderboard.memberships.order_by("-pp")[:limit].values("user_id")
 
     for member in members:
-        update_user_recent.apply_async(
-            kwargs={
-                "user_id": member["user_id"],
-                "gamemode": leaderboard.gamemode,
-            },
-            priority=6,
+        enqueue_update_user_recent(
+            user_id=member["user_id"], gamemode=leaderboard.gamemode, priority=6
         )
 
 
@@ -75,20 +123,39 @@ def update_user(
     """
     Runs an update for a given user
     """
-    user_stats, updated = refresh_user_from_api(
-        user_id=user_id, gamemode=Gamemode(gamemode), cooldown_seconds=cooldown_seconds
-    )
-    if user_stats is not None and updated:
-        update_memberships.delay(
-            user_id=user_stats.user_id, gamemode=user_stats.gamemode
-        )
-        update_pprace_players.delay(
-            user_id=user_stats.user_id, gamemode=user_stats.gamemode
-        )
-        update_minigame_players_scores.delay(
-            user_id=user_stats.user_id, gamemode=user_stats.gamemode
+    # Only the queued task clears its marker, as callers running updates directly may have one queued behind them
+    clear_pending_user_refresh(UserRefreshKind.FULL, user_id, gamemode)
+    return run_update_user(user_id, gamemode, cooldown_seconds)
+
+
+def run_update_user(
+    user_id: int,
+    gamemode: int = Gamemode.STANDARD,
+    cooldown_seconds: int = 300,
+    wait_for_in_flight: bool = False,
+):
+    """
+    Runs an update for a given user in the calling process, eg. for views needing the result.
+    Pass wait_for_in_flight to wait for the result of a concurrent update rather than returning stale data.
+    """
+    with user_refresh_single_flight(
+        UserRefreshKind.FULL,
+        user_id,
+        gamemode,
+        cooldown_seconds,
+        wait=wait_for_in_flight,
+    ) as should_refresh:
+        if not should_refresh:
+            # A concurrent update just ran, so use its result
+            return fetch_user(user_id=user_id, gamemode=Gamemode(gamemode))
+
+        user_stats, created_scores = refresh_user_from_api(
+            user_id=user_id,
+            gamemode=Gamemode(gamemode),
+            cooldown_seconds=cooldown_seconds,
         )
-        update_user_event_challenge_scores.delay(user_id=user_stats.user_id)
+    if user_stats is not None:
+        dispatch_score_updates(user_stats, created_scores, update_event_challenges=True)
     return user_stats
 
 
@@ -97,20 +164,11 @@ def update_user_by_username(username: str, gamemode: int = Gamemode.STANDARD):
     """
     Runs an update for a given user
     """
-    user_stats, updated = refresh_user_from_api(
+    user_stats, created_scores = refresh_user_from_api(
         username=username, gamemode=Gamemode(gamemode)
     )
-    if user_stats is not None and updated:
-        update_memberships.delay(
-            user_id=user_stats.user_id, gamemode=user_stats.gamemode
-        )
-        update_pprace_players.delay(
-            user_id=user_stats.user_id, gamemode=user_stats.gamemode
-        )
-        update_minigame_players_scores.delay(
-            user_id=user_stats.user_id, gamemode=user_stats.gamemode
-        )
-        update_user_event_challenge_scores.delay(user_id=user_stats.user_id)
+    if user_stats is not None:
+        dispatch_score_updates(user_stats, created_scores, update_event_challenges=True)
     return user_stats
 
 
@@ -121,74 +179,304 @@ def update_user_recent(
     """
     Runs an update for a given user strictly for recent scores
     """
-    user_stats, updated = refresh_user_recent_from_api(
-        user_id=user_id, gamemode=Gamemode(gamemode), cooldown_seconds=cooldown_seconds
-    )
-    if user_stats is not None and updated:
-        update_memberships.delay(
-            user_id=user_stats.user_id, gamemode=user_stats.gamemode
-        )
-        update_pprace_players.delay(
-            user_id=user_stats.user_id, gamemode=user_stats.gamemode
-        )
-        update_minigame_players_scores.delay(
-            user_id=user_stats.user_id, gamemode=user_stats.gamemode
+    # Only the queued task clears its marker, as callers running updates directly may have one queued behind them
+    clear_pending_user_refresh(UserRefreshKind.RECENT, user_id, gamemode)
+    return run_update_user_recent(user_id, gamemode, cooldown_seconds)
+
+
+def run_update_user_recent(
+    user_id: int,
+    gamemode: int = Gamemode.STANDARD,
+    cooldown_seconds: int = 60,
+    wait_for_in_flight: bool = False,
+):
+    """
+    Runs an update for a given user strictly for recent scores in the calling process, eg. for views needing the result.
+    Pass wait_for_in_flight to wait for the result of a concurrent update rather than returning stale data.
+    """
+    with user_refresh_single_flight(
+        UserRefreshKind.RECENT,
+        user_id,
+        gamemode,
+        cooldown_seconds,
+        wait=wait_for_in_flight,
+    ) as should_refresh:
+        if not should_refresh:
+            # A concurrent update just ran and dispatched updates for any new scores
+            return fetch_user(user_id=user_id, gamemode=Gamemode(gamemode))
+
+        user_stats, created_scores = refresh_user_recent_from_api(
+            user_id=user_id,
+            gamemode=Gamemode(gamemode),
+            cooldown_seconds=cooldown_seconds,
         )
-        update_user_event_challenge_scores.delay(user_id=user_stats.user_id)
+    if user_stats is not None:
+        dispatch_score_updates(user_stats, created_scores, update_event_challenges=True)
     return user_stats
 
 
+def enqueue_update_user(
+    user_id: int,
+    gamemode: int = Gamemode.STANDARD,
+    cooldown_seconds: int = 300,
+    priority: int | None = None,
+) -> bool:
+    """
+    Enqueues update_user unless an at least as urgent one with at most the same cooldown is already queued for the user.
+    Returns whether a task was enqueued.
+    """
+    if priority is None:
+        priority = update_user.priority
+
+    if not claim_pending_user_refresh(
+        UserRefreshKind.FULL, user_id, gamemode, priority, cooldown_seconds
+    ):
+        user_refreshes_deduplicated_counter.labels(kind=UserRefreshKind.FULL).inc()
+        return False
+
+    update_user.apply_async(
+        kwargs={
+            "user_id": user_id,
+            "gamemode": gamemode,
+            "cooldown_seconds": cooldown_seconds,
+        },
+        priority=priority,
+    )
+    return True
+
+
+def enqueue_update_user_recent(
+    user_id: int,
+    gamemode: int = Gamemode.STANDARD,
+    cooldown_seconds: float = 60,
+    priority: int | None = None,
+) -> bool:
+    """
+    Enqueues update_user_recent unless an at least as urgent one with at most the same cooldown is already queued for the user.
+    Returns whether a task was enqueued.
+    """
+    if priority is None:
+        priority = update_user_recent.priority
+
+    if not claim_pending_user_refresh(
+        UserRefreshKind.RECENT, user_id, gamemode, priority, cooldown_seconds
+    ):
+        user_refreshes_deduplicated_counter.labels(kind=UserRefreshKind.RECENT).inc()
+        return False
+
+    update_user_recent.apply_async(
+        kwargs={
+            "user_id": user_id,
+            "gamemode": gamemode,
+            "cooldown_seconds": cooldown_seconds,
+        },
+        priority=priority,
+    )
+    return True
+
+
 @shared_task(priority=9)
 def update_loved_beatmaps():
     """
     Updates all loved beatmaps, cleaning up outdated data
     """
-    for beatmap in Beatmap.objects.filter(status=BeatmapStatus.LOVED):
+    loved_beatmap_ids = list(
+        Beatmap.objects.filter(status=BeatmapStatus.LOVED)
+        .order_by("id")
+        .values_list("id", flat=True)
+    )
+
+    # Refresh in batches matching the osu! api's bulk beatmaps lookup
+    for i in range(0, len(loved_beatmap_ids), LOVED_BEATMAPS_BATCH_SIZE):
         logger.info(f"Sleeping for 100ms")
         # Sleep for 100ms to avoid rate limiting
         time.sleep(0.1)
-        logger.info(f"Updating loved beatmap {beatmap.id}")
-        beatmap = Beatmap.objects.get(id=beatmap.id)
-        if beatmap.status != BeatmapStatus.LOVED:
-            logger.warning(f"Beatmap {beatmap.id} is not loved")
-            return None
-
-        try:
-            updated_beatmap = refresh_beatmaps_from_api([beatmap.id])[0]
-        except IndexError:
-            logger.info(
-                f"Beatmap {beatmap.id} appears to have been unloved. Deleting..."
-            )
-            beatmap.delete()
-            beatmap_provider = BeatmapProvider()
-            beatmap_provider.delete_beatmap(str(beatmap.id))
-            return None
 
-        outdated_scores = updated_beatmap.scores.filter(
-            date__lt=updated_beatmap.last_updated
-        )
-        if outdated_scores.count() > 0:
-            logger.info(
-                f"Deleting {outdated_scores.count()} outdated scores for beatmap {beatmap.id}"
+        beatmap_ids = loved_beatmap_ids[i : i + LOVED_BEATMAPS_BATCH_SIZE]
+        logger.info(f"Updating loved beatmaps {beatmap_ids}")
+
+        updated_beatmaps = refresh_beatmaps_from_api(beatmap_ids)
+
+        updated_beatmap_ids = set(beatmap.id for beatmap in updated_beatmaps)
+        for beatmap_id in beatmap_ids:
+            if beatmap_id not in updated_beatmap_ids:
+                logger.info(
+                    f"Beatmap {beatmap_id} appears to have been unloved. Deleting..."
+                )
+                Beatmap.objects.filter(id=beatmap_id).delete()
+                beatmap_provider = BeatmapProvider()
+                beatmap_provider.delete_beatmap(str(beatmap_id))
+
+        for updated_beatmap in updated_beatmaps:
+            outdated_scores = updated_beatmap.scores.filter(
+                date__lt=updated_beatmap.last_updated
             )
-            outdated_scores.delete()
+            if outdated_scores.count() > 0:
+                logger.info(
+                    f"Deleting {outdated_scores.count()} outdated scores for beatmap {updated_beatmap.id}"
+                )
+                user_stats_ids = set(
+                    outdated_scores.values_list("user_stats_id", flat=True)
+                )
+                outdated_scores.delete()
+                update_user_beatmap_bests(
+                    (user_stats_id, updated_beatmap.id)
+                    for user_stats_id in user_stats_ids
+                )
 
 
 @shared_task(priority=2)
 def ingest_recent_scores():
     """
-    Poll for latest scores for all gamemodes, storing those we care about.
+    Poll for latest scores for all gamemodes, dispatching those we care about to shard tasks by user.
+    Only one instance runs at a time, so overlapping ticks are skipped.
+    """
+    lease = uuid.uuid4().hex
+    if not cache.add(
+        OSU_SCORES_INGEST_LEASE_CACHE_KEY,
+        lease,
+        timeout=OSU_SCORES_INGEST_LEASE_SECONDS,
+    ):
+        score_ingest_overlapping_ticks_counter.inc()
+        logger.info("Previous score ingestion tick is still running; skipping")
+        return
+
+    try:
+        with score_ingest_stage_histogram.labels(stage="spool").time():
+            spool_scores_from_stream()
+
+        with score_ingest_stage_histogram.labels(stage="partition").time():
+            streamed_scores, last_entry_id, _ = read_spooled_scores(
+                OSU_SCORES_MAX_SPOOL_INGEST_PAGES
+            )
+            if last_entry_id is not None:
+                shards = partition_streamed_scores(
+                    streamed_scores, OSU_SCORES_INGEST_SHARDS
+                )
+                for shard_scores in shards.values():
+                    ingest_recent_scores_shard.delay(
+                        scores=[score.as_json() for score in shard_scores],
+                        enqueued_at=time.time(),
+                    )
+
+                # Pages are only consumed once their scores are handed to shard tasks,
+                #   which are acked late and retried so their scores survive failures
+                checkpoint_spool(last_entry_id)
+
+        update_spool_lag_metrics()
+    finally:
+        if cache.get(OSU_SCORES_INGEST_LEASE_CACHE_KEY) == lease:
+            cache.delete(OSU_SCORES_INGEST_LEASE_CACHE_KEY)
+
+
+@shared_task(
+    priority=2,
+    acks_late=True,
+    reject_on_worker_lost=True,
+    autoretry_for=(Exception,),
+    retry_backoff=True,
+    max_retries=OSU_SCORES_INGEST_SHARD_MAX_RETRIES,
+)
+def ingest_recent_scores_shard(scores: list[dict], enqueued_at: float):
+    """
+    Store a shard of streamed scores and dispatch updates for the users they belong to.
+    Redelivered if the worker is lost and retried on failure, as the scores are already consumed from the spool.
+    Ingestion skips scores that already exist, so retries are safe.
     """
-    created_scores = ingest_scores_from_stream()
+    score_ingest_stage_histogram.labels(stage="queued").observe(
+        time.time() - enqueued_at
+    )
+
+    with score_ingest_stage_histogram.labels(stage="ingest").time():
+        created_scores = ingest_streamed_scores(
+            [
+                ScoreData.from_json(data, data["user_id"], Gamemode(data["gamemode"]))
+                for data in scores
+            ]
+        )
+
     if len(created_scores) == 0:
         return
 
-    updated_users = set(
-        UserStats.objects.filter(
-            id__in=[score.user_stats_id for score in created_scores]
-        ).values_list("user_id", "gamemode")
+    created_scores_by_user_stats_id = defaultdict(list)
+    for score in created_scores:
+        created_scores_by_user_stats_id[score.user_stats_id].append(score)
+
+    updated_user_stats = UserStats.objects.filter(
+        id__in=created_scores_by_user_stats_id.keys()
     )
-    for user_id, gamemode in updated_users:
-        update_memberships.delay(user_id=user_id, gamemode=gamemode)
-        update_pprace_players.delay(user_id=user_id, gamemode=gamemode)
-        update_minigame_players_scores.delay(user_id=user_id, gamemode=gamemode)
+    for user_stats in updated_user_stats:
+        dispatch_score_updates(
+            user_stats,
+            created_scores_by_user_stats_id[user_stats.id],
+            update_event_challenges=True,
+        )
+
+
+@shared_task(priority=2)
+def reconcile_tracked_users():
+    """
+    Rebuild the sets of users whose streamed scores are ingested.
+    """
+    reconcile_tracked_user_ids()
+
+
+@shared_task(priority=7)
+def rebuild_known_users():
+    """
+    Rebuild the bitmaps of users with UserStats whose streamed scores are ingested.
+    """
+    rebuild_known_user_ids()
+
+
+def dispatch_score_updates(
+    user_stats: UserStats,
+    created_scores: list[Score],
+    update_event_challenges: bool = False,
+):
+    """
+    Dispatches the downstream updates which newly created scores of a user can change, skipping the rest
+    """
+    impact = analyse_score_impact(user_stats, created_scores)
+
+    if impact.memberships:
+        update_memberships.delay(
+            user_id=user_stats.user_id,
+            gamemode=user_stats.gamemode,
+            score_ids=[score.id for score in created_scores],
+        )
+    record_score_update("update_memberships", impact.memberships)
+
+    if impact.ppraces:
+        update_pprace_players.delay(
+            user_id=user_stats.user_id, gamemode=user_stats.gamemode
+        )
+    record_score_update("update_pprace_players", impact.ppraces)
+
+    if impact.minigames:
+        update_minigame_players_scores.delay(
+            user_id=user_stats.user_id, gamemode=user_stats.gamemode
+        )
+    record_score_update("update_minigame_players_scores", impact.minigames)
+
+    if update_event_challenges:
+        if impact.event_challenges:
+            update_user_event_challenge_scores.delay(user_id=user_stats.user_id)
+        record_score_update(
+            "update_user_event_challenge_scores", impact.event_challenges
+        )
+
+
+def record_score_update(task: str, dispatched: bool):
+    if dispatched:
+        score_updates_dispatched_counter.labels(task=task).inc()
+    else:
+        score_updates_skipped_counter.labels(task=task).inc()
+
+
+@shared_task(priority=1)
+def refresh_difficulty_calculators_info():
+    """
+    Refreshes the cached engine and version info of all difficulty calculators
+    """
+    refresh_difficulty_calculator_info()
@@ -1,28 +1,74 @@
 from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock, patch
 
 import pytest
 from django.core.cache import cache
+from django.db import transaction
+from django_redis import get_redis_connection
 
-from common.osu.difficultycalculator import get_default_difficulty_calculator_class
+from common.osu.difficultycalculator import (
+    Calculation,
+    CalculationException,
+    InvalidCalculationException,
+)
+from common.osu.difficultycalculator import Score as DifficultyCalculatorScore
+from common.osu.difficultycalculator import (
+    get_default_difficulty_calculator_class,
+    get_difficulty_calculators_for_gamemode,
+)
 from common.osu.enums import BitMods, Gamemode
+from common.osu.osuapi import OsuApi
 from events.models import Event
+from leaderboards.services import create_membership
+from profiles.enums import ScoreMutation, ScoreSet, UserRefreshKind
 from profiles.models import (
     DifficultyCalculation,
     OsuUser,
     PerformanceCalculation,
+    PoisonCalculation,
     Score,
+    UserBeatmapBest,
     UserStats,
 )
 from profiles.services import (
     OSU_SCORES_CURSOR_CACHE_KEY,
+    OSU_SCORES_SPOOL_CHECKPOINT_CACHE_KEY,
+    OSU_SCORES_SPOOL_KEY,
+    USER_REFRESH_IN_FLIGHT_KEY_PREFIX,
+    USER_REFRESH_PENDING_KEY_PREFIX,
+    ScoreImpact,
+    add_known_user,
+    analyse_score_impact,
+    build_scores_from_data,
     calculate_difficulty_values,
     calculate_performance_values,
+    calculate_scores_isolating_failures,
+    checkpoint_spool,
+    claim_pending_user_refresh,
+    clear_pending_user_refresh,
     fetch_scores,
     fetch_user,
-    ingest_scores_from_stream,
+    filter_ingested_users,
+    get_known_user_ids_key,
+    get_known_user_ids_rebuild_key,
+    get_score_impact_context,
+    get_tracked_user_ids_key,
+    get_user_refresh_key,
+    ingest_streamed_scores,
+    invalidate_score_impact_contexts,
+    lock_user_stats_version,
+    partition_streamed_scores,
+    prepare_performance_calculations,
+    read_spooled_scores,
+    rebuild_known_user_ids,
+    reconcile_tracked_user_ids,
+    refresh_tracked_users,
     refresh_user_from_api,
+    save_scores,
+    spool_scores_from_stream,
     update_difficulty_calculations,
     update_performance_calculations,
+    user_refresh_single_flight,
 )
 
 
@@ -38,7 +84,7 @@ class TestUserServices:
         assert fetch_user(username="TestOsuUser") == user_stats
 
     def test_refresh_user_not_exists(self):
-        assert refresh_user_from_api(user_id=123123) == (None, False)
+        assert refresh_user_from_api(user_id=123123) == (None, [])
 
     def test_refresh_user_from_api(self):
         user_stats, _ = refresh_user_from_api(user_id=5701575)
@@ -57,6 +103,24 @@ class TestUserServices:
         assert user_stats.score_style_od == 8.914664666393149
         assert user_stats.score_style_length == 154.71707503281988
 
+    def test_refresh_user_from_api_concurrent_first_refresh(self):
+        user_stats, _ = refresh_user_from_api(user_id=5701575)
+        # Simulate another first refresh having inserted the user after this one fetched
+        with patch("profiles.services.fetch_user", side_effect=[None, user_stats]):
+            assert refresh_user_from_api(user_id=5701575) == (user_stats, [])
+        assert UserStats.objects.filter(user_id=5701575).count() == 1
+
+    def test_lock_user_stats_version(self, user_stats):
+        with transaction.atomic():
+            assert lock_user_stats_version(user_stats) == True
+
+    def test_lock_user_stats_version_outdated(self, user_stats):
+        UserStats.objects.filter(id=user_stats.id).update(
+            last_updated=user_stats.last_updated + timedelta(minutes=1)
+        )
+        with transaction.atomic():
+            assert lock_user_stats_version(user_stats) == False
+
     def test_fetch_scores(self):
         user_stats, _ = refresh_user_from_api(user_id=5701575)
         scores = fetch_scores(user_stats.user_id, [362949], Gamemode.STANDARD)
@@ -76,6 +140,206 @@ class TestUserServices:
         assert user_stats.score_style_od == 8.940208492500652
         assert user_stats.score_style_length == 140.06347334630993
 
+    def test_fetch_scores_updates_user_beatmap_bests(self):
+        user_stats, _ = refresh_user_from_api(user_id=5701575)
+        fetch_scores(user_stats.user_id, [362949], Gamemode.STANDARD)
+        assert (
+            UserBeatmapBest.objects.filter(user_stats_id=user_stats.id).count()
+            == 4  # 2 score sets * 2 calculators
+        )
+        for score_set in [ScoreSet.NORMAL, ScoreSet.NEVER_CHOKE]:
+            scores = Score.objects.filter(user_stats_id=user_stats.id)
+            assert list(scores.get_beatmap_bests(Gamemode.STANDARD, score_set)) == list(
+                scores.get_score_set(Gamemode.STANDARD, score_set)
+            )
+
+    def test_build_scores_from_data_skips_duplicates(self, user_stats):
+        score_data_list = [
+            score._replace(user_id=user_stats.user_id)
+            for score in OsuApi().get_recent_scores().scores
+            if score.gamemode == Gamemode.STANDARD
+        ]
+        unique_scores = build_scores_from_data(user_stats, score_data_list)
+        duplicated_scores = build_scores_from_data(
+            user_stats, score_data_list + score_data_list
+        )
+        assert len(unique_scores) > 0
+        assert [(score.date, score.beatmap_id) for score in duplicated_scores] == [
+            (score.date, score.beatmap_id) for score in unique_scores
+        ]
+
+    def test_save_scores_skips_concurrently_added_scores(self, user_stats):
+        score_data_list = [
+            score._replace(user_id=user_stats.user_id)
+            for score in OsuApi().get_recent_scores().scores
+            if score.gamemode == Gamemode.STANDARD
+        ]
+        # Built before either is saved, as with a concurrent refresh and stream ingestion
+        scores = build_scores_from_data(user_stats, score_data_list)
+        concurrent_scores = build_scores_from_data(user_stats, score_data_list)
+
+        created_scores = save_scores(scores)
+        assert len(created_scores) == len(scores)
+        assert all(score.id is not None for score in created_scores)
+        assert all(
+            score.original_score_id is not None
+            for score in created_scores
+            if score.mutation != ScoreMutation.NONE
+        )
+
+        assert save_scores(concurrent_scores) == []
+        assert Score.objects.filter(user_stats=user_stats).count() == len(scores)
+
+    def test_save_scores_maps_same_second_scores_to_inserted_rows(self, user_stats):
+        score_data_list = [
+            score._replace(user_id=user_stats.user_id)
+            for score in OsuApi().get_recent_scores().scores
+            if score.gamemode == Gamemode.STANDARD
+        ]
+        first_score_data = score_data_list[0]
+        second_score_data = next(
+            score_data
+            for score_data in score_data_list
+            if score_data.beatmap_id != first_score_data.beatmap_id
+        )
+
+        # Plays on different beatmaps in the same second conflict on the unique constraint
+        date = datetime(2026, 1, 1, tzinfo=timezone.utc)
+        scores = build_scores_from_data(
+            user_stats,
+            [
+                first_score_data._replace(date=date),
+                second_score_data._replace(date=date),
+            ],
+        )
+        created_scores = save_scores(scores)
+
+        assert len([s for s in created_scores if s.mutation == ScoreMutation.NONE]) == 1
+        for score in created_scores:
+            assert Score.objects.get(id=score.id).beatmap_id == score.beatmap_id
+
+
+class TestUserRefreshSingleFlight:
+    @pytest.fixture(autouse=True)
+    def clear_user_refresh_state(self):
+        pending_keys = [
+            get_user_refresh_key(
+                USER_REFRESH_PENDING_KEY_PREFIX, kind, 5701575, Gamemode.STANDARD
+            )
+            for kind in UserRefreshKind
+        ]
+        in_flight_keys = [
+            get_user_refresh_key(
+                USER_REFRESH_IN_FLIGHT_KEY_PREFIX, kind, 5701575, Gamemode.STANDARD
+            )
+            for kind in UserRefreshKind
+        ]
+        get_redis_connection().delete(*pending_keys, *in_flight_keys)
+        yield
+        get_redis_connection().delete(*pending_keys, *in_flight_keys)
+
+    def test_claim_pending_user_refresh(self):
+        assert claim_pending_user_refresh(
+            UserRefreshKind.RECENT, 5701575, Gamemode.STANDARD, 6, 43200
+        )
+        assert not claim_pending_user_refresh(
+            UserRefreshKind.RECENT, 5701575, Gamemode.STANDARD, 6, 43200
+        )
+        # Other kinds of refresh are queued independently
+        assert claim_pending_user_refresh(
+            UserRefreshKind.FULL, 5701575, Gamemode.STANDARD, 6, 43200
+        )
+        # Refreshes with shorter cooldowns are still queued
+        assert claim_pending_user_refresh(
+            UserRefreshKind.RECENT, 5701575, Gamemode.STANDARD, 6, 60
+        )
+        assert not claim_pending_user_refresh(
+            UserRefreshKind.RECENT, 5701575, Gamemode.STANDARD, 6, 60
+        )
+        # More urgent refreshes are still queued
+        assert claim_pending_user_refresh(
+            UserRefreshKind.RECENT, 5701575, Gamemode.STANDARD, 1, 60
+        )
+        assert not claim_pending_user_refresh(
+            UserRefreshKind.RECENT, 5701575, Gamemode.STANDARD, 6, 43200
+        )
+
+        clear_pending_user_refresh(UserRefreshKind.RECENT, 5701575, Gamemode.STANDARD)
+        assert claim_pending_user_refresh(
+            UserRefreshKind.RECENT, 5701575, Gamemode.STANDARD, 6, 43200
+        )
+
+    def test_user_refresh_single_flight(self):
+        with user_refresh_single_flight(
+            UserRefreshKind.RECENT, 5701575, Gamemode.STANDARD, 60
+        ) as should_refresh:
+            assert should_refresh
+
+            # A concurrent caller with at least the same cooldown relies on the in-flight refresh
+            with user_refresh_single_flight(
+                UserRefreshKind.RECENT, 5701575, Gamemode.STANDARD, 300
+            ) as should_refresh:
+                assert not should_refresh
+
+            # A concurrent caller with a shorter cooldown runs its own refresh
+            with user_refresh_single_flight(
+                UserRefreshKind.RECENT, 5701575, Gamemode.STANDARD, 0
+            ) as should_refresh:
+                assert should_refresh
+
+            # Waiting gives up once the in-flight refresh takes too long
+            with patch("profiles.services.USER_REFRESH_MAX_WAIT_SECONDS", 0.1):
+                with user_refresh_single_flight(
+                    UserRefreshKind.RECENT, 5701575, Gamemode.STANDARD, 60, wait=True
+                ) as should_refresh:
+                    assert not should_refresh
+
+        with user_refresh_single_flight(
+            UserRefreshKind.RECENT, 5701575, Gamemode.STANDARD, 60
+        ) as should_refresh:
+            assert should_refresh
+
+
+@pytest.mark.django_db
+class TestScoreImpactServices:
+    @pytest.fixture(autouse=True)
+    def clear_score_impact_contexts(self):
+        invalidate_score_impact_contexts()
+
+    def test_analyse_score_impact_no_scores(self, stub_user_stats):
+        assert analyse_score_impact(stub_user_stats, []) == ScoreImpact(
+            memberships=False, ppraces=False, minigames=False, event_challenges=False
+        )
+
+    def test_analyse_score_impact_new_best(self, stub_user_stats):
+        scores = fetch_scores(stub_user_stats.user_id, [362949], Gamemode.STANDARD)
+        assert analyse_score_impact(stub_user_stats, scores) == ScoreImpact(
+            memberships=True, ppraces=False, minigames=False, event_challenges=False
+        )
+
+    def test_score_impact_context_cached(
+        self, user_stats, leaderboard, django_assert_num_queries
+    ):
+        context = get_score_impact_context(user_stats.user_id, Gamemode.STANDARD)
+        assert not context.has_score_filtered_memberships
+
+        with django_assert_num_queries(0):
+            assert (
+                get_score_impact_context(user_stats.user_id, Gamemode.STANDARD)
+                == context
+            )
+
+    def test_score_impact_context_invalidated_on_join(
+        self, user_stats, leaderboard, django_capture_on_commit_callbacks
+    ):
+        get_score_impact_context(user_stats.user_id, Gamemode.STANDARD)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            create_membership(leaderboard.id, user_stats.user_id)
+
+        context = get_score_impact_context(user_stats.user_id, Gamemode.STANDARD)
+        assert context.has_score_filtered_memberships
+
 
 @pytest.mark.django_db
 class TestDifficultyCalculationServices:
@@ -174,6 +438,9 @@ class TestDifficultyCalculationServices:
         assert performance_values[5].name == "total"
         assert performance_values[5].value == 764.5177081010385
 
+        score.refresh_from_db()
+        assert score.default_performance_total == 764.5177081010385
+
     @pytest.fixture
     def difficulty_calculation(self, beatmap):
         return DifficultyCalculation.objects.create(
@@ -183,6 +450,30 @@ class TestDifficultyCalculationServices:
             calculator_version="v1",
         )
 
+    def test_update_performance_calculations_up_to_date_difficulty(self, score):
+        with get_default_difficulty_calculator_class(
+            Gamemode.STANDARD
+        )() as difficulty_calculator:
+            difficulty_calculation = DifficultyCalculation.objects.create(
+                beatmap=score.beatmap,
+                mods=score.mods,
+                calculator_engine=difficulty_calculator.engine(),
+                calculator_version=difficulty_calculator.version(),
+            )
+            difficulty_calculation.difficulty_values.create(name="total", value=1.23)
+
+            update_performance_calculations([score], difficulty_calculator)
+
+        difficulty_values = difficulty_calculation.difficulty_values.all()
+        assert len(difficulty_values) == 1
+        assert difficulty_values[0].value == 1.23
+
+        performance_calculation = score.performance_calculations.get()
+        assert performance_calculation.difficulty_calculation_id == (
+            difficulty_calculation.id
+        )
+        assert performance_calculation.performance_values.count() > 0
+
     def test_calculate_difficulty_values(self, difficulty_calculation):
         with get_default_difficulty_calculator_class(
             Gamemode.STANDARD
@@ -234,12 +525,147 @@ class TestDifficultyCalculationServices:
         assert performance_values[0][5].name == "total"
         assert performance_values[0][5].value == 764.5177081010385
 
+    @pytest.fixture
+    def failing_difficulty_calculator(self):
+        def calculate_scores(calc_scores):
+            if any(calc_score.beatmap_id == "0" for calc_score in calc_scores):
+                raise InvalidCalculationException("bad beatmap")
+            return [
+                Calculation(
+                    difficulty_values={"total": float(calc_score.beatmap_id)},
+                    performance_values={},
+                )
+                for calc_score in calc_scores
+            ]
+
+        difficulty_calculator = Mock()
+        difficulty_calculator.engine.return_value = "testcalc"
+        difficulty_calculator.version.return_value = "v1"
+        difficulty_calculator.calculate_scores.side_effect = calculate_scores
+        return difficulty_calculator
+
+    @patch("profiles.services.ErrorReporter")
+    def test_calculate_scores_isolating_failures(
+        self, error_reporter_mock, failing_difficulty_calculator
+    ):
+        calc_scores = [
+            DifficultyCalculatorScore(str(beatmap_id)) for beatmap_id in range(8)
+        ]
+
+        results = calculate_scores_isolating_failures(
+            calc_scores, failing_difficulty_calculator
+        )
+
+        assert results[0] is None
+        assert [result.difficulty_values["total"] for result in results[1:]] == [
+            float(beatmap_id) for beatmap_id in range(1, 8)
+        ]
+        # 1 batch + 2 halves + 2 quarters + 2 singles
+        assert failing_difficulty_calculator.calculate_scores.call_count == 7
+        assert error_reporter_mock.return_value.report_error.call_count == 1
+
+        poison_calculation = PoisonCalculation.objects.get()
+        assert poison_calculation.beatmap_id == 0
+        assert poison_calculation.calculator_version == "v1"
+
+    def test_calculate_scores_isolating_failures_raises_transient_failures(
+        self, failing_difficulty_calculator
+    ):
+        failing_difficulty_calculator.calculate_scores.side_effect = (
+            CalculationException("calculator unavailable")
+        )
+        calc_scores = [DifficultyCalculatorScore("0"), DifficultyCalculatorScore("1")]
+
+        with pytest.raises(CalculationException):
+            calculate_scores_isolating_failures(
+                calc_scores, failing_difficulty_calculator
+            )
+
+        failing_difficulty_calculator.calculate_scores.assert_called_once()
+        assert not PoisonCalculation.objects.exists()
+
+    @patch("profiles.services.ErrorReporter")
+    def test_update_performance_calculations_keeps_failed_calculations(
+        self, error_reporter_mock, score
+    ):
+        difficulty_calculation = DifficultyCalculation.objects.create(
+            beatmap=score.beatmap,
+            mods=score.mods,
+            calculator_engine="osu.Game.Rulesets.Osu",
+            calculator_version="2007.906.0",
+        )
+        calculation = PerformanceCalculation.objects.create(
+            score=score,
+            difficulty_calculation=difficulty_calculation,
+            calculator_engine="osu.Game.Rulesets.Osu",
+            calculator_version="2007.906.0",
+        )
+        calculation.performance_values.create(name="total", value=500)
+
+        difficulty_calculator = Mock()
+        difficulty_calculator.engine.return_value = "osu.Game.Rulesets.Osu"
+        difficulty_calculator.version.return_value = "2026.702.1.0"
+        difficulty_calculator.calculate_scores.side_effect = (
+            InvalidCalculationException("bad beatmap")
+        )
+
+        update_performance_calculations([score], difficulty_calculator)
+
+        calculation = PerformanceCalculation.objects.get(score=score)
+        assert calculation.calculator_version == "2007.906.0"
+        assert calculation.performance_values.get().value == 500
+
+    @patch("profiles.services.ErrorReporter")
+    def test_calculate_scores_isolating_failures_skips_poison(
+        self, error_reporter_mock, failing_difficulty_calculator
+    ):
+        calc_scores = [DifficultyCalculatorScore("0"), DifficultyCalculatorScore("1")]
+        calculate_scores_isolating_failures(calc_scores, failing_difficulty_calculator)
+        failing_difficulty_calculator.calculate_scores.reset_mock()
+
+        results = calculate_scores_isolating_failures(
+            calc_scores, failing_difficulty_calculator
+        )
+
+        assert results[0] is None
+        assert results[1].difficulty_values["total"] == 1.0
+        failing_difficulty_calculator.calculate_scores.assert_called_once_with(
+            [calc_scores[1]]
+        )
+
+        # poison calculations are retried once the calculator version changes
+        failing_difficulty_calculator.version.return_value = "v2"
+        failing_difficulty_calculator.calculate_scores.reset_mock()
+        calculate_scores_isolating_failures(calc_scores, failing_difficulty_calculator)
+        assert failing_difficulty_calculator.calculate_scores.call_count == 3
+
 
 @pytest.mark.django_db
 class TestIngestScoresFromStream:
-    def test_stream_populates_db_and_updates_user_stats(self):
-        cache.delete(OSU_SCORES_CURSOR_CACHE_KEY)
+    @pytest.fixture(autouse=True)
+    def clear_stream_state(self):
+        cache.delete_many(
+            [OSU_SCORES_CURSOR_CACHE_KEY, OSU_SCORES_SPOOL_CHECKPOINT_CACHE_KEY]
+        )
+        get_redis_connection().delete(
+            OSU_SCORES_SPOOL_KEY,
+            *[get_tracked_user_ids_key(gamemode) for gamemode in Gamemode],
+            *[get_known_user_ids_key(gamemode) for gamemode in Gamemode],
+            *[get_known_user_ids_rebuild_key(gamemode) for gamemode in Gamemode],
+        )
+        yield
+        cache.delete_many(
+            [OSU_SCORES_CURSOR_CACHE_KEY, OSU_SCORES_SPOOL_CHECKPOINT_CACHE_KEY]
+        )
+        get_redis_connection().delete(
+            OSU_SCORES_SPOOL_KEY,
+            *[get_tracked_user_ids_key(gamemode) for gamemode in Gamemode],
+            *[get_known_user_ids_key(gamemode) for gamemode in Gamemode],
+            *[get_known_user_ids_rebuild_key(gamemode) for gamemode in Gamemode],
+        )
 
+    @pytest.fixture
+    def tracked_osu_user(self):
         osu_user = OsuUser.objects.create(
             id=5701575,
             username="Syrin",
@@ -247,29 +673,6 @@ class TestIngestScoresFromStream:
             join_date=datetime(2017, 1, 1, tzinfo=timezone.utc),
             disabled=False,
         )
-        user_stats = UserStats.objects.create(
-            user=osu_user,
-            gamemode=Gamemode.STANDARD,
-            playcount=0,
-            playtime=0,
-            level=0,
-            ranked_score=0,
-            total_score=0,
-            rank=0,
-            country_rank=0,
-            pp=0,
-            accuracy=0,
-            count_300=0,
-            count_100=0,
-            count_50=0,
-            count_rank_ss=0,
-            count_rank_ssh=0,
-            count_rank_s=0,
-            count_rank_sh=0,
-            count_rank_a=0,
-            last_updated=datetime.now(tz=timezone.utc),
-        )
-
         now = datetime.now(tz=timezone.utc)
         event = Event.objects.create(
             slug="test-event",
@@ -279,15 +682,139 @@ class TestIngestScoresFromStream:
             creation_time=now,
         )
         event.attendees.add(osu_user)
+        reconcile_tracked_user_ids()
+        return osu_user
+
+    def test_tracked_users_are_reconciled_and_refreshed(self, tracked_osu_user):
+        redis = get_redis_connection()
+        assert redis.smismember(
+            get_tracked_user_ids_key(Gamemode.STANDARD), [tracked_osu_user.id, 1]
+        ) == [True, False]
+
+        tracked_osu_user.event_attendees.all().delete()
+        refresh_tracked_users([tracked_osu_user.id])
+        assert not redis.sismember(
+            get_tracked_user_ids_key(Gamemode.MANIA), tracked_osu_user.id
+        )
 
-        ingest_scores_from_stream()
+    def test_known_users_are_ingested(self, django_capture_on_commit_callbacks):
+        known_user = (Gamemode.STANDARD.value, 5701575)
+        assert filter_ingested_users({known_user}) == set()
+
+        with django_capture_on_commit_callbacks(execute=True):
+            refresh_user_from_api(user_id=5701575)
+        assert filter_ingested_users({known_user, (Gamemode.STANDARD.value, 1)}) == {
+            known_user
+        }
+
+        get_redis_connection().delete(get_known_user_ids_key(Gamemode.STANDARD))
+        rebuild_known_user_ids()
+        assert filter_ingested_users({known_user}) == {known_user}
+        assert spool_scores_from_stream() == 1
+
+    def test_known_users_added_during_rebuild_are_kept(self):
+        # User becomes known after the rebuild has started reading UserStats
+        def filter_then_add_known_user(*args, **kwargs):
+            add_known_user(2, Gamemode.STANDARD)
+            return UserStats.objects.all().filter(*args, **kwargs)
+
+        with patch.object(
+            UserStats.objects, "filter", side_effect=filter_then_add_known_user
+        ):
+            rebuild_known_user_ids()
+
+        assert filter_ingested_users({(Gamemode.STANDARD.value, 2)}) == {
+            (Gamemode.STANDARD.value, 2)
+        }
+
+    def test_spool_skips_untracked_users(self):
+        assert spool_scores_from_stream() == 0
+        assert get_redis_connection().xlen(OSU_SCORES_SPOOL_KEY) == 0
+        assert cache.get(OSU_SCORES_CURSOR_CACHE_KEY) == "complete"
+
+    def test_spooled_scores_are_partitioned_by_user(self, tracked_osu_user):
+        spool_scores_from_stream()
+        streamed_scores, last_entry_id, page_count = read_spooled_scores(10)
+        assert page_count == 1
+        assert last_entry_id is not None
+
+        shards = partition_streamed_scores(streamed_scores, 8)
+        assert list(shards) == [tracked_osu_user.id % 8]
+        assert len(shards[tracked_osu_user.id % 8]) == len(streamed_scores)
+
+        # Pages are not consumed until checkpointed
+        assert read_spooled_scores(10)[1] == last_entry_id
+        checkpoint_spool(last_entry_id)
+        assert read_spooled_scores(10) == ([], None, 0)
 
-        user_stats.refresh_from_db()
-        assert Score.objects.filter(user_stats=user_stats).count() > 0
+    @pytest.fixture
+    def second_user_stats(self, user_stats):
+        second_user_stats = UserStats.objects.get(id=user_stats.id)
+        second_user_stats.id = None
+        second_user_stats.user = OsuUser.objects.create(
+            id=2,
+            username="SecondOsuUser",
+            country="au",
+            join_date=datetime(2023, 1, 1, tzinfo=timezone.utc),
+            disabled=False,
+        )
+        second_user_stats.save()
+        rebuild_known_user_ids()
+        return second_user_stats
+
+    @pytest.fixture
+    def streamed_scores(self, user_stats, second_user_stats):
+        standard_scores = [
+            score
+            for score in OsuApi().get_recent_scores().scores
+            if score.gamemode == Gamemode.STANDARD
+        ]
+        return [
+            score._replace(user_id=user_stats.user_id) for score in standard_scores
+        ] + [
+            score._replace(user_id=second_user_stats.user_id)
+            for score in standard_scores
+        ]
+
+    def test_streamed_scores_are_calculated_together(
+        self, user_stats, second_user_stats, streamed_scores
+    ):
+        with patch(
+            "profiles.services.prepare_performance_calculations",
+            wraps=prepare_performance_calculations,
+        ) as prepare_performance_calculations_mock:
+            created_scores = ingest_streamed_scores(streamed_scores)
+
+        # One batch per calculator regardless of the number of users
+        assert prepare_performance_calculations_mock.call_count == len(
+            get_difficulty_calculators_for_gamemode(Gamemode.STANDARD)
+        )
+        assert {score.user_stats_id for score in created_scores} == {
+            user_stats.id,
+            second_user_stats.id,
+        }
+        assert PerformanceCalculation.objects.filter(
+            score__user_stats=second_user_stats
+        ).exists()
+        second_user_stats.refresh_from_db()
+        assert second_user_stats.score_style_accuracy != 0
+
+    def test_streamed_scores_failing_to_save_dont_affect_other_users(
+        self, user_stats, second_user_stats, streamed_scores
+    ):
+        def save_scores_failing_for_second_user(scores):
+            if scores[0].user_stats_id == second_user_stats.id:
+                raise Exception("failed to save scores")
+            return save_scores(scores)
+
+        with patch(
+            "profiles.services.save_scores",
+            side_effect=save_scores_failing_for_second_user,
+        ):
+            created_scores = ingest_streamed_scores(streamed_scores)
+
+        assert {score.user_stats_id for score in created_scores} == {user_stats.id}
         assert PerformanceCalculation.objects.filter(
             score__user_stats=user_stats
         ).exists()
-        assert user_stats.score_style_accuracy != 0
-        assert user_stats.score_style_bpm != 0
-
-        cache.delete(OSU_SCORES_CURSOR_CACHE_KEY)
+        assert not Score.objects.filter(user_stats=second_user_stats).exists()
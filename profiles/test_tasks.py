@@ -0,0 +1,163 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import pytest
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+from common.osu.enums import Gamemode
+from events.models import Event
+from profiles.enums import UserRefreshKind
+from profiles.models import OsuUser, PerformanceCalculation, Score, UserStats
+from profiles.services import (
+    OSU_SCORES_CURSOR_CACHE_KEY,
+    OSU_SCORES_SPOOL_CHECKPOINT_CACHE_KEY,
+    OSU_SCORES_SPOOL_KEY,
+    USER_REFRESH_IN_FLIGHT_KEY_PREFIX,
+    USER_REFRESH_PENDING_KEY_PREFIX,
+    claim_pending_user_refresh,
+    get_known_user_ids_key,
+    get_tracked_user_ids_key,
+    get_user_refresh_key,
+    reconcile_tracked_user_ids,
+)
+from profiles.tasks import (
+    OSU_SCORES_INGEST_LEASE_CACHE_KEY,
+    ingest_recent_scores,
+    ingest_recent_scores_shard,
+    run_update_user,
+    update_user,
+)
+
+
+class TestUpdateUser:
+    @pytest.fixture(autouse=True)
+    def clear_user_refresh_state(self):
+        keys = [
+            get_user_refresh_key(
+                prefix, UserRefreshKind.FULL, 5701575, Gamemode.STANDARD
+            )
+            for prefix in [
+                USER_REFRESH_PENDING_KEY_PREFIX,
+                USER_REFRESH_IN_FLIGHT_KEY_PREFIX,
+            ]
+        ]
+        get_redis_connection().delete(*keys)
+        yield
+        get_redis_connection().delete(*keys)
+
+    @patch("profiles.tasks.refresh_user_from_api", return_value=(None, []))
+    def test_only_the_task_clears_its_queued_marker(self, refresh_user_from_api_mock):
+        assert claim_pending_user_refresh(
+            UserRefreshKind.FULL, 5701575, Gamemode.STANDARD, 3, 300
+        )
+
+        # Running an update directly leaves the queued task to run
+        run_update_user(5701575, Gamemode.STANDARD, wait_for_in_flight=True)
+        assert not claim_pending_user_refresh(
+            UserRefreshKind.FULL, 5701575, Gamemode.STANDARD, 3, 300
+        )
+
+        update_user(5701575, Gamemode.STANDARD)
+        assert claim_pending_user_refresh(
+            UserRefreshKind.FULL, 5701575, Gamemode.STANDARD, 3, 300
+        )
+        assert refresh_user_from_api_mock.call_count == 2
+
+
+@pytest.mark.django_db
+class TestIngestRecentScores:
+    @pytest.fixture(autouse=True)
+    def clear_stream_state(self):
+        stream_cache_keys = [
+            OSU_SCORES_CURSOR_CACHE_KEY,
+            OSU_SCORES_SPOOL_CHECKPOINT_CACHE_KEY,
+            OSU_SCORES_INGEST_LEASE_CACHE_KEY,
+        ]
+        stream_redis_keys = [
+            OSU_SCORES_SPOOL_KEY,
+            *[get_tracked_user_ids_key(gamemode) for gamemode in Gamemode],
+            *[get_known_user_ids_key(gamemode) for gamemode in Gamemode],
+        ]
+        cache.delete_many(stream_cache_keys)
+        get_redis_connection().delete(*stream_redis_keys)
+        yield
+        cache.delete_many(stream_cache_keys)
+        get_redis_connection().delete(*stream_redis_keys)
+
+    @pytest.fixture
+    def tracked_osu_user(self):
+        osu_user = OsuUser.objects.create(
+            id=5701575,
+            username="Syrin",
+            country="au",
+            join_date=datetime(2017, 1, 1, tzinfo=timezone.utc),
+            disabled=False,
+        )
+        now = datetime.now(tz=timezone.utc)
+        event = Event.objects.create(
+            slug="test-event",
+            name="Test Event",
+            start_date=now - timedelta(days=1),
+            end_date=now + timedelta(days=1),
+            creation_time=now,
+        )
+        event.attendees.add(osu_user)
+        reconcile_tracked_user_ids()
+        return osu_user
+
+    @patch("profiles.tasks.ingest_recent_scores_shard.delay")
+    def test_spool_is_drained_and_checkpointed(
+        self, ingest_recent_scores_shard_delay_mock, tracked_osu_user
+    ):
+        ingest_recent_scores()
+
+        assert get_redis_connection().xlen(OSU_SCORES_SPOOL_KEY) == 0
+        assert cache.get(OSU_SCORES_SPOOL_CHECKPOINT_CACHE_KEY) is not None
+        ingest_recent_scores_shard_delay_mock.assert_called_once()
+        shard_scores = ingest_recent_scores_shard_delay_mock.call_args.kwargs["scores"]
+        assert {score["user_id"] for score in shard_scores} == {tracked_osu_user.id}
+
+    @patch("profiles.tasks.dispatch_score_updates")
+    def test_stream_populates_db_and_updates_user_stats(
+        self, dispatch_score_updates_mock, tracked_osu_user
+    ):
+        user_stats = UserStats.objects.create(
+            user=tracked_osu_user,
+            gamemode=Gamemode.STANDARD,
+            playcount=0,
+            playtime=0,
+            level=0,
+            ranked_score=0,
+            total_score=0,
+            rank=0,
+            country_rank=0,
+            pp=0,
+            accuracy=0,
+            count_300=0,
+            count_100=0,
+            count_50=0,
+            count_rank_ss=0,
+            count_rank_ssh=0,
+            count_rank_s=0,
+            count_rank_sh=0,
+            count_rank_a=0,
+            last_updated=datetime.now(tz=timezone.utc),
+        )
+
+        # Run shard tasks in place of queueing them
+        with patch(
+            "profiles.tasks.ingest_recent_scores_shard.delay",
+            side_effect=lambda **kwargs: ingest_recent_scores_shard(**kwargs),
+        ):
+            ingest_recent_scores()
+
+        user_stats.refresh_from_db()
+        assert Score.objects.filter(user_stats=user_stats).count() > 0
+        assert PerformanceCalculation.objects.filter(
+            score__user_stats=user_stats
+        ).exists()
+        assert user_stats.score_style_accuracy != 0
+        assert user_stats.score_style_bpm != 0
+        dispatch_score_updates_mock.assert_called_once()
+        assert dispatch_score_updates_mock.call_args.args[0] == user_stats
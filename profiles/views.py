@@ -18,7 +18,11 @@ from profiles.serialisers import (
     UserStatsSerialiser,
 )
 from profiles.services import fetch_scores, fetch_user, store_beatmap
-from profiles.tasks import update_user, update_user_by_username
+from profiles.tasks import (
+    enqueue_update_user,
+    run_update_user,
+    update_user_by_username,
+)
 
 
 class UserStatsDetail(APIView):
@@ -38,8 +42,10 @@ class UserStatsDetail(APIView):
             if user_id_type == "id":
                 user_stats = fetch_user(user_id=int(user_string), gamemode=gamemode)
                 if user_stats is None:
-                    user_stats = update_user(
-                        user_id=int(user_string), gamemode=gamemode
+                    user_stats = run_update_user(
+                        user_id=int(user_string),
+                        gamemode=gamemode,
+                        wait_for_in_flight=True,
                     )
             elif user_id_type == "username":
                 user_stats = fetch_user(username=user_string, gamemode=gamemode)
@@ -53,7 +59,7 @@ class UserStatsDetail(APIView):
             if user_stats is None:
                 raise NotFound("User not found.")
 
-            update_user.delay(user_stats.user_id, gamemode)
+            enqueue_update_user(user_stats.user_id, gamemode)
 
             # Show not found for disabled (restricted) users
             if user_stats.user.disabled:
@@ -170,11 +176,16 @@ class UserScoreList(APIView):
             .non_restricted()
             .filter(user_stats__user_id=user_id, user_stats__gamemode=gamemode)
             .apply_score_filter(score_filter)
-            .get_score_set(gamemode, score_set)
-            .prefetch_related(
-                "performance_calculations__performance_values",
-                "performance_calculations__difficulty_calculation__difficulty_values",
-            )
+        )
+
+        if score_filter.filters_only_beatmaps():
+            scores = scores.get_beatmap_bests(gamemode, score_set)
+        else:
+            scores = scores.get_score_set(gamemode, score_set)
+
+        scores = scores.prefetch_related(
+            "performance_calculations__performance_values",
+            "performance_calculations__difficulty_calculation__difficulty_values",
         )
 
         serialiser = UserScoreSerialiser(scores[:100], many=True)
@@ -12,7 +12,7 @@ from osuauth.serialisers import UserSerialiser
 from profiles.enums import AllowedBeatmapStatus
 from profiles.models import ScoreFilter
 from profiles.services import fetch_user
-from profiles.tasks import update_user
+from profiles.tasks import enqueue_update_user
 from users.models import ScoreFilterPreset
 from users.serialisers import ScoreFilterPresetSerialiser
 
@@ -34,7 +34,7 @@ class Me(APIView):
         if user.osu_user is not None:
             # TODO: specify gamemode based on user preferences
             if fetch_user(user.osu_user_id) is not None:
-                update_user.delay(user.osu_user_id)
+                enqueue_update_user(user.osu_user_id)
 
         serialiser = UserSerialiser(user)
         return Response(serialiser.data)